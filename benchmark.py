@@ -0,0 +1,546 @@
+# Замеры производительности RealEstateApp на синтетической базе.
+#
+#   python benchmark.py                       - 1 000, 10 000 и 100 000 объектов, сравнение с базовой линией
+#   python benchmark.py --sizes 1000 10000    - только выбранные размеры
+#   python benchmark.py --save-baseline       - записать результаты как новую базовую линию
+#   python benchmark.py --require-baseline    - без файла базовой линии завершиться с кодом 1 (для CI)
+#   python benchmark.py --display             - настоящий Tk (нужен дисплей, например xvfb-run)
+#
+# По умолчанию виджеты tkinter заменяются заглушками, поэтому дисплей не нужен.
+# Если операция стала медленнее базовой линии больше чем на --tolerance, скрипт завершается с кодом 1.
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import date, timedelta
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baseline.json"
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Допустимое замедление относительно базовой линии и порог шума в секундах:
+# операции быстрее MIN_REGRESSION_SECONDS не считаются регрессией
+DEFAULT_TOLERANCE = 0.5
+MIN_REGRESSION_SECONDS = 0.05
+
+# Сколько объектов добавлять и удалять за замер
+ADD_REPEATS = 20
+DELETE_COUNT = 100
+
+OPERATIONS = ["load_data_cold", "load_data", "update_table", "sort_table", "save_data",
+              "add_property", "delete_property", "export_to_excel"]
+
+# Операции, которые не меняют базу: повторяются --repeats раз, в зачет идет лучшее время
+REPEATABLE = {"load_data_cold", "load_data", "update_table", "sort_table", "save_data", "export_to_excel"}
+DEFAULT_REPEATS = 3
+
+
+# --- Генератор объектов -------------------------------------------------------
+
+CITIES = ["Москва", "Подольск", "Химки", "Мытищи", "Балашиха", "Люберцы", "Одинцово", "Королев"]
+STREETS = [
+    "ул. Ленина", "ул. Мира", "ул. Советская", "ул. Гагарина", "пр-т Победы", "ул. Садовая",
+    "ул. Молодежная", "ул. Школьная", "ул. Центральная", "пер. Почтовый", "ш. Энтузиастов",
+    "ул. Октябрьская", "ул. Лесная", "б-р Строителей", "ул. Заречная", "ул. Первомайская",
+]
+OBJECTS = ["комната", "1-ккв", "2-ккв", "3-ккв", "4-ккв", "дача", "дом", "участок"]
+OBJECT_WEIGHTS = [5, 25, 25, 15, 5, 10, 10, 5]
+BATHROOMS = ["раздельный", "совмещенный"]
+HOUSES = ["нет", "монолит", "панельный", "кирпичный", "бревно", "каркасный"]
+DEALS = ["прямая продажа", "альтернатива"]
+OWNERSHIP = ["ДКП", "ДДУ", "Наследство", "Дарение", "Приватизация"]
+SURNAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков"]
+NAMES = ["Александр", "Сергей", "Елена", "Ольга", "Дмитрий", "Наталья", "Андрей", "Татьяна", "Игорь"]
+PATRONYMICS = ["Иванович", "Петрович", "Сергеевна", "Алексеевна", "Николаевич", "Викторовна"]
+NOTE_PHRASES = [
+    "Собственник адекватный, торг уместен.", "Ключи у соседки.", "Показы только по выходным.",
+    "Требуется косметический ремонт.", "Рядом школа и детский сад.", "Документы готовы к сделке.",
+    "Обременений нет.", "Возможна ипотека.", "Окна во двор, тихо.", "Есть кладовая и парковочное место.",
+]
+
+
+def generate_listings(count, seed=2024):
+    # Детерминированный набор объектов со всеми 22 полями: один seed - одна и та же база
+    rng = random.Random(seed)
+    today = date(2026, 1, 1)
+    rows = []
+    for _ in range(count):
+        kind = rng.choices(OBJECTS, OBJECT_WEIGHTS)[0]
+        is_flat = kind not in ("дача", "дом", "участок")
+        room_count = {"комната": 1, "1-ккв": 1, "2-ккв": 2, "3-ккв": 3, "4-ккв": 4}.get(kind, rng.randint(0, 5))
+        rooms = [rng.randint(8, 25) for _ in range(room_count)]
+        kitchen = rng.randint(5, 15)
+        area = sum(rooms) + kitchen + rng.randint(3, 20) if kind != "участок" else 0
+        floors = rng.randint(1, 25) if is_flat else rng.randint(1, 3)
+        house = rng.randint(1, 120)
+        rows.append({
+            "Дата занесения в базу": (today - timedelta(days=rng.randint(0, 1500))).strftime("%d.%m.%Y"),
+            "Объект": kind,
+            "Адрес": (f"г. {rng.choice(CITIES)}, {rng.choice(STREETS)}, д. {house}"
+                      + (f", кв. {rng.randint(1, 300)}" if is_flat else "")),
+            "Кадастровый №": f"50:{rng.randint(1, 99):02d}:{rng.randint(0, 9999999):07d}:{rng.randint(1, 9999)}",
+            "Цена": str(rng.randint(15, 400) * 100000),
+            "Площадь": f"{area},{rng.randint(0, 9)}" if area else "",
+            "Комнаты": "+".join(str(r) for r in rooms),
+            "Жилая": str(float(sum(rooms))) if rooms else "",
+            "Кухня": str(kitchen) if kind != "участок" else "",
+            "Санузел": rng.choice(BATHROOMS) if kind != "участок" else "",
+            "Этаж/этажность": f"{rng.randint(1, floors)}/{floors}" if kind != "участок" else "",
+            "Участок": f"{rng.randint(4, 30)} соток" if not is_flat else "",
+            "Дом": rng.choice(HOUSES),
+            "Высота потолков": f"{rng.choice(['2.5', '2.6', '2.7', '3.0'])}",
+            "Год постройки": str(rng.randint(1950, 2025)),
+            "Сделка": rng.choice(DEALS),
+            "Основание владения": rng.choice(OWNERSHIP),
+            "Срок владения": f"{rng.randint(1, 30)} лет",
+            "Количество собственников": str(rng.randint(1, 4)),
+            "Контакт ФИО": f"{rng.choice(SURNAMES)} {rng.choice(NAMES)} {rng.choice(PATRONYMICS)}",
+            "Телефон": f"+7 (9{rng.randint(0, 99):02d}) {rng.randint(0, 999):03d}-{rng.randint(0, 99):02d}-{rng.randint(0, 99):02d}",
+            "Примечание": " ".join(rng.choices(NOTE_PHRASES, k=rng.choice([0, 0, 1, 2, 4, 8, 16]))),
+        })
+    return rows
+
+
+# --- Заглушки tkinter -----------------------------------------------------------
+
+class StubVar:
+    def __init__(self, master=None, value=None):
+        self.value = "" if value is None else value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+    def trace_add(self, *args, **kwargs):
+        pass
+
+
+class StubWidget:
+    # Любой метод, которого нет в заглушке (pack, grid, bind, ...), ничего не делает
+    def __init__(self, *args, **kwargs):
+        self.options = dict(kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def configure(self, *args, **kwargs):
+        self.options.update(kwargs)
+
+    config = configure
+
+    def cget(self, key):
+        return self.options.get(key, "")
+
+    def __setitem__(self, key, value):
+        self.options[key] = value
+
+    def __getitem__(self, key):
+        return self.options.get(key)
+
+    def winfo_exists(self):
+        return True
+
+
+class StubTk(StubWidget):
+    # root.after ставит вызовы в очередь, run_pending() выполняет накопившиеся
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.queue = []
+        self.counter = 0
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            return None
+        self.counter += 1
+        after_id = f"after#{self.counter}"
+        self.queue.append((after_id, func, args))
+        return after_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.queue = [entry for entry in self.queue if entry[0] != after_id]
+
+    def run_pending(self):
+        queue, self.queue = self.queue, []
+        for _, func, args in queue:
+            func(*args)
+
+
+class StubEntry(StubWidget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.text = ""
+
+    def get(self, *args):
+        return self.text
+
+    def insert(self, index, value):
+        self.text = self.text + str(value) if index == "end" else str(value) + self.text
+
+    def delete(self, *args):
+        self.text = ""
+
+    def set(self, value):
+        self.text = value
+
+
+class StubText(StubEntry):
+    def get(self, *args):
+        return self.text + "\n"
+
+    def insert(self, index, value, *tags):
+        self.text += str(value)
+
+
+class StubTclError(Exception):
+    pass
+
+
+class StubTreeview(StubWidget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.items = {}
+        self.order = []
+        self.selected = []
+        self.counter = 0
+
+    def check_column(self, column):
+        # Как в Tk: столбец - имя из columns, "#0" или "#номер", иначе ошибка
+        columns = [str(name) for name in self.options.get("columns") or ()]
+        column = str(column)
+        if column in columns or column == "#0":
+            return
+        if column.startswith("#") and column[1:].isdigit() and int(column[1:]) <= len(columns):
+            return
+        raise StubTclError(f"Invalid column index {column}")
+
+    def heading(self, column, option=None, **kwargs):
+        self.check_column(column)
+
+    def column(self, column, option=None, **kwargs):
+        self.check_column(column)
+
+    def insert(self, parent, index, iid=None, values=(), **kwargs):
+        if iid is None:
+            self.counter += 1
+            iid = f"I{self.counter:03d}"
+        iid = str(iid)
+        self.items[iid] = {"values": tuple(values), "tags": kwargs.get("tags", ())}
+        if index == "end":
+            self.order.append(iid)
+        else:
+            self.order.insert(int(index), iid)
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            iid = str(iid)
+            del self.items[iid]
+            self.order.remove(iid)
+            if iid in self.selected:
+                self.selected.remove(iid)
+
+    def get_children(self, item=""):
+        return tuple(self.order)
+
+    def item(self, iid, option=None, **kwargs):
+        data = self.items[str(iid)]
+        if kwargs:
+            data.update({key: tuple(value) if key == "values" else value for key, value in kwargs.items()})
+            return None
+        return data.get(option) if option else data
+
+    def exists(self, iid):
+        return str(iid) in self.items
+
+    def index(self, iid):
+        return self.order.index(str(iid))
+
+    def move(self, iid, parent, index):
+        self.order.remove(str(iid))
+        self.order.insert(len(self.order) if index == "end" else index, str(iid))
+
+    def selection(self):
+        return tuple(self.selected)
+
+    def selection_add(self, *iids):
+        self.selected += [str(iid) for iid in iids]
+
+    def selection_remove(self, *iids):
+        removed = {str(iid) for iid in iids}
+        self.selected = [iid for iid in self.selected if iid not in removed]
+
+    def identify_row(self, y):
+        return ""
+
+    def yview(self, *args):
+        return (0.0, 1.0)
+
+
+def install_widget_stubs():
+    # Подменяем tkinter до импорта программы: окна не создаются, дисплей не нужен
+    tk = types.ModuleType("tkinter")
+    ttk = types.ModuleType("tkinter.ttk")
+    messagebox = types.ModuleType("tkinter.messagebox")
+    filedialog = types.ModuleType("tkinter.filedialog")
+
+    for name, value in dict(END="end", LEFT="left", RIGHT="right", TOP="top", BOTTOM="bottom",
+                            BOTH="both", X="x", Y="y", W="w", E="e", N="n", S="s", NW="nw",
+                            CENTER="center", VERTICAL="vertical", HORIZONTAL="horizontal",
+                            NORMAL="normal", DISABLED="disabled", NONE="none", WORD="word").items():
+        setattr(tk, name, value)
+    for name in ["Frame", "Label", "Button", "Scrollbar", "Canvas", "LabelFrame", "Toplevel",
+                 "Checkbutton", "Progressbar", "Separator", "Listbox", "Style", "Menu", "PhotoImage"]:
+        setattr(tk, name, type(name, (StubWidget,), {}))
+        setattr(ttk, name, type(name, (StubWidget,), {}))
+    tk.Tk = StubTk
+    tk.Entry = ttk.Entry = ttk.Combobox = StubEntry
+    tk.Text = StubText
+    ttk.Treeview = StubTreeview
+    tk.StringVar = tk.BooleanVar = tk.IntVar = tk.DoubleVar = StubVar
+    tk.TclError = StubTclError
+    for name in ["showinfo", "showwarning", "showerror", "askyesno", "askokcancel"]:
+        setattr(messagebox, name, lambda *args, **kwargs: True)
+    for name in ["askopenfilename", "asksaveasfilename"]:
+        setattr(filedialog, name, lambda *args, **kwargs: "")
+    tk.ttk, tk.messagebox, tk.filedialog = ttk, messagebox, filedialog
+    sys.modules.update({"tkinter": tk, "tkinter.ttk": ttk,
+                        "tkinter.messagebox": messagebox, "tkinter.filedialog": filedialog})
+
+
+def silence_dialogs(messagebox):
+    # Диалоги не должны останавливать замер; сообщение об ошибке - это провал прогона
+    def fail(title, message, *args, **kwargs):
+        raise RuntimeError(f"{title}: {message}")
+
+    messagebox.showinfo = messagebox.showwarning = lambda *args, **kwargs: None
+    messagebox.askyesno = messagebox.askokcancel = lambda *args, **kwargs: True
+    messagebox.showerror = fail
+
+
+# --- Прогон ---------------------------------------------------------------------
+
+class Scenario:
+    # Одна база заданного размера во временной папке "Документы"
+
+    def __init__(self, app_module, size, display):
+        self.app_module = app_module
+        self.size = size
+        self.display = display
+        self.home = Path(tempfile.mkdtemp(prefix="real_estate_bench_"))
+        self.listings = generate_listings(size + ADD_REPEATS)
+        self.app = None
+
+    def __enter__(self):
+        # Программа берет папку документов из домашней папки пользователя
+        os.environ["HOME"] = os.environ["USERPROFILE"] = str(self.home)
+        documents = self.home / "Documents"
+        documents.mkdir()
+
+        module = self.app_module
+        module.import_data_libraries()
+        df = module.pd.DataFrame(self.listings[:self.size], columns=module.COLUMNS)
+        (documents / "real_estate_database.csv").write_bytes(module.real_estate_store.csv_bytes(df))
+
+        root = module.tk.Tk()
+        self.app = module.RealEstateApp(root)
+        self.wait(lambda: self.app.df is not None)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.app is not None:
+            self.app.on_close()
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def pump(self):
+        if self.display:
+            self.app.root.update()
+        else:
+            self.app.root.run_pending()
+
+    def wait(self, condition=lambda: True):
+        # Прокручиваем цикл событий, пока не закончатся фоновые задачи
+        while True:
+            self.pump()
+            if not self.app.jobs.pending and condition():
+                return
+            time.sleep(0.001)
+
+    # Операции: каждая возвращает, когда ее результат записан на диск
+
+    def load_data_cold(self):
+        self.app_module.real_estate_store.csv_cache_path(self.app.filename).unlink(missing_ok=True)
+        self.app.load_data()
+
+    def load_data(self):
+        self.app.load_data()
+
+    def update_table(self):
+        self.app.update_table()
+
+    def sort_table(self):
+        # Первый щелчок по заголовку "Цена": ключи сортировки считаются заново
+        self.app.sort_keys.invalidate()
+        self.app.sort_column = None
+        self.app.sort_by_column("Цена")
+
+    def save_data(self):
+        self.app.save_data()
+        self.wait()
+
+    def add_property(self):
+        for listing in self.listings[self.size:]:
+            for field, entry in self.app.entries.items():
+                if isinstance(entry, self.app_module.tk.Text):
+                    entry.delete("1.0", "end")
+                    entry.insert("end", listing[field])
+                elif isinstance(entry, self.app_module.ttk.Combobox):
+                    entry.set(listing[field])
+                else:
+                    entry.delete(0, "end")
+                    entry.insert(0, listing[field])
+            self.app.add_property()
+            self.wait()
+
+    def delete_property(self):
+        ids = self.app.df[self.app_module.ID_COLUMN].tolist()[::max(1, self.size // DELETE_COUNT)][:DELETE_COUNT]
+        if self.app.virtual_table is not None:
+            self.app.virtual_table.checked = set(ids)
+        else:
+            for row_id in ids:
+                values = list(self.app.tree.item(str(row_id), 'values'))
+                values[0] = "☑"
+                self.app.tree.item(str(row_id), values=values)
+        self.app.delete_property()
+        self.wait()
+
+    def export_to_excel(self):
+        self.app.export_to_excel()
+        self.wait()
+
+
+def measure(scenario, operation, trace_memory):
+    func = getattr(scenario, operation)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    if operation == "add_property":
+        # Время одного добавления
+        seconds /= ADD_REPEATS
+    return seconds, peak
+
+
+def run_size(app_module, size, display, memory, repeats):
+    # Время - из прогона без tracemalloc (он сильно замедляет pandas),
+    # пиковая память - из отдельного прогона под tracemalloc
+    results = {}
+    with Scenario(app_module, size, display) as scenario:
+        for operation in OPERATIONS:
+            runs = repeats if operation in REPEATABLE else 1
+            seconds = min(measure(scenario, operation, False)[0] for _ in range(runs))
+            results[operation] = {"seconds": round(seconds, 4)}
+            print(f"  {operation:<16} {seconds * 1000:10.1f} мс", flush=True)
+
+    if memory:
+        with Scenario(app_module, size, display) as scenario:
+            for operation in OPERATIONS:
+                _, peak = measure(scenario, operation, True)
+                results[operation]["peak_mb"] = round(peak, 2)
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for size, operations in results.items():
+        for operation, current in operations.items():
+            previous = baseline.get("results", {}).get(size, {}).get(operation)
+            if previous is None:
+                continue
+            limit = max(previous["seconds"] * (1 + tolerance), previous["seconds"] + MIN_REGRESSION_SECONDS)
+            if current["seconds"] > limit:
+                regressions.append(
+                    f"{operation} на {size} объектах: {current['seconds'] * 1000:.1f} мс "
+                    f"(было {previous['seconds'] * 1000:.1f} мс, допустимо {limit * 1000:.1f} мс)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности базы объектов недвижимости")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="размеры базы")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="файл базовой линии (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="без файла базовой линии завершиться с кодом 1 (для CI)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое замедление, доля (0.5 = на 50%%)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="повторы операций, не меняющих базу (берется лучшее время)")
+    parser.add_argument("--no-memory", action="store_true", help="не замерять пиковую память")
+    parser.add_argument("--display", action="store_true", help="настоящий Tk вместо заглушек")
+    args = parser.parse_args()
+
+    if not args.display:
+        install_widget_stubs()
+    import real_estate_app_11 as app_module
+    silence_dialogs(app_module.messagebox)
+
+    results = {}
+    for size in args.sizes:
+        print(f"{size} объектов:", flush=True)
+        results[str(size)] = run_size(app_module, size, args.display, not args.no_memory, args.repeats)
+
+    app_module.import_data_libraries()
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": app_module.pd.__version__,
+        "platform": platform.platform(),
+        "storage_mode": app_module.real_estate_store.STORAGE_MODE,
+        "lazy_text": app_module.real_estate_store.LAZY_TEXT_LOADING,
+        "widgets": "tk" if args.display else "stub",
+        "results": results,
+    }
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Базовая линия записана: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"Базовой линии нет ({args.baseline}), запустите с --save-baseline")
+        return 1 if args.require_baseline else 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print("Замедление относительно базовой линии:")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    print("Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
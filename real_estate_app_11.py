@@ -1,19 +1,430 @@
+import time
+# Отсчет времени запуска - до загрузки остальных модулей
+STARTUP_CLOCK = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox
-import pandas as pd
+from tkinter import ttk, messagebox, filedialog
 import os
+import sys
+import io
+import hashlib
+import threading
+import base64
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
-# Проверяем наличие Pillow и устанавливаем если нужно
-try:
-    from PIL import Image, ImageTk
-except ImportError:
-    import subprocess
-    import sys
-    print("Устанавливаем библиотеку Pillow...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "pillow"])
-    from PIL import Image, ImageTk
+import real_estate_store
+from real_estate_store import (
+    ARCHIVE_AGE_DAYS, COLUMNS, DATABASE_NAME, DERIVED_RULES, DUPLICATES_REPORT_NAME, EXPORT_NAME,
+    ID_COLUMN, IMPORT_REPORT_NAME, OBJECT_ORDER, PHOTO_EXTENSIONS, PROFILER, PROFILE_OPERATIONS,
+    SCHEMA, STATS_GROUPS, DuplicateIndex, ListingStore, PortfolioStats, RangeFilterIndex,
+    RowFormatter, SearchIndex, SortKeys, add_listing_photos, age_text, check_frame, check_listings,
+    documents_directory, empty_frame, export_frame, format_rows, lazy_text_fields, listing_photos,
+    normalize_listings, price_text, profiled, read_import_file, remove_listing_photos,
+    row_position, run_cli, to_journal_value, write_duplicates_report, write_excel_export,
+    write_file_atomic
+)
+
+# pandas и numpy загружаются не при запуске, а после первой отрисовки окна
+# (см. import_data_libraries). Pillow нужен только для пересоздания миниатюр
+# (титульная картинка, фотографии объектов) и тоже импортируется по месту.
+pd = None
+np = None
+
+
+def import_data_libraries():
+    # Сами модули загружает real_estate_store, окну нужны те же pd и np
+    global pd, np
+    real_estate_store.import_data_libraries()
+    pd = real_estate_store.pd
+    np = real_estate_store.np
+
+
+# Бюджет времени запуска, мс: до первой отрисовки окна и до загрузки базы.
+# Замеры пишутся в startup.log в папке кэша, превышение показывается в строке состояния
+STARTUP_WINDOW_BUDGET_MS = 700
+STARTUP_DATA_BUDGET_MS = 3000
+
+# Титульная картинка: ищется рядом с программой, в окне показывается
+# уменьшенная копия из кэша (пересоздается только при изменении исходника)
+TITLE_IMAGE_NAME = "Титульная картинка.jpg"
+TITLE_IMAGE_OLD_DIR = "C:\\Users\\Pro\\Desktop\\#abracrocodaber"
+TITLE_IMAGE_SIZE = (300, 400)
+
+# Миниатюры фотографий для превью рядом с таблицей и ленты в окне правки готовятся в фоне,
+# последние PHOTO_MEMORY_ITEMS держатся в памяти, все - в real_estate_cache/photos
+PHOTO_PREVIEW_SIZE = (240, 180)
+PHOTO_STRIP_SIZE = (120, 90)
+PHOTO_MEMORY_ITEMS = 200
+
+# Виртуальная таблица: в Treeview создаются только видимые строки
+VIRTUAL_TABLE = True
+
+# Изменения других копий программы подхватываются проверкой файлов базы раз в WATCH_INTERVAL_MS
+WATCH_INTERVAL_MS = 2000
+
+# Пауза в наборе, после которой форма пересчитывает правила, мс
+FORM_RULES_DELAY_MS = 300
+
+
+class FormRules:
+    # Правила для полей формы (DERIVED_RULES, FORMAT_RULES): после паузы в наборе
+    # пересчитывает вычисляемые поля по измененным полям и проверяет формат.
+    # on_update(hints, problems) получает подсказки и замечания для показа под формой
+
+    def __init__(self, root, entries, on_update):
+        self.root = root
+        self.entries = entries
+        self.on_update = on_update
+        self.after_id = None
+        self.changed = set()
+        for field, entry in entries.items():
+            entry.bind('<KeyRelease>', lambda e, field=field: self.schedule(field), add="+")
+            entry.bind('<<ComboboxSelected>>', lambda e, field=field: self.schedule(field), add="+")
+
+    def values(self):
+        values = {}
+        for field, entry in self.entries.items():
+            if isinstance(entry, tk.Text):
+                values[field] = entry.get("1.0", tk.END).strip()
+            else:
+                values[field] = entry.get()
+        return values
+
+    def schedule(self, field=None):
+        # Правила считаются один раз после паузы, а не на каждую клавишу
+        if field is not None:
+            self.changed.add(field)
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = self.root.after(FORM_RULES_DELAY_MS, self.run)
+
+    def run(self):
+        self.after_id = None
+        if pd is None:
+            # pandas еще загружается
+            self.schedule()
+            return
+        
+        values = pd.DataFrame([self.values()]).fillna("").astype(str)
+        hints = []
+        for rule in DERIVED_RULES:
+            value = rule.compute(values).iloc[0]
+            if rule.target not in self.entries:
+                if value:
+                    hints.append(f"{rule.target}: {value}")
+                continue
+            if value and self.changed.intersection(rule.sources):
+                entry = self.entries[rule.target]
+                entry.delete(0, tk.END)
+                entry.insert(0, value)
+                values[rule.target] = value
+        self.changed.clear()
+        self.on_update(hints, check_listings(values).get(0, []))
+
+
+
+class JobScheduler:
+    # Фоновые задачи (сохранение, выгрузка) в одном рабочем потоке:
+    # задачи выполняются строго по очереди, поэтому два сохранения не пересекаются.
+    # Результат и ошибки возвращаются в главный поток Tk через root.after.
+
+    POLL_MS = 50
+
+    def __init__(self, root, on_status=None):
+        self.root = root
+        self.on_status = on_status
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+        self.pending = []
+
+    def submit(self, label, func, on_done=None, on_error=None):
+        # Каждая задача замеряется под своим названием
+        if PROFILE_OPERATIONS:
+            future = self.executor.submit(PROFILER.call, label, func)
+        else:
+            future = self.executor.submit(func)
+        self.pending.append(label)
+        self.report()
+        self.root.after(self.POLL_MS, self.poll, future, label, on_done, on_error)
+        return future
+
+    def poll(self, future, label, on_done, on_error):
+        if not future.done():
+            self.root.after(self.POLL_MS, self.poll, future, label, on_done, on_error)
+            return
+        
+        self.pending.remove(label)
+        self.report()
+        error = future.exception()
+        if error is not None:
+            print(f"Ошибка в задаче \"{label}\": {error}")
+            if on_error is not None:
+                on_error(error)
+        elif on_done is not None:
+            on_done(future.result())
+
+    def report(self):
+        if self.on_status is not None:
+            self.on_status(list(self.pending))
+
+    def shutdown(self):
+        # Дожидаемся всех поставленных задач
+        self.executor.shutdown(wait=True)
+
+
+class VirtualTreeview:
+    # Окно строк поверх Treeview: виджет держит только видимые строки,
+    # пары (ID, значения) подгружаются из row_source(start, stop) при прокрутке.
+    # Состояние чекбоксов "Выбор" хранится в checked (ID объектов),
+    # row_tags(ID) - теги строки Treeview (подсветка).
+
+    def __init__(self, tree, scrollbar, row_source, row_tags=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_source = row_source
+        self.row_tags = row_tags or (lambda row_id: ())
+        self.rows = int(tree.cget("height")) or 8
+        self.count = 0
+        self.top = 0
+        self.checked = set()
+        
+        scrollbar.configure(command=self.yview)
+        tree.bind('<MouseWheel>', self.on_mousewheel)
+        tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        tree.bind('<Button-5>', lambda e: self.scroll(3))
+
+    def set_count(self, count, change=None):
+        # Данные изменились: перерисовываем только текущее окно
+        if change is not None and change["op"] == "delete":
+            self.checked.difference_update(change["ids"])
+        self.count = count
+        self.render()
+
+    def yview(self, *args):
+        # Команда вертикального скроллбара
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * self.count)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.rows
+            self.top += step
+        self.render()
+
+    def scroll(self, step):
+        self.top += step
+        self.render()
+        return "break"
+
+    def on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def render(self):
+        self.top = max(0, min(self.top, self.count - self.rows))
+        stop = min(self.top + self.rows, self.count)
+        
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for row_id, values in self.row_source(self.top, stop):
+            mark = "☑" if row_id in self.checked else "☐"
+            self.tree.insert("", tk.END, iid=str(row_id), values=(mark,) + values, tags=self.row_tags(row_id))
+            if row_id in self.checked:
+                self.tree.selection_add(str(row_id))
+        
+        if self.count:
+            self.scrollbar.set(self.top / self.count, stop / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def toggle(self, item):
+        row_id = int(item)
+        values_list = list(self.tree.item(item, 'values'))
+        if row_id in self.checked:
+            self.checked.discard(row_id)
+            values_list[0] = "☐"
+            self.tree.selection_remove(item)
+        else:
+            self.checked.add(row_id)
+            values_list[0] = "☑"
+            self.tree.selection_add(item)
+        self.tree.item(item, values=tuple(values_list))
+
+
+def startup_elapsed_ms():
+    return int((time.perf_counter() - STARTUP_CLOCK) * 1000)
+
+
+def app_directory():
+    # Папка программы: рядом со скриптом или с exe-файлом сборки PyInstaller
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).parent
+    return Path(__file__).resolve().parent
+
+
+def find_title_image():
+    for folder in (app_directory(), Path(TITLE_IMAGE_OLD_DIR)):
+        path = folder / TITLE_IMAGE_NAME
+        if path.exists():
+            return path
+    return None
+
+
+def title_thumbnail(cache_dir):
+    # Путь к уменьшенной PNG-копии титульной картинки (None, если картинки нет).
+    # Ключ кэша - путь, время изменения и размер исходника: пока они не менялись,
+    # PNG открывается напрямую через tk.PhotoImage без Pillow и без пересчета
+    source = find_title_image()
+    if source is None:
+        return None
+    
+    stat = source.stat()
+    key = f"{source.resolve()}|{stat.st_mtime_ns}|{stat.st_size}|{TITLE_IMAGE_SIZE[0]}x{TITLE_IMAGE_SIZE[1]}"
+    thumbnail_path = Path(cache_dir) / "title_thumbnail.png"
+    key_path = Path(cache_dir) / "title_thumbnail.key"
+    try:
+        if thumbnail_path.exists() and key_path.read_text(encoding="utf-8") == key:
+            return thumbnail_path
+    except OSError:
+        pass
+    
+    # Исходник изменился или кэша еще нет - пересоздаем миниатюру
+    from PIL import Image
+    with Image.open(source) as image:
+        image = image.convert("RGB").resize(TITLE_IMAGE_SIZE, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+    
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    write_file_atomic(thumbnail_path, buffer.getvalue())
+    write_file_atomic(key_path, key.encode("utf-8"))
+    return thumbnail_path
+
+
+
+def open_file(path):
+    # Открываем файл программой по умолчанию
+    if os.name == 'nt':
+        os.startfile(path)
+    else:
+        import subprocess
+        subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", str(path)])
+
+
+class PhotoThumbnails:
+    # Миниатюры фотографий объектов. Декодирование и уменьшение (Pillow) идут в отдельном
+    # потоке, готовые PNG хранятся в памяти (последние PHOTO_MEMORY_ITEMS) и на диске
+    # в папке кэша под хешем файла фотографии. Результат передается в главный поток Tk
+    # через root.after. Запросы объединяются в группы (превью, лента окна правки):
+    # новый запрос группы отменяет ее еще не начатые задачи
+
+    POLL_MS = 30
+
+    def __init__(self, root, cache_dir):
+        self.root = root
+        self.cache_dir = Path(cache_dir) / "photos"
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="photos")
+        self.memory = OrderedDict()
+        self.hashes = {}
+        self.lock = threading.Lock()
+        self.wanted = {}
+
+    def cached(self, key):
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+            return data
+
+    def remember(self, key, data):
+        with self.lock:
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > PHOTO_MEMORY_ITEMS:
+                self.memory.popitem(last=False)
+
+    def file_hash(self, path):
+        # Хеш содержимого; повторно файл читается, только если изменились время или размер
+        stat = os.stat(path)
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        digest = self.hashes.get(key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha1.update(chunk)
+            digest = self.hashes[key] = sha1.hexdigest()
+        return digest
+
+    def render(self, path, size):
+        # PNG миниатюры: из кэша на диске или из самой фотографии (фоновый поток)
+        cache_path = self.cache_dir / f"{self.file_hash(path)}_{size[0]}x{size[1]}.png"
+        try:
+            return cache_path.read_bytes()
+        except OSError:
+            pass
+
+        from PIL import Image, ImageOps
+        with Image.open(path) as image:
+            # JPEG сразу декодируется в уменьшенном виде: быстрее и без полного кадра в памяти
+            image.draft("RGB", (size[0] * 2, size[1] * 2))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(size)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(cache_path, data)
+        except OSError as e:
+            print(f"Не удалось записать миниатюру в кэш: {e}")
+        return data
+
+    def load(self, group, token, path, size):
+        if self.wanted.get(group) is not token:
+            # Миниатюра уже не нужна (выбрали другой объект)
+            return None
+        data = base64.b64encode(self.render(path, size))
+        self.remember((str(path), size), data)
+        return data
+
+    def request(self, group, paths, size, on_ready):
+        # on_ready(path, data) в главном потоке; data - PNG в base64 для tk.PhotoImage(data=...)
+        # или None, если фото не прочитать
+        token = object()
+        self.wanted[group] = token
+        for path in paths:
+            data = self.cached((str(path), size))
+            if data is not None:
+                on_ready(path, data)
+                continue
+            future = self.executor.submit(self.load, group, token, path, size)
+            self.root.after(self.POLL_MS, self.poll, future, group, token, path, on_ready)
+
+    def cancel(self, group):
+        self.wanted.pop(group, None)
+
+    def poll(self, future, group, token, path, on_ready):
+        if not future.done():
+            self.root.after(self.POLL_MS, self.poll, future, group, token, path, on_ready)
+            return
+        if self.wanted.get(group) is not token:
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"Фото не прочитано ({path}): {error}")
+            on_ready(path, None)
+        elif future.result() is not None:
+            on_ready(path, future.result())
+
+    def shutdown(self):
+        self.wanted.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 
 class RealEstateApp:
     def __init__(self, root):
@@ -22,75 +433,335 @@ class RealEstateApp:
         self.root.geometry("1300x850")
         
         # Определяем путь к папке документов пользователя
-        documents_path = Path.home() / "Documents"
-        self.filename = documents_path / "real_estate_database.csv"
+        documents_path = documents_directory()
+        self.filename = documents_path / DATABASE_NAME
+        self.cache_dir = documents_path / "real_estate_cache"
+        PROFILER.output_dir = self.cache_dir
         
         # Словарь для хранения состояний чекбоксов
         self.checkbox_vars = {}
         
-        # Загрузка данных
-        self.load_data()
+        # База (ListingStore: хранилище по настройке STORAGE_MODE и данные)
+        # появляется после первой отрисовки окна
+        self.store = None
+        self.startup_times = {}
+        
+        # Сохранение и выгрузка выполняются в фоне, окно при этом не блокируется
+        self.jobs = JobScheduler(self.root, self.show_job_status)
+        
+        # Миниатюры фотографий готовятся в своем фоновом потоке, чтобы не ждать сохранений;
+        # preview_id - объект, фото которого показаны рядом с таблицей
+        self.photos = PhotoThumbnails(self.root, self.cache_dir)
+        self.preview_id = None
+        self.preview_photos = []
+        self.preview_index = 0
+        self.preview_image = None
+        
+        # Поиск: индекс строится при первом запросе и дальше обновляется по изменениям.
+        # view_positions - номера строк DataFrame, показанных в таблице (None - все строки)
+        self.search_index = None
+        self.search_after_id = None
+        self.view_positions = None
+        
+        # Фильтр по диапазонам: индексы строятся при первом применении фильтра
+        self.range_index = None
+        self.range_filter = {}
+        
+        # Сортировка щелчком по заголовку столбца (None - порядок занесения в базу);
+        # ключи сортировки считаются один раз на столбец и обновляются по изменениям
+        self.sort_keys = SortKeys()
+        self.sort_column = None
+        self.sort_descending = False
+        
+        # Индекс дубликатов (кадастровый номер, адрес, телефон) строится в фоне после загрузки;
+        # data_version - счетчик изменений, по нему видно, что индекс успел устареть
+        self.duplicate_index = None
+        self.data_version = 0
+        
+        # Замечания по формату полей занесенных объектов: ID -> список замечаний.
+        # Вся база проверяется в фоне после загрузки, дальше - только измененные строки
+        self.data_problems = {}
+        
+        # Сводка для панели "Статистика": считается при первом открытии панели,
+        # дальше обновляется по изменениям, как индексы поиска и фильтра
+        self.portfolio = None
+        self.stats_window = None
+        
+        # Действия, которые ждут фоновой загрузки длинных текстов (см. with_lazy_fields)
+        self.lazy_actions = []
         
         # Создание интерфейса
         self.create_widgets()
         
+        # При закрытии окна дописываем базу (сжатие журнала, закрытие SQLite)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Загрузка данных - после того, как окно нарисовано: after_idle срабатывает
+        # после уже поставленных перерисовок, after(1) - после следующей за ними
+        self.root.after_idle(lambda: self.root.after(1, self.start_loading))
+    
+    def start_loading(self):
+        self.startup_times["window"] = startup_elapsed_ms()
+        self.jobs.submit("Загрузка базы", self.load_data, self.on_data_loaded,
+                         lambda e: messagebox.showerror("Ошибка", f"Ошибка при загрузке базы: {str(e)}"))
+    
+    @property
+    def df(self):
+        # Данные базы хранит ListingStore; до загрузки - None
+        return self.store.df if self.store is not None else None
+    
+    @df.setter
+    def df(self, value):
+        self.store.df = value
+    
+    @profiled("load_data", rows=lambda self, result: len(result.df))
     def load_data(self):
-        if os.path.exists(self.filename):
-            try:
-                # Читаем CSV без преобразования дат
-                self.df = pd.read_csv(self.filename, encoding='utf-8')
-                
-                # Если столбец с датой существует, преобразуем его с правильным форматом
-                if 'Дата занесения в базу' in self.df.columns:
-                    # Преобразуем дату с указанием формата DD.MM.YYYY
-                    self.df['Дата занесения в базу'] = pd.to_datetime(
-                        self.df['Дата занесения в базу'], 
-                        format='%d.%m.%Y', 
-                        errors='coerce'
-                    )
-            except Exception as e:
-                print(f"Ошибка при загрузке данных: {e}")
-                # Создаем пустой DataFrame в случае ошибки
-                self.df = pd.DataFrame(columns=[
-                    "Дата занесения в базу", "Объект", "Адрес", "Кадастровый №", "Цена", "Площадь", "Комнаты", "Жилая", 
-                    "Кухня", "Санузел", "Этаж/этажность", "Участок", "Дом", 
-                    "Высота потолков", "Год постройки", "Сделка", "Основание владения",
-                    "Срок владения", "Количество собственников", "Контакт ФИО", 
-                    "Телефон", "Примечание"
-                ])
+        # Выполняется в фоновом потоке: импорт pandas, открытие хранилища, чтение базы
+        import_data_libraries()
+        store = ListingStore(self.filename, lazy_text_fields())
+        try:
+            store.load()
+        except Exception as e:
+            print(f"Ошибка при загрузке данных: {e}")
+            # Создаем пустой DataFrame в случае ошибки
+            store.df = empty_frame()
+        return store
+    
+    def on_data_loaded(self, store):
+        self.store = store
+        
+        # Следим за изменениями базы другими копиями программы
+        self.watch_stamp = self.store.storage.stamp()
+        self.root.after(WATCH_INTERVAL_MS, self.watch_base)
+        
+        for button in self.data_buttons:
+            button.state(["!disabled"])
+        # Если поиск или фильтр задали во время загрузки, они применятся здесь же
+        self.update_table()
+        self.prepare_duplicate_index()
+        self.report_startup_time()
+    
+    def prepare_duplicate_index(self):
+        # Строим индекс дубликатов по копии базы в фоновом потоке.
+        # Если база за это время изменилась, индекс не ставим - он построится при проверке
+        df = self.df.copy()
+        version = self.data_version
+        
+        def build():
+            index = DuplicateIndex()
+            index.build(df)
+            return index
+        
+        def install(index):
+            if self.data_version == version and self.duplicate_index is None:
+                self.duplicate_index = index
+        
+        self.jobs.submit("Индекс дубликатов", build, install)
+    
+    def prepare_data_check(self):
+        # Проверяем формат полей всей базы по копии в фоновом потоке.
+        # Если база за это время изменилась, проверка запускается заново
+        df = self.df.copy()
+        version = self.data_version
+        
+        def install(problems):
+            if self.data_version != version:
+                self.prepare_data_check()
+                return
+            self.data_problems = problems
+            self.show_job_status(self.jobs.pending)
+            if self.virtual_table is not None:
+                self.virtual_table.render()
+            else:
+                for row_id in problems:
+                    if self.tree.exists(str(row_id)):
+                        self.tree.item(str(row_id), tags=self.row_tags(row_id))
+        
+        self.jobs.submit("Проверка данных", lambda: check_frame(df), install)
+    
+    def update_data_problems(self, change):
+        # Перепроверяем только строки из записи об изменении
+        op = change["op"]
+        if op in ("add", "edit"):
+            index = row_position(self.df, change["id"])
+            self.data_problems.pop(change["id"], None)
+            self.data_problems.update(check_frame(self.df.iloc[index:index + 1]))
+        elif op == "delete":
+            for row_id in change["ids"]:
+                self.data_problems.pop(row_id, None)
         else:
-            self.df = pd.DataFrame(columns=[
-                "Дата занесения в базу", "Объект", "Адрес", "Кадастровый №", "Цена", "Площадь", "Комнаты", "Жилая", 
-                "Кухня", "Санузел", "Этаж/этажность", "Участок", "Дом", 
-                "Высота потолков", "Год постройки", "Сделка", "Основание владения",
-                "Срок владения", "Количество собственников", "Контакт ФИО", 
-                "Телефон", "Примечание"
-            ])
-    
-    def save_data(self):
-        # Создаем папку, если она не существует
-        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
-        
-        # Сохраняем DataFrame, преобразуя даты в строку с нужным форматом
-        df_to_save = self.df.copy()
-        if 'Дата занесения в базу' in df_to_save.columns:
-            df_to_save['Дата занесения в базу'] = df_to_save['Дата занесения в базу'].dt.strftime('%d.%m.%Y')
-        
-        df_to_save.to_csv(self.filename, index=False, encoding='utf-8')
-    
-    def calculate_living_area(self, event=None):
-        # Автоматическое вычисление жилой площади на основе поля "Комнаты"
-        rooms_value = self.entries["Комнаты"].get()
-        if rooms_value:
-            try:
-                # Разделяем значения по '+' и суммируем
-                numbers = [float(x.strip()) for x in rooms_value.split('+')]
-                total = sum(numbers)
-                self.entries["Жилая"].delete(0, tk.END)
-                self.entries["Жилая"].insert(0, str(total))
-            except ValueError:
-                # Если не удалось преобразовать в числа, оставляем поле пустым
-                pass
+            self.prepare_data_check()
+    
+    def row_tags(self, row_id):
+        return ("problem",) if row_id in self.data_problems else ()
+    
+    def report_startup_time(self):
+        # Замер запуска: время до первой отрисовки окна и до готовности базы
+        self.startup_times["data"] = startup_elapsed_ms()
+        window_ms = self.startup_times["window"]
+        data_ms = self.startup_times["data"]
+        message = f"Запуск: окно {window_ms} мс, база {data_ms} мс ({len(self.df)} объектов)"
+        over_budget = window_ms > STARTUP_WINDOW_BUDGET_MS or data_ms > STARTUP_DATA_BUDGET_MS
+        if over_budget:
+            message += f" - превышен бюджет ({STARTUP_WINDOW_BUDGET_MS} / {STARTUP_DATA_BUDGET_MS} мс)"
+        print(message)
+        self.status_var.set(message)
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_dir / "startup.log", 'a', encoding='utf-8') as f:
+                f.write(f"{datetime.now():%Y-%m-%d %H:%M:%S}\twindow={window_ms}\tdata={data_ms}"
+                        f"\trows={len(self.df)}\tover_budget={int(over_budget)}\n")
+        except OSError as e:
+            print(f"Не удалось записать startup.log: {e}")
+    
+    def save_data(self, on_done=None, on_error=None):
+        # Полная запись базы в фоне (из копии, чтобы не зависеть от правок в окне);
+        # не загруженные еще длинные тексты сначала дочитываются.
+        # Замер "save_data" - сама запись в фоновом потоке
+        def save():
+            df = self.df.copy()
+            version = self.store.version
+            self.jobs.submit(
+                "Сохранение базы",
+                lambda: PROFILER.call("save_data", self.store.save, df, version, rows=lambda result: len(df)),
+                on_done, on_error
+            )
+        
+        self.with_lazy_fields(save)
+    
+    def commit_change(self, record, on_done=None, on_error=None):
+        # Сохраняем одно изменение: строка журнала, один SQL-запрос или полная перезапись CSV.
+        # Снимок данных берется сразу, запись идет в фоновом потоке.
+        # Изменения других копий программы, найденные при записи, сразу показываем
+        snapshot = self.store.snapshot(record)
+        
+        def on_saved(changes):
+            self.merge_remote_changes(changes)
+            if changes.conflict is not None:
+                messagebox.showwarning(
+                    "Объект изменен",
+                    f"Объект ID {changes.conflict} уже изменен или удален в другой копии программы.\n"
+                    "Ваши правки не сохранены, в таблице показана его текущая версия."
+                )
+            elif on_done is not None:
+                on_done(changes)
+        
+        return self.jobs.submit(
+            "Сохранение", lambda: self.store.commit(record, snapshot), on_saved, on_error
+        )
+    
+    def with_lazy_fields(self, action):
+        # action() - когда в df есть все столбцы: не загруженные при запуске длинные
+        # тексты (LAZY_TEXT_LOADING) сначала читаются в фоне, таблица затем строится заново
+        if not self.store.missing:
+            action()
+            return
+        if action not in self.lazy_actions:
+            self.lazy_actions.append(action)
+        if len(self.lazy_actions) > 1:
+            # Загрузка уже идет
+            return
+        
+        def install(frame):
+            actions, self.lazy_actions = self.lazy_actions, []
+            if self.store.missing:
+                self.store.install_fields(frame)
+                self.update_table()
+            for pending in actions:
+                pending()
+        
+        def failed(e):
+            self.lazy_actions = []
+            messagebox.showerror("Ошибка", f"Ошибка при загрузке текстов объектов: {str(e)}")
+        
+        self.jobs.submit("Загрузка текстов объектов", self.store.read_fields, install, failed)
+    
+    def watch_base(self):
+        # Дешевая проверка раз в WATCH_INTERVAL_MS: время изменения и размер файлов базы.
+        # Если их изменила другая копия программы, в фоне читаем только новые записи
+        self.root.after(WATCH_INTERVAL_MS, self.watch_base)
+        if self.jobs.pending:
+            return
+        stamp = self.store.storage.stamp()
+        if stamp == self.watch_stamp:
+            return
+        self.watch_stamp = stamp
+        self.jobs.submit("Проверка изменений", self.store.pull, self.merge_remote_changes)
+    
+    def merge_remote_changes(self, changes):
+        # Применяем изменения других копий программы и обновляем только их строки таблицы
+        records = self.store.merge(changes)
+        if not records and not changes.renamed:
+            return
+        if changes.renamed or len(records) > 100 or any(record["op"] == "add_batch" for record in records):
+            self.update_table()
+        else:
+            for record in records:
+                self.update_table(record)
+        self.status_var.set(f"Загружены изменения из другой копии программы: {len(records)}")
+    
+    def show_job_status(self, pending):
+        # Строка состояния: какие фоновые задачи еще выполняются
+        if not hasattr(self, 'status_var'):
+            return
+        if pending:
+            self.status_var.set(f"{pending[0]}... (в очереди: {len(pending)})")
+            self.progress.start(10)
+        elif self.data_problems:
+            self.status_var.set(f"Готово. Объектов с замечаниями по формату полей: {len(self.data_problems)} "
+                                "(выделены в таблице)")
+            self.progress.stop()
+        else:
+            self.status_var.set("Готово")
+            self.progress.stop()
+    
+    def toggle_profile_readout(self, event=None):
+        if self.profile_after_id is None:
+            self.profile_label.pack(side=tk.LEFT, padx=20)
+            self.refresh_profile_readout()
+        else:
+            self.root.after_cancel(self.profile_after_id)
+            self.profile_after_id = None
+            self.profile_label.pack_forget()
+    
+    def refresh_profile_readout(self):
+        # Пока строка замеров видна, обновляем ее два раза в секунду
+        record = PROFILER.last()
+        if record is not None:
+            text = f"{record['operation']}: {record['ms']} мс"
+            if record['rows'] is not None:
+                text += f", строк: {record['rows']}"
+            if record['bytes']:
+                text += f", записано: {record['bytes'] / 1024:.1f} КБ"
+            self.profile_var.set(text)
+        self.profile_after_id = self.root.after(500, self.refresh_profile_readout)
+    
+    def on_close(self):
+        try:
+            # Дожидаемся фоновых сохранений, затем дописываем базу
+            self.root.withdraw()
+            self.jobs.shutdown()
+            self.photos.shutdown()
+            if self.store is not None:
+                self.store.close()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при сохранении базы: {str(e)}")
+        self.root.destroy()
+    
+    def create_form_rules(self, parent, entries):
+        # Подсказки (цена за м²) и замечания по формату под полями формы
+        frame = ttk.Frame(parent)
+        hint_var = tk.StringVar()
+        problem_var = tk.StringVar()
+        ttk.Label(frame, textvariable=hint_var, foreground="gray").pack(side=tk.TOP, anchor="w", padx=5)
+        ttk.Label(frame, textvariable=problem_var, foreground="red").pack(side=tk.TOP, anchor="w", padx=5)
+        
+        def on_update(hints, problems):
+            hint_var.set("    ".join(hints))
+            problem_var.set("\n".join(problems))
+        
+        return frame, FormRules(self.root, entries, on_update)
     
     def create_widgets(self):
         # Декоративный заголовок только с домиками
@@ -122,34 +793,10 @@ class RealEstateApp:
         canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
         canvas.configure(yscrollcommand=scrollbar.set)
         
-        # Поля ввода в правильном порядке
-        fields = [
-            ("Дата занесения в базу", "date"),
-            ("Объект", "combobox", ["комната", "1-ккв", "2-ккв", "3-ккв", "4-ккв", "дача", "дом", "участок"]),
-            ("Адрес", "entry"),
-            ("Кадастровый №", "entry"),
-            ("Цена", "entry"),
-            ("Площадь", "entry"),
-            ("Комнаты", "entry"),
-            ("Жилая", "entry"),
-            ("Кухня", "entry"),
-            ("Санузел", "combobox", ["раздельный", "совмещенный"]),
-            ("Этаж/этажность", "entry"),
-            ("Участок", "entry"),
-            ("Дом", "combobox", ["нет", "монолит", "панельный", "кирпичный", "бревно", "каркасный"]),
-            ("Высота потолков", "entry"),
-            ("Год постройки", "entry"),
-            ("Сделка", "combobox", ["прямая продажа", "альтернатива"]),
-            ("Основание владения", "combobox", ["ДКП", "ДДУ", "Наследство", "Дарение", "Приватизация"]),
-            ("Срок владения", "entry"),
-            ("Количество собственников", "entry"),
-            ("Контакт ФИО", "entry"),
-            ("Телефон", "entry"),
-            ("Примечание", "text")
-        ]
-        
+        # Поля ввода в порядке схемы (SCHEMA)
         self.entries = {}
-        for i, (field, field_type, *options) in enumerate(fields):
+        for i, field_info in enumerate(SCHEMA):
+            field = field_info.name
             # Создаем фрейм для каждой строки
             row_frame = ttk.Frame(scrollable_frame)
             row_frame.grid(row=i, column=0, sticky='ew', padx=5, pady=2)
@@ -157,11 +804,11 @@ class RealEstateApp:
             label = ttk.Label(row_frame, text=field, width=20)
             label.pack(side=tk.LEFT, padx=5)
             
-            if field_type == "combobox":
-                entry = ttk.Combobox(row_frame, values=options[0], state="readonly", width=40)
-            elif field_type == "text":
+            if field_info.widget == "combobox":
+                entry = ttk.Combobox(row_frame, values=field_info.options, state="readonly", width=40)
+            elif field_info.widget == "text":
                 entry = tk.Text(row_frame, height=3, width=40)
-            elif field_type == "date":
+            elif field_info.widget == "date":
                 entry = ttk.Entry(row_frame, width=40)
                 # Устанавливаем текущую дату по умолчанию
                 entry.insert(0, datetime.now().strftime("%d.%m.%Y"))
@@ -171,8 +818,10 @@ class RealEstateApp:
             entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
             self.entries[field] = entry
         
-        # Привязываем событие изменения поля "Комнаты" для автозаполнения "Жилая"
-        self.entries["Комнаты"].bind('<KeyRelease>', self.calculate_living_area)
+        # Вычисляемые поля (жилая площадь по комнатам, цена за м²) и проверка формата
+        # пересчитываются после паузы в наборе, подсказки и замечания - под полями
+        messages_frame, self.form_rules = self.create_form_rules(scrollable_frame, self.entries)
+        messages_frame.grid(row=len(SCHEMA), column=0, sticky='ew', padx=5, pady=2)
         
         # Упаковка canvas и scrollbar
         canvas.pack(side="left", fill="both", expand=True)
@@ -182,42 +831,72 @@ class RealEstateApp:
         image_frame = ttk.Frame(main_input_frame)
         image_frame.pack(side=tk.RIGHT, padx=10)
         
-        # Загрузка и отображение картинки
+        # Загрузка и отображение картинки (уменьшенная копия из кэша)
         try:
-            image_path = "C:\\Users\\Pro\\Desktop\\#abracrocodaber\\Титульная картинка.jpg"
-            if os.path.exists(image_path):
-                image = Image.open(image_path)
-                # Масштабируем изображение до разумного размера
-                image = image.resize((300, 400), Image.Resampling.LANCZOS)
-                self.photo = ImageTk.PhotoImage(image)
+            thumbnail_path = title_thumbnail(self.cache_dir)
+            if thumbnail_path is not None:
+                self.photo = tk.PhotoImage(file=str(thumbnail_path))
                 image_label = ttk.Label(image_frame, image=self.photo)
                 image_label.pack()
             else:
                 # Если изображение не найдено, показываем заглушку
-                placeholder = ttk.Label(image_frame, text="Изображение не найдено\nТитульная картинка.jpg", 
-                                       width=30, height=15, justify=tk.CENTER)
+                placeholder = ttk.Label(image_frame, text=f"Изображение не найдено\n{TITLE_IMAGE_NAME}", 
+                                       width=30, justify=tk.CENTER)
                 placeholder.pack()
+        except ImportError:
+            # Pillow нужен только для пересоздания миниатюры; сами пакеты не ставим
+            placeholder = ttk.Label(image_frame, text="Для титульной картинки нужна библиотека Pillow\n(pip install pillow)", 
+                                   width=30, justify=tk.CENTER)
+            placeholder.pack()
         except Exception as e:
             print(f"Ошибка загрузки изображения: {e}")
             placeholder = ttk.Label(image_frame, text=f"Ошибка загрузки изображения\n{e}", 
-                                   width=30, height=15, justify=tk.CENTER)
+                                   width=30, justify=tk.CENTER)
             placeholder.pack()
         
         # Фрейм для кнопок с декоративными элементами
         button_frame = ttk.Frame(self.root)
         button_frame.pack(pady=10)
         
+        # Кнопки, работающие с базой, включаются после ее загрузки
+        self.data_buttons = []
+        
         # Кнопка "Добавить объект" с домиком
         ttk.Label(button_frame, text="🏠", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Добавить объект", command=self.add_property).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Добавить объект", command=self.add_property))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
         
         # Кнопка "Удалить объект" с домиком
         ttk.Label(button_frame, text="🗑️", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Удалить объект", command=self.delete_property).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Удалить объект", command=self.delete_property))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
         
         # Кнопка "Распечатать" с домиком
         ttk.Label(button_frame, text="📊", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Распечатать", command=self.export_to_excel).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Распечатать", command=self.export_to_excel))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
+        
+        # Кнопка "Импорт" - загрузка объектов из файла партнера
+        ttk.Label(button_frame, text="📥", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Импорт", command=self.import_listings))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
+        
+        # Кнопка "Дубликаты" - отчет о повторно занесенных объектах
+        ttk.Label(button_frame, text="👥", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Дубликаты", command=self.find_all_duplicates))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
+        
+        # Кнопка "Архив" - перенос старых объектов в архив, поиск и восстановление
+        ttk.Label(button_frame, text="🗄️", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Архив", command=self.show_archive))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
+        
+        # Кнопка "Статистика" - сводка по типам объектов, домам и сделкам
+        ttk.Label(button_frame, text="📈", font=("Arial", 14)).pack(side=tk.LEFT, padx=5)
+        self.data_buttons.append(ttk.Button(button_frame, text="Статистика", command=self.show_stats))
+        self.data_buttons[-1].pack(side=tk.LEFT, padx=5)
+        for button in self.data_buttons:
+            button.state(["disabled"])
         
         # Фрейм для таблицы с прокруткой (уменьшенный размер)
         table_frame = ttk.Frame(self.root, relief="solid", borderwidth=2)
@@ -227,9 +906,49 @@ class RealEstateApp:
         table_label = ttk.Label(table_frame, text="База объектов недвижимости", font=("Arial", 12, "bold"))
         table_label.pack(pady=5)
         
+        # Строка поиска по адресу, контакту, телефону, кадастровому номеру и примечанию
+        search_frame = ttk.Frame(table_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        ttk.Label(search_frame, text="🔍 Поиск:").pack(side=tk.LEFT, padx=5)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=50)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind('<KeyRelease>', self.on_search_key)
+        ttk.Button(search_frame, text="Сбросить", command=self.clear_search).pack(side=tk.LEFT, padx=5)
+        self.found_var = tk.StringVar()
+        ttk.Label(search_frame, textvariable=self.found_var).pack(side=tk.LEFT, padx=10)
+        
+        # Панель фильтра: тип объекта, цена, площадь, год постройки, давность занесения
+        filter_frame = ttk.Frame(table_frame)
+        filter_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        self.filter_vars = {}
+        
+        ttk.Label(filter_frame, text="Объект").pack(side=tk.LEFT, padx=(5, 2))
+        self.filter_vars["Объект"] = tk.StringVar()
+        ttk.Combobox(filter_frame, textvariable=self.filter_vars["Объект"], values=[""] + OBJECT_ORDER,
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=2)
+        
+        for field, label in [("Цена", "Цена"), ("Площадь", "Площадь"), ("Год постройки", "Год")]:
+            ttk.Label(filter_frame, text=f"{label} от").pack(side=tk.LEFT, padx=(8, 2))
+            self.filter_vars[(field, "от")] = tk.StringVar()
+            ttk.Entry(filter_frame, textvariable=self.filter_vars[(field, "от")], width=9).pack(side=tk.LEFT)
+            ttk.Label(filter_frame, text="до").pack(side=tk.LEFT, padx=2)
+            self.filter_vars[(field, "до")] = tk.StringVar()
+            ttk.Entry(filter_frame, textvariable=self.filter_vars[(field, "до")], width=9).pack(side=tk.LEFT)
+        
+        ttk.Label(filter_frame, text="Занесены за, дней").pack(side=tk.LEFT, padx=(8, 2))
+        self.filter_vars["Дней"] = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.filter_vars["Дней"], width=5).pack(side=tk.LEFT)
+        
+        ttk.Button(filter_frame, text="Фильтр", command=self.apply_range_filter).pack(side=tk.LEFT, padx=(8, 2))
+        ttk.Button(filter_frame, text="Сбросить", command=self.clear_range_filter).pack(side=tk.LEFT, padx=2)
+        
         # Создаем таблицу с горизонтальной и вертикальной прокруткой
-        # Используем правильный порядок столбцов
-        columns_order = ["Выбор"] + [field[0] for field in fields]
+        # Используем правильный порядок столбцов; лениво загружаемых текстов в таблице нет
+        columns_order = ["Выбор"] + [col for col in COLUMNS if col not in lazy_text_fields()]
+        
+        # Отформатированные строки таблицы (кэш до изменения данных)
+        self.row_formatter = RowFormatter(columns_order[1:])
         self.tree = ttk.Treeview(table_frame, columns=columns_order, show="headings", height=8)
         
         # Настройка стиля для таблицы с границами
@@ -247,6 +966,9 @@ class RealEstateApp:
                        relief="raised",
                        borderwidth=1)
         
+        # Объекты с замечаниями по формату полей (см. check_frame) подсвечиваются
+        self.tree.tag_configure("problem", background="#ffe4e1")
+        
         # Настройка столбцов в правильном порядке
         self.tree.heading("Выбор", text="Выбор")
         self.tree.column("Выбор", width=50, minwidth=50)
@@ -278,37 +1000,69 @@ class RealEstateApp:
         }
         
         for col in columns_order[1:]:  # Пропускаем столбец "Выбор"
-            self.tree.heading(col, text=col)
+            # Щелчок по заголовку - сортировка по возрастанию, повторный - по убыванию
+            self.tree.heading(col, text=col, command=lambda col=col: self.sort_by_column(col))
             width = column_widths.get(col, 100)
             self.tree.column(col, width=width, minwidth=50)
         
         # Увеличиваем ширину для столбцов с длинным текстом
         self.tree.column("Контакт ФИО", width=150, stretch=True)
         self.tree.column("Телефон", width=120, stretch=True)
-        self.tree.column("Примечание", width=200, stretch=True)
+        if "Примечание" in columns_order:
+            self.tree.column("Примечание", width=200, stretch=True)
         self.tree.column("Адрес", width=150, stretch=True)
         self.tree.column("Кадастровый №", width=120, stretch=True)
         
         # Вертикальная прокрутка
         v_scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set)
+        if VIRTUAL_TABLE:
+            # Прокруткой управляет виртуальная таблица
+            self.virtual_table = VirtualTreeview(self.tree, v_scrollbar, self.table_rows, self.row_tags)
+        else:
+            self.virtual_table = None
+            self.tree.configure(yscrollcommand=v_scrollbar.set)
         
         # Горизонтальная прокрутка
         h_scrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
         self.tree.configure(xscrollcommand=h_scrollbar.set)
         
+        # Превью фотографий выбранного объекта справа от таблицы; щелчок - следующее фото
+        preview_frame = ttk.Frame(table_frame, width=PHOTO_PREVIEW_SIZE[0] + 10)
+        preview_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(5, 0))
+        self.preview_label = ttk.Label(preview_frame, text="Нет фото", anchor="center",
+                                       width=PHOTO_PREVIEW_SIZE[0] // 8)
+        self.preview_label.pack(side=tk.TOP, expand=True)
+        self.preview_caption = tk.StringVar()
+        ttk.Label(preview_frame, textvariable=self.preview_caption, foreground="gray").pack(side=tk.TOP)
+        self.preview_label.bind('<Button-1>', self.next_preview_photo)
+        
         # Размещение элементов
         self.tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         
+        # Строка состояния фоновых задач
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
+        self.status_var = tk.StringVar(value="Готово")
+        ttk.Label(status_frame, textvariable=self.status_var).pack(side=tk.LEFT)
+        self.progress = ttk.Progressbar(status_frame, mode="indeterminate", length=150)
+        self.progress.pack(side=tk.RIGHT)
+        
+        # Скрытая строка замеров: время последней операции, показывается по F12
+        self.profile_var = tk.StringVar()
+        self.profile_label = ttk.Label(status_frame, textvariable=self.profile_var, foreground="gray")
+        self.profile_after_id = None
+        self.root.bind("<F12>", self.toggle_profile_readout)
+        
         # Привязываем обработчик клика для чекбоксов
         self.tree.bind('<Button-1>', self.on_tree_click)
         
         # Привязываем двойной клик для редактирования
         self.tree.bind('<Double-1>', self.on_double_click)
         
-        self.update_table()
+        # При выборе строки показываем ее фотографии
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
     
     def on_tree_click(self, event):
         # Определяем, по какому столбцу и элементу был клик
@@ -320,7 +1074,9 @@ class RealEstateApp:
         item = self.tree.identify_row(event.y)
         
         # Если клик был по столбцу "Выбор"
-        if column == "#1" and item:
+        if column == "#1" and item and self.virtual_table is not None:
+            self.virtual_table.toggle(item)
+        elif column == "#1" and item:
             # Получаем текущее состояние
             current_values = self.tree.item(item, 'values')
             if not current_values:
@@ -342,6 +1098,55 @@ class RealEstateApp:
             # Обновляем значения в таблице
             self.tree.item(item, values=tuple(values_list))
     
+    def on_tree_select(self, event=None):
+        item = self.tree.focus()
+        if not item or int(item) == self.preview_id:
+            return
+        problems = self.data_problems.get(int(item))
+        if problems:
+            self.status_var.set(f"ID {item}: " + "; ".join(problems))
+        self.show_listing_photos(int(item))
+    
+    def show_listing_photos(self, row_id):
+        self.preview_id = row_id
+        self.preview_photos = listing_photos(self.filename, row_id)
+        self.preview_index = 0
+        self.show_preview()
+    
+    def show_preview(self):
+        if not self.preview_photos:
+            self.photos.cancel("preview")
+            self.preview_image = None
+            self.preview_label.configure(image="", text="Нет фото")
+            self.preview_caption.set("")
+            return
+        count = len(self.preview_photos)
+        self.preview_caption.set(f"Фото {self.preview_index + 1} из {count}")
+        # Готовая миниатюра из памяти заменит надпись сразу же
+        self.preview_image = None
+        self.preview_label.configure(image="", text="Загрузка...")
+        # Следующее фото готовим заранее, чтобы щелчок показывал его сразу
+        paths = [self.preview_photos[self.preview_index]]
+        if count > 1:
+            paths.append(self.preview_photos[(self.preview_index + 1) % count])
+        self.photos.request("preview", paths, PHOTO_PREVIEW_SIZE, self.on_preview_ready)
+    
+    def on_preview_ready(self, path, data):
+        if not self.preview_photos or path != self.preview_photos[self.preview_index]:
+            return
+        if data is None:
+            self.preview_image = None
+            self.preview_label.configure(image="", text="Фото не открывается")
+            return
+        # Ссылку на картинку нужно хранить, иначе Tk ее сразу удалит
+        self.preview_image = tk.PhotoImage(data=data)
+        self.preview_label.configure(image=self.preview_image, text="")
+    
+    def next_preview_photo(self, event=None):
+        if len(self.preview_photos) > 1:
+            self.preview_index = (self.preview_index + 1) % len(self.preview_photos)
+            self.show_preview()
+    
     def on_double_click(self, event):
         # Получаем выбранный элемент
         item = self.tree.selection()
@@ -349,51 +1154,47 @@ class RealEstateApp:
             return
             
         item = item[0]
-        values = self.tree.item(item, 'values')
+        row_id = int(item)
+        if not self.store.missing:
+            self.edit_property(item, self.listing_values(row_id))
+            return
+        
+        # Длинные тексты еще не загружены (LAZY_TEXT_LOADING): читаем их только для этого объекта
+        def on_fields(frame):
+            if (self.df[ID_COLUMN].to_numpy() == row_id).any():
+                self.edit_property(item, self.listing_values(row_id, frame))
         
-        # Пропускаем столбец с чекбоксом
-        if len(values) > 1:
-            self.edit_property(item, values[1:])
+        self.jobs.submit(
+            "Загрузка объекта",
+            lambda: self.store.read_fields([row_id]),
+            on_fields,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при загрузке объекта: {str(e)}")
+        )
+    
+    def listing_values(self, row_id, frame=None):
+        # Значения полей объекта из DataFrame по ID, без переносов строк из таблицы;
+        # frame - не загруженные в df поля объекта (ListingStore.read_fields)
+        index = row_position(self.df, row_id)
+        row = self.df.iloc[index:index + 1]
+        if frame is not None:
+            row = row.assign(**self.store.lazy_row(row_id, frame))
+        return format_rows(row, COLUMNS, wrap=False)[0]
     
     def edit_property(self, item, values):
         # Создаем окно редактирования
         edit_window = tk.Toplevel(self.root)
         edit_window.title("Редактирование объекта")
-        edit_window.geometry("600x700")
+        edit_window.geometry("600x850")
         edit_window.transient(self.root)
         edit_window.grab_set()
         
-        # Получаем индекс объекта в DataFrame
-        index = self.tree.index(item)
-        
-        # Создаем поля для редактирования
-        fields = [
-            ("Дата занесения в базу", "date"),
-            ("Объект", "combobox", ["комната", "1-ккв", "2-ккв", "3-ккв", "4-ккв", "дача", "дом", "участок"]),
-            ("Адрес", "entry"),
-            ("Кадастровый №", "entry"),
-            ("Цена", "entry"),
-            ("Площадь", "entry"),
-            ("Комнаты", "entry"),
-            ("Жилая", "entry"),
-            ("Кухня", "entry"),
-            ("Санузел", "combobox", ["раздельный", "совмещенный"]),
-            ("Этаж/этажность", "entry"),
-            ("Участок", "entry"),
-            ("Дом", "combobox", ["нет", "монолит", "панельный", "кирпичный", "бревно", "каркасный"]),
-            ("Высота потолков", "entry"),
-            ("Год постройки", "entry"),
-            ("Сделка", "combobox", ["прямая продажа", "альтернатива"]),
-            ("Основание владения", "combobox", ["ДКП", "ДДУ", "Наследство", "Дарение", "Приватизация"]),
-            ("Срок владения", "entry"),
-            ("Количество собственников", "entry"),
-            ("Контакт ФИО", "entry"),
-            ("Телефон", "entry"),
-            ("Примечание", "text")
-        ]
+        # Идентификатор строки таблицы - это ID объекта
+        row_id = int(item)
         
+        # Создаем поля для редактирования в порядке схемы (SCHEMA)
         edit_entries = {}
-        for i, (field, field_type, *options) in enumerate(fields):
+        for i, field_info in enumerate(SCHEMA):
+            field = field_info.name
             # Создаем фрейм для каждой строки
             row_frame = ttk.Frame(edit_window)
             row_frame.pack(fill=tk.X, padx=10, pady=2)
@@ -401,19 +1202,19 @@ class RealEstateApp:
             label = ttk.Label(row_frame, text=field, width=20)
             label.pack(side=tk.LEFT, padx=5)
             
-            if field_type == "combobox":
-                entry = ttk.Combobox(row_frame, values=options[0], state="readonly", width=40)
+            if field_info.widget == "combobox":
+                entry = ttk.Combobox(row_frame, values=field_info.options, state="readonly", width=40)
                 if i < len(values):
                     # Убираем "соток" из значения участка для редактирования
                     value = values[i]
                     if field == "Участок" and "соток" in str(value):
                         value = value.replace(" соток", "")
                     entry.set(value)
-            elif field_type == "text":
+            elif field_info.widget == "text":
                 entry = tk.Text(row_frame, height=3, width=40)
                 if i < len(values):
                     entry.insert("1.0", values[i])
-            elif field_type == "date":
+            elif field_info.widget == "date":
                 entry = ttk.Entry(row_frame, width=40)
                 if i < len(values):
                     # Для даты форматируем в строку, если это объект datetime
@@ -433,177 +1234,465 @@ class RealEstateApp:
             entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
             edit_entries[field] = entry
         
-        # Привязываем событие изменения поля "Комнаты" для автозаполнения "Жилая"
-        edit_entries["Комнаты"].bind('<KeyRelease>', lambda e: self.calculate_living_area_edit(edit_entries))
+        # Те же правила, что и в форме добавления; для текущих значений - сразу
+        messages_frame, form_rules = self.create_form_rules(edit_window, edit_entries)
+        messages_frame.pack(fill=tk.X, padx=10)
+        form_rules.run()
+        
+        # Лента миниатюр фотографий объекта
+        self.create_photo_strip(edit_window, row_id)
         
         # Фрейм для кнопок
         button_frame = ttk.Frame(edit_window)
         button_frame.pack(pady=10)
         
         # Кнопка "ОК"
-        ttk.Button(button_frame, text="ОК", command=lambda: self.save_edit(index, edit_entries, edit_window)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="ОК", command=lambda: self.save_edit(row_id, edit_entries, edit_window)).pack(side=tk.LEFT, padx=5)
         
         # Кнопка "Отмена"
         ttk.Button(button_frame, text="Отмена", command=edit_window.destroy).pack(side=tk.LEFT, padx=5)
     
-    def calculate_living_area_edit(self, entries):
-        # Автоматическое вычисление жилой площади в окне редактирования
-        rooms_value = entries["Комнаты"].get()
-        if rooms_value:
-            try:
-                # Разделяем значения по '+' и суммируем
-                numbers = [float(x.strip()) for x in rooms_value.split('+')]
-                total = sum(numbers)
-                entries["Жилая"].delete(0, tk.END)
-                entries["Жилая"].insert(0, str(total))
-            except ValueError:
-                # Если не удалось преобразовать в числа, оставляем поле пустым
-                pass
+    def create_photo_strip(self, edit_window, row_id):
+        photo_frame = ttk.LabelFrame(edit_window, text="Фотографии (щелчок - открыть, правый щелчок - удалить)")
+        photo_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        canvas = tk.Canvas(photo_frame, height=PHOTO_STRIP_SIZE[1] + 10, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(photo_frame, orient=tk.HORIZONTAL, command=canvas.xview)
+        canvas.configure(xscrollcommand=scrollbar.set)
+        strip = ttk.Frame(canvas)
+        canvas.create_window((0, 0), window=strip, anchor="nw")
+        strip.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.pack(side=tk.TOP, fill=tk.X)
+        scrollbar.pack(side=tk.TOP, fill=tk.X)
+        
+        ttk.Button(photo_frame, text="Добавить фото",
+                   command=lambda: self.add_photos(edit_window, strip, row_id)).pack(side=tk.LEFT, pady=5)
+        
+        def on_destroy(event):
+            # Миниатюры нужны, только пока окно правки открыто
+            if event.widget is edit_window:
+                self.photos.cancel("strip")
+        
+        edit_window.bind('<Destroy>', on_destroy, add="+")
+        self.fill_photo_strip(strip, row_id)
+    
+    def fill_photo_strip(self, strip, row_id):
+        for child in strip.winfo_children():
+            child.destroy()
+        labels = {}
+        strip.images = []
+        for path in listing_photos(self.filename, row_id):
+            label = ttk.Label(strip, text=path.name, width=PHOTO_STRIP_SIZE[0] // 8, anchor="center")
+            label.pack(side=tk.LEFT, padx=2)
+            label.bind('<Button-1>', lambda e, path=path: open_file(path))
+            label.bind('<Button-3>', lambda e, path=path: self.remove_photo(strip, row_id, path))
+            labels[path] = label
+        if not labels:
+            ttk.Label(strip, text="Фотографий нет").pack(side=tk.LEFT, padx=5)
+        
+        def on_ready(path, data):
+            label = labels[path]
+            if data is None or not label.winfo_exists():
+                return
+            image = tk.PhotoImage(data=data)
+            strip.images.append(image)
+            label.configure(image=image, text="", width=0)
+        
+        self.photos.request("strip", list(labels), PHOTO_STRIP_SIZE, on_ready)
+    
+    def add_photos(self, edit_window, strip, row_id):
+        files = filedialog.askopenfilenames(
+            parent=edit_window,
+            title="Выберите фотографии",
+            filetypes=[("Изображения", " ".join(f"*{ext}" for ext in sorted(PHOTO_EXTENSIONS))),
+                       ("Все файлы", "*.*")]
+        )
+        if not files:
+            return
+        
+        def on_done(added):
+            if strip.winfo_exists():
+                self.fill_photo_strip(strip, row_id)
+            if self.preview_id == row_id:
+                self.show_listing_photos(row_id)
+        
+        # Большие снимки копируются в фоне
+        self.jobs.submit(
+            "Копирование фото",
+            lambda: add_listing_photos(self.filename, row_id, files),
+            on_done,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при добавлении фото: {str(e)}")
+        )
     
-    def save_edit(self, index, edit_entries, edit_window):
+    def remove_photo(self, strip, row_id, path):
+        if not messagebox.askyesno("Удаление фото", f"Удалить фото {path.name}?", parent=strip.winfo_toplevel()):
+            return
+        try:
+            path.unlink()
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Ошибка при удалении фото: {str(e)}")
+            return
+        self.fill_photo_strip(strip, row_id)
+        if self.preview_id == row_id:
+            self.show_listing_photos(row_id)
+    
+    @profiled("save_edit")
+    def save_edit(self, row_id, edit_entries, edit_window):
         try:
             # Собираем данные из полей редактирования
-            updated_row = {}
+            values = {}
             for field, entry in edit_entries.items():
                 if isinstance(entry, tk.Text):
-                    value = entry.get("1.0", tk.END).strip()
+                    values[field] = entry.get("1.0", tk.END).strip()
                 else:
-                    value = entry.get()
-                
-                # Обработка специальных полей
-                if field == "Участок" and value and "соток" not in value:
-                    value = f"{value} соток"
-                
-                # Для даты преобразуем в datetime
-                if field == "Дата занесения в базу" and value:
-                    try:
-                        value = pd.to_datetime(value, format='%d.%m.%Y', errors='coerce')
-                    except:
-                        value = pd.NaT  # Если не удалось преобразовать
-                
-                updated_row[field] = value
+                    values[field] = entry.get()
             
-            # Обновляем строку в DataFrame
-            for field, value in updated_row.items():
-                self.df.at[index, field] = value
+            # Те же правила и проверки, что и при добавлении
+            updated_row = self.check_form_values(values)
+            if updated_row is None:
+                return
             
-            # Сохраняем изменения
-            self.save_data()
-            self.update_table()
+            # Предупреждаем, если такой объект уже занесен под другим ID
+            if not self.confirm_duplicates(updated_row, row_id, "Все равно сохранить?"):
+                return
             
-            # Закрываем окно редактирования
-            edit_window.destroy()
+            # Обновляем строку в DataFrame (значения приводятся к типам столбцов)
+            change = self.store.edit(row_id, updated_row)
+            self.update_table(change)
             
-            messagebox.showinfo("Успех", "Объект успешно отредактирован!")
+            def on_saved(result):
+                # Закрываем окно редактирования
+                edit_window.destroy()
+                messagebox.showinfo("Успех", "Объект успешно отредактирован!")
+            
+            self.commit_change(
+                change,
+                on_saved,
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при редактировании: {str(e)}")
+            )
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при редактировании: {str(e)}")
     
+    def check_form_values(self, values):
+        # Значения формы по правилам normalize_listings; None, если есть ошибки ввода
+        rows, errors = normalize_listings(pd.DataFrame([values]))
+        if errors[0]:
+            messagebox.showerror("Ошибка ввода", "Исправьте значения полей:\n" + "\n".join(errors[0]))
+            return None
+        # Замечания по формату (телефон, кадастровый номер) не мешают сохранить объект
+        problems = check_listings(pd.DataFrame([values])).get(0)
+        if problems and not messagebox.askyesno(
+            "Проверка формата", "Замечания по полям:\n" + "\n".join(problems) + "\n\nВсе равно сохранить?"
+        ):
+            return None
+        return rows.iloc[0].to_dict()
+    
+    def confirm_duplicates(self, values, exclude_id, question):
+        # Проверка по индексу дубликатов; True - можно сохранять
+        if self.duplicate_index is None:
+            self.duplicate_index = DuplicateIndex()
+            self.duplicate_index.build(self.df)
+        matches = self.duplicate_index.find(values, exclude_id)
+        if not matches:
+            return True
+        
+        lines = []
+        for field, ids in matches.items():
+            lines.append(f"{field}:")
+            for row_id in ids[:5]:
+                address = self.df.at[row_position(self.df, row_id), "Адрес"]
+                lines.append(f"    ID {row_id} - {to_journal_value(address)}")
+            if len(ids) > 5:
+                lines.append(f"    и еще {len(ids) - 5}")
+        return messagebox.askyesno(
+            "Возможный дубликат",
+            "Похожие объекты уже есть в базе:\n" + "\n".join(lines) + f"\n\n{question}"
+        )
+    
+    @profiled("add_property")
     def add_property(self):
         try:
-            new_row = {}
+            values = {}
             for field, entry in self.entries.items():
                 if isinstance(entry, tk.Text):
-                    value = entry.get("1.0", tk.END).strip()
+                    values[field] = entry.get("1.0", tk.END).strip()
                 else:
-                    value = entry.get()
-                
-                # Обработка специальных полей
-                if field == "Участок" and value:
-                    value = f"{value} соток"
-                elif field == "Дата занесения в базу" and not value:
-                    # Устанавливаем текущую дату, если поле пустое
-                    value = datetime.now().strftime("%d.%m.%Y")
-                
-                # Для даты преобразуем в datetime
-                if field == "Дата занесения в базу" and value:
-                    try:
-                        value = pd.to_datetime(value, format='%d.%m.%Y', errors='coerce')
-                    except:
-                        value = pd.NaT  # Если не удалось преобразовать
-                
-                new_row[field] = value
+                    values[field] = entry.get()
             
-            # Добавляем новую строку в DataFrame
-            self.df = pd.concat([self.df, pd.DataFrame([new_row])], ignore_index=True)
-            self.save_data()
-            self.update_table()
+            # Те же правила, что и при импорте: "соток", дата DD.MM.YYYY, жилая по комнатам,
+            # значения полей со списком и числовых полей проверяются по схеме
+            new_row = self.check_form_values(values)
+            if new_row is None:
+                return
+            
+            # Предупреждаем, если такой объект уже есть в базе (сверяются нормализованные
+            # значения, как при редактировании)
+            if not self.confirm_duplicates(new_row, None, "Все равно добавить?"):
+                return
+            
+            # Добавляем новую строку в DataFrame (значения приводятся к типам столбцов)
+            change = self.store.add(new_row)
+            self.update_table(change)
             self.clear_form()
-            messagebox.showinfo("Успех", "Объект успешно добавлен!")
+            self.commit_change(
+                change,
+                lambda result: messagebox.showinfo("Успех", "Объект успешно добавлен!"),
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при добавлении: {str(e)}")
+            )
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при добавлении: {str(e)}")
     
+    def checked_ids(self):
+        if self.virtual_table is not None:
+            # Отмеченные строки хранит виртуальная таблица
+            return sorted(self.virtual_table.checked)
+        # Находим ID отмеченных строк
+        ids = []
+        for item in self.tree.get_children():
+            values = self.tree.item(item, 'values')
+            if values and values[0] == "☑":
+                ids.append(int(item))
+        return ids
+    
+    @profiled("delete_property")
     def delete_property(self):
         try:
-            # Получаем все элементы таблицы
-            items = self.tree.get_children()
-            indices_to_delete = []
+            ids_to_delete = self.checked_ids()
             
-            # Находим индексы отмеченных строк
-            for i, item in enumerate(items):
-                values = self.tree.item(item, 'values')
-                if values and values[0] == "☑":
-                    indices_to_delete.append(i)
-            
-            if not indices_to_delete:
+            if not ids_to_delete:
                 messagebox.showwarning("Предупреждение", "Не выбрано ни одного объекта для удаления.")
                 return
             
             # Подтверждение удаления
             confirm = messagebox.askyesno(
                 "Подтверждение удаления", 
-                f"Вы уверены, что хотите удалить {len(indices_to_delete)} объектов?"
+                f"Вы уверены, что хотите удалить {len(ids_to_delete)} объектов?"
             )
             
             if not confirm:
                 return
             
-            # Удаляем строки из DataFrame (в обратном порядке, чтобы индексы не сдвигались)
-            for index in sorted(indices_to_delete, reverse=True):
-                self.df = self.df.drop(index).reset_index(drop=True)
+            # Удаляем все отмеченные строки одной маской и сохраняем один раз
+            change = self.store.delete(ids_to_delete)
+            self.update_table(change)
             
-            # Сохраняем изменения и обновляем таблицу
-            self.save_data()
-            self.update_table()
+            def on_saved(result):
+                # Фотографии удаленных объектов больше не нужны
+                remove_listing_photos(self.filename, ids_to_delete)
+                if self.preview_id in ids_to_delete:
+                    self.show_listing_photos(self.preview_id)
+                messagebox.showinfo("Успех", f"Удалено объектов: {len(ids_to_delete)}")
             
-            messagebox.showinfo("Успех", f"Удалено объектов: {len(indices_to_delete)}")
+            self.commit_change(
+                change,
+                on_saved,
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при удаления: {str(e)}")
+            )
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при удаления: {str(e)}")
     
-    def update_table(self):
-        # Очищаем таблицу
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Заполняем таблицу данными в правильном порядке
-        for _, row in self.df.iterrows():
-            # Создаем список значений в правильном порядке
-            values = ["☐"]  # Чекбокс
-            
-            for field in self.entries.keys():
-                if field in row:
-                    # Для полей с длинным текстом добавляем переносы
-                    value = row[field]
-                    
-                    # Для даты форматируем в строку
-                    if field == 'Дата занесения в базу' and pd.notna(value):
-                        try:
-                            value = value.strftime('%d.%m.%Y')
-                        except:
-                            value = str(value)
-                    else:
-                        value = str(value) if pd.notna(value) else ""
-                    
-                    if field in ["Контакт ФИО", "Телефон", "Примечание", "Адрес", "Кадастровый №"] and len(value) > 20:
-                        # Добавляем переносы каждые 20 символов
-                        value = '\n'.join([value[i:i+20] for i in range(0, len(value), 20)])
-                    values.append(value)
-                else:
-                    values.append("")
+    def on_search_key(self, event=None):
+        # Поиск запускается после паузы в наборе, а не на каждую клавишу
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(200, self.apply_filters)
+    
+    def clear_search(self):
+        self.search_var.set("")
+        self.apply_filters()
+    
+    def apply_range_filter(self):
+        # Читаем панель фильтра в словарь {поле: (от, до)} и "Объект"
+        range_filter = {}
+        try:
+            for field in ["Цена", "Площадь", "Год постройки"]:
+                low = self.filter_vars[(field, "от")].get().replace(" ", "").replace(",", ".")
+                high = self.filter_vars[(field, "до")].get().replace(" ", "").replace(",", ".")
+                if low or high:
+                    range_filter[field] = (float(low) if low else None, float(high) if high else None)
+            days = self.filter_vars["Дней"].get().strip()
+            if days:
+                today = (pd.Timestamp(datetime.now().date()) - pd.Timestamp(0)).days
+                range_filter["Дата занесения в базу"] = (today - int(days), None)
+        except ValueError:
+            messagebox.showwarning("Предупреждение", "В фильтре должны быть числа.")
+            return
+        if self.filter_vars["Объект"].get():
+            range_filter["Объект"] = self.filter_vars["Объект"].get()
+        
+        self.range_filter = range_filter
+        self.apply_filters()
+    
+    def clear_range_filter(self):
+        for var in self.filter_vars.values():
+            var.set("")
+        self.range_filter = {}
+        self.apply_filters()
+    
+    def filtered_positions(self):
+        # Номера строк DataFrame, подходящих под поиск и фильтр (None - фильтров нет)
+        query = self.search_var.get().strip()
+        if not query and not self.range_filter:
+            return None
+        
+        # Битовая маска по ID: пересечение результатов поиска и фильтра
+        ids = self.df[ID_COLUMN].to_numpy(dtype='int64')
+        size = int(ids.max()) + 1 if len(ids) else 1
+        bitmap = np.ones(size, dtype=bool)
+        
+        if query:
+            if self.store.missing:
+                # Длинные тексты еще не загружены: пока ищем по остальным полям,
+                # после загрузки таблица построится заново уже с ними
+                self.with_lazy_fields(self.apply_filters)
+            if self.search_index is None:
+                self.search_index = SearchIndex()
+                self.search_index.build(self.df)
+            found = np.zeros(size, dtype=bool)
+            found[list(self.search_index.search(query))] = True
+            bitmap &= found
+        
+        if self.range_filter:
+            if self.range_index is None:
+                self.range_index = RangeFilterIndex()
+                self.range_index.build(self.df)
+            ranges = {field: value for field, value in self.range_filter.items() if field != "Объект"}
+            bitmap &= self.range_index.query(ranges, self.range_filter.get("Объект"), size)
+        
+        return bitmap[ids].nonzero()[0]
+    
+    def apply_filters(self):
+        self.search_after_id = None
+        if self.df is None:
+            # База еще загружается
+            return
+        if self.virtual_table is not None:
+            # Новый набор строк показываем с начала
+            self.virtual_table.top = 0
+        self.refresh_table()
+    
+    def table_rows(self, start=0, stop=None):
+        # Пары (ID, значения) для строк таблицы [start:stop], без чекбокса
+        rows = self.row_formatter.get(self.df)
+        ids = self.row_formatter.ids
+        if self.view_positions is None:
+            return list(zip(ids[start:stop], rows[start:stop]))
+        return [(ids[position], rows[position]) for position in self.view_positions[start:stop]]
+    
+    @profiled("update_table")
+    def update_table(self, change=None):
+        # change - запись об изменении ("add", "edit", "delete"), как в журнале;
+        # без нее таблица строится заново
+        self.data_version += 1
+        if change is None:
+            self.row_formatter.invalidate()
+            self.sort_keys.invalidate()
+            self.search_index = None
+            self.range_index = None
+            self.duplicate_index = None
+            self.portfolio = None
+            self.prepare_data_check()
+            if self.stats_window is not None:
+                self.prepare_portfolio()
+        else:
+            self.row_formatter.apply(change, self.df)
+            self.sort_keys.apply(change, self.df)
+            if self.search_index is not None:
+                self.search_index.apply(change, self.df)
+            if self.range_index is not None:
+                self.range_index.apply(change, self.df)
+            if self.duplicate_index is not None:
+                self.duplicate_index.apply(change, self.df)
+            self.update_data_problems(change)
+            if self.portfolio is not None:
+                self.portfolio.apply(change, self.df)
+                self.refresh_stats()
+        self.refresh_table(change)
+    
+    def sorted_positions(self, positions):
+        # Номера строк в порядке выбранной сортировки; positions - строки после фильтров
+        if self.sort_column is None:
+            return positions
+        order = self.sort_keys.order(self.df, self.sort_column, self.sort_descending)
+        if positions is None:
+            return order
+        shown = np.zeros(len(self.df), dtype=bool)
+        shown[positions] = True
+        return order[shown[order]]
+    
+    @profiled("sort_table")
+    def sort_by_column(self, column):
+        if self.df is None:
+            return
+        if column == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        
+        # Стрелка в заголовке показывает столбец и направление сортировки
+        # (столбцы таблицы - те же, что у row_formatter: без лениво загружаемых текстов)
+        for col in self.row_formatter.columns:
+            arrow = (" ▼" if self.sort_descending else " ▲") if col == self.sort_column else ""
+            self.tree.heading(col, text=col + arrow)
+        
+        if self.virtual_table is not None:
+            self.virtual_table.top = 0
+            self.refresh_table()
+            return
+        
+        # Строки уже в таблице: только переставляем их, значения не пересчитываются
+        self.view_positions = self.sorted_positions(self.filtered_positions())
+        for index, (row_id, values) in enumerate(self.table_rows()):
+            self.tree.move(str(row_id), "", index)
+    
+    def refresh_table(self, change=None):
+        # При активном поиске пересчитываем набор строк и перерисовываем таблицу
+        filtered = self.filtered_positions()
+        self.view_positions = self.sorted_positions(filtered)
+        if filtered is not None:
+            self.found_var.set(f"Найдено: {len(filtered)} из {len(self.df)}")
+            change = None
+        else:
+            self.found_var.set("")
+        
+        if self.virtual_table is not None:
+            # В виртуальном режиме перерисовывается только видимое окно
+            count = len(self.df) if self.view_positions is None else len(self.view_positions)
+            self.virtual_table.set_count(count, change)
+            return
+        
+        if change is None:
+            # Очищаем таблицу
+            children = self.tree.get_children()
+            if children:
+                self.tree.delete(*children)
             
-            self.tree.insert("", tk.END, values=values)
+            # Заполняем таблицу данными в правильном порядке, ID объекта - идентификатор строки
+            for row_id, values in self.table_rows():
+                self.tree.insert("", tk.END, iid=str(row_id), values=("☐",) + values, tags=self.row_tags(row_id))
+            return
+        
+        op = change["op"]
+        if op in ("add", "edit"):
+            index = row_position(self.df, change["id"])
+            item = str(change["id"])
+            values = self.row_formatter.get(self.df)[index]
+            if op == "add":
+                # Новая строка дописывается в конец
+                self.tree.insert("", tk.END, iid=item, values=("☐",) + values, tags=self.row_tags(change["id"]))
+            else:
+                # Обновляем одну строку, сохраняя состояние чекбокса
+                mark = self.tree.item(item, 'values')[0]
+                self.tree.item(item, values=(mark,) + values, tags=self.row_tags(change["id"]))
+            if self.view_positions is not None:
+                # При сортировке строка встает на свое место в порядке
+                self.tree.move(item, "", int(np.flatnonzero(self.view_positions == index)[0]))
+        elif op == "delete":
+            self.tree.delete(*[str(row_id) for row_id in change["ids"]])
     
     def clear_form(self):
         for field, entry in self.entries.items():
@@ -614,104 +1703,297 @@ class RealEstateApp:
                 # Для даты устанавливаем текущую дату по умолчанию
                 if field == "Дата занесения в базу":
                     entry.insert(0, datetime.now().strftime("%d.%m.%Y"))
+        self.form_rules.run()
     
     def export_to_excel(self):
+        # В выгрузке есть примечания - не загруженные еще тексты сначала дочитываем
+        self.with_lazy_fields(self.start_export)
+    
+    def start_export(self):
         try:
-            # Создаем копию данных для экспорта
-            export_df = self.df.copy()
-            
-            # Преобразуем даты в строку для Excel
-            if 'Дата занесения в базу' in export_df.columns:
-                export_df['Дата занесения в базу'] = export_df['Дата занесения в базу'].dt.strftime('%d.%m.%Y')
-            
-            # Сортируем по объекту в заданном порядке
-            order = ["комната", "1-ккв", "2-ккв", "3-ккв", "4-ккв", "дача", "дом", "участок"]
-            export_df['Объект'] = pd.Categorical(export_df['Объект'], categories=order, ordered=True)
-            export_df = export_df.sort_values('Объект')
-            
-            # Переименовываем столбцы согласно требованиям
-            column_mapping = {
-                "Объект": "Объект",
-                "Адрес": "адрес",
-                "Кадастровый №": "кадастровый №",
-                "Цена": "цена",
-                "Площадь": "S",
-                "Комнаты": "комнаты",
-                "Жилая": "жил",
-                "Кухня": "Кух",
-                "Санузел": "с/у",
-                "Этаж/этажность": "этаж",
-                "Участок": "участок",
-                "Дом": "дом",
-                "Год постройки": "год",
-                "Контакт ФИО": "контакт",
-                "Телефон": "телефон",
-                "Примечание": "ВАЖНО!"
-            }
-            
-            # Оставляем только нужные столбцы и переименовываем их
-            export_df = export_df.rename(columns=column_mapping)
-            columns_to_export = list(column_mapping.values())
-            # Убедимся, что все столбцы существуют
-            existing_columns = [col for col in columns_to_export if col in export_df.columns]
-            export_df = export_df[existing_columns]
-            
             # Сохраняем в Excel с форматированием
-            documents_path = Path.home() / "Documents"
-            excel_filename = documents_path / "real_estate_export.xlsx"
-            
-            # Используем ExcelWriter для настройки форматирования с параметром nan_inf_to_errors
-            with pd.ExcelWriter(excel_filename, 
-                              engine='xlsxwriter',
-                              engine_kwargs={'options': {'nan_inf_to_errors': True}}) as writer:  # ✅ Ключевое исправление
-                export_df.to_excel(writer, index=False, sheet_name='Недвижимость')
-                
-                # Получаем workbook и worksheet
-                workbook = writer.book
-                worksheet = writer.sheets['Недвижимость']
-                
-                # Настраиваем форматирование
-                # 1. Устанавливаем альбомную ориентацию
-                worksheet.set_landscape()
-                
-                # 2. Устанавливаем масштаб для размещения на одном листе
-                worksheet.fit_to_pages(1, 1)  # 1 страница в ширину, 1 в высоту
-                
-                # 3. Создаем форматы для ячеек
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'align': 'center',
-                    'border': 1
-                })
-                
-                cell_format = workbook.add_format({
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'border': 1
-                })
-                
-                # 4. Применяем форматы к заголовкам
-                for col_num, value in enumerate(export_df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                
-                # 5. Применяем форматы к данным
-                for row_num in range(1, len(export_df) + 1):
-                    for col_num in range(len(export_df.columns)):
-                        worksheet.write(row_num, col_num, export_df.iloc[row_num-1, col_num], cell_format)
-                
-                # 6. Настраиваем ширину столбцов под содержимое
-                for i, column in enumerate(export_df.columns):
-                    column_width = max(export_df[column].astype(str).map(len).max(), len(column)) + 2
-                    worksheet.set_column(i, i, column_width)
+            excel_filename = Path(self.filename).parent / EXPORT_NAME
             
-            messagebox.showinfo("Успех", f"Данные экспортированы в {excel_filename}")
+            # Данные для выгрузки готовим сразу, сам файл пишется в фоне (замер "export_to_excel")
+            export_df = export_frame(self.df)
+            self.jobs.submit(
+                "Выгрузка в Excel",
+                lambda: PROFILER.call("export_to_excel", write_excel_export, export_df, excel_filename,
+                                      rows=lambda result: len(export_df)),
+                lambda result: messagebox.showinfo("Успех", f"Данные экспортированы в {excel_filename}"),
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}")
+            )
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}")
+    
+    def import_listings(self):
+        # Импорт объектов из CSV/XLSX: файл разбирается в фоне,
+        # затем все строки добавляются одной записью в базу и одним обновлением таблицы
+        path = filedialog.askopenfilename(
+            title="Импорт объектов",
+            filetypes=[("Таблицы CSV и Excel", "*.csv *.xlsx"), ("Все файлы", "*.*")]
+        )
+        if not path:
+            return
+        
+        report_path = Path(self.filename).parent / IMPORT_REPORT_NAME
+        self.jobs.submit(
+            "Импорт",
+            lambda: read_import_file(path, report_path),
+            self.finish_import,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при импорте: {str(e)}")
+        )
+    
+    def finish_import(self, result):
+        rows, error_count, skipped, report_file = result
+        if len(rows):
+            change = self.store.add_rows(rows)
+            self.update_table()
+            self.commit_change(
+                change,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Ошибка при сохранении импорта: {str(e)}")
+            )
+        
+        message = f"Импортировано объектов: {len(rows)}"
+        if error_count:
+            message += f"\nСтрок с ошибками (не импортированы): {error_count}"
+        if skipped:
+            message += "\nПропущены столбцы: " + ", ".join(skipped)
+        if report_file is not None:
+            message += f"\nОтчет: {report_file}"
+        if error_count:
+            messagebox.showwarning("Импорт", message)
+        else:
+            messagebox.showinfo("Импорт", message)
+    
+    def show_archive(self):
+        # Окно архива: перенос отмеченных или старых объектов, поиск по архиву, восстановление.
+        # Файлы архива читаются только при поиске
+        window = tk.Toplevel(self.root)
+        window.title("Архив объектов")
+        window.geometry("900x500")
+        
+        move_frame = ttk.Frame(window)
+        move_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(move_frame, text="Перенести отмеченные",
+                   command=lambda: self.archive_listings(self.checked_ids())).pack(side=tk.LEFT, padx=5)
+        age_var = tk.StringVar(value=str(ARCHIVE_AGE_DAYS))
+        ttk.Label(move_frame, text="или занесенные больше").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(move_frame, textvariable=age_var, width=6).pack(side=tk.LEFT)
+        ttk.Label(move_frame, text="дней назад").pack(side=tk.LEFT, padx=5)
+        
+        def archive_old():
+            try:
+                days = int(age_var.get())
+            except ValueError:
+                messagebox.showerror("Ошибка ввода", "Укажите число дней", parent=window)
+                return
+            self.archive_listings(self.store.stale_ids(days))
+        
+        ttk.Button(move_frame, text="Перенести", command=archive_old).pack(side=tk.LEFT, padx=5)
+        
+        search_frame = ttk.Frame(window)
+        search_frame.pack(fill=tk.X, padx=10, pady=5)
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(search_frame, textvariable=query_var, width=40)
+        query_entry.pack(side=tk.LEFT, padx=5)
+        result_var = tk.StringVar()
+        
+        columns = [ID_COLUMN, "Дата занесения в базу", "Объект", "Адрес", "Цена", "Контакт ФИО", "Телефон"]
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=15)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=60 if col == ID_COLUMN else 120)
+        
+        def search():
+            query = query_var.get()
+            
+            def show(found):
+                children = tree.get_children()
+                if children:
+                    tree.delete(*children)
+                for row_id, values in zip(found[ID_COLUMN].tolist(), format_rows(found, columns[1:], wrap=False)):
+                    tree.insert("", tk.END, iid=str(row_id), values=(row_id,) + values)
+                result_var.set(f"Найдено в архиве: {len(found)}")
+            
+            self.jobs.submit(
+                "Поиск в архиве",
+                lambda: self.store.archive.search(query),
+                show,
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при чтении архива: {str(e)}")
+            )
+        
+        def restore():
+            item = tree.focus()
+            if not item:
+                messagebox.showwarning("Предупреждение", "Выберите объект в списке архива.", parent=window)
+                return
+            
+            def on_restored():
+                if tree.exists(item):
+                    tree.delete(item)
+            
+            self.restore_listing(int(item), on_restored)
+        
+        query_entry.bind('<Return>', lambda e: search())
+        ttk.Button(search_frame, text="Найти в архиве", command=search).pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_frame, text="Восстановить", command=restore).pack(side=tk.LEFT, padx=5)
+        ttk.Label(search_frame, textvariable=result_var).pack(side=tk.LEFT, padx=10)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+    
+    def archive_listings(self, ids):
+        if not ids:
+            messagebox.showwarning("Предупреждение", "Нет объектов для переноса в архив.")
+            return
+        if not messagebox.askyesno("Архив", f"Перенести в архив {len(ids)} объектов?"):
+            return
+        # В архив строки попадают со всеми полями
+        self.with_lazy_fields(lambda: self.move_to_archive(ids))
+    
+    def move_to_archive(self, ids):
+        # Сначала строки записываются в архив (в фоне, замер "archive_listings"), потом
+        # удаляются из базы: при сбое объект может оказаться в обоих местах, но не потеряется
+        rows = self.store.archive_rows(ids)
+        
+        def on_archived(result):
+            change = self.store.delete(rows[ID_COLUMN].tolist())
+            self.update_table(change)
+            self.commit_change(
+                change,
+                lambda result: messagebox.showinfo("Архив", f"Перенесено в архив: {len(rows)}"),
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при переносе в архив: {str(e)}")
+            )
+        
+        self.jobs.submit(
+            "Перенос в архив",
+            lambda: PROFILER.call("archive_listings", self.store.archive.add, rows, rows=lambda result: len(rows)),
+            on_archived,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при переносе в архив: {str(e)}")
+        )
+    
+    def restore_listing(self, row_id, on_done=None):
+        # Восстановление одного объекта: строка читается из файла ее месяца,
+        # добавляется в базу, и только после записи базы убирается из архива
+        def on_row(row):
+            change = self.store.restore_row(row)
+            self.update_table(change)
+            
+            def on_saved(changes):
+                self.jobs.submit("Архив", lambda: self.store.archive.remove(row_id))
+                if on_done is not None:
+                    on_done()
+                restored_id = changes.renamed.get(change["id"], change["id"])
+                messagebox.showinfo("Архив", f"Объект восстановлен, ID {restored_id}")
+            
+            self.commit_change(
+                change,
+                on_saved,
+                lambda e: messagebox.showerror("Ошибка", f"Ошибка при восстановлении: {str(e)}")
+            )
+        
+        self.jobs.submit(
+            "Восстановление из архива",
+            lambda: self.store.archive.row(row_id),
+            on_row,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при восстановлении: {str(e)}")
+        )
+    
+    def show_stats(self):
+        if self.stats_window is not None:
+            self.stats_window.lift()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Статистика")
+        window.geometry("850x500")
+        
+        columns = ("Объектов", "Медианная цена", "Цена за м²", "Средний возраст")
+        tree = ttk.Treeview(window, columns=columns, show="tree headings")
+        tree.heading("#0", text="Группа")
+        tree.column("#0", width=250)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=140, anchor="e")
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        def on_close():
+            self.stats_window = None
+            window.destroy()
+        
+        window.protocol("WM_DELETE_WINDOW", on_close)
+        self.stats_window = window
+        self.stats_tree = tree
+        if self.portfolio is None:
+            tree.insert("", tk.END, text="Считаем...")
+            self.prepare_portfolio()
+        else:
+            self.refresh_stats()
+    
+    def prepare_portfolio(self):
+        # Первый расчет сводки по копии базы в фоне; если база за это время
+        # изменилась, считаем заново
+        df = self.df.copy()
+        version = self.data_version
+        
+        def build():
+            portfolio = PortfolioStats()
+            portfolio.build(df)
+            return portfolio
+        
+        def install(portfolio):
+            if self.data_version != version:
+                self.prepare_portfolio()
+                return
+            self.portfolio = portfolio
+            self.refresh_stats()
+        
+        self.jobs.submit("Статистика", build, install)
+    
+    def refresh_stats(self):
+        if self.stats_window is None or self.portfolio is None:
+            return
+        summary = self.portfolio.summary()
+        
+        def values(item):
+            return (item["count"], price_text(item["median_price"]),
+                    price_text(item["median_price_per_m2"]), age_text(item["mean_age_days"]))
+        
+        tree = self.stats_tree
+        children = tree.get_children()
+        if children:
+            tree.delete(*children)
+        tree.insert("", tk.END, text="Вся база", values=values(summary["total"]))
+        for field in STATS_GROUPS:
+            parent = tree.insert("", tk.END, text=field, open=True)
+            for name, item in summary[field].items():
+                tree.insert(parent, tk.END, text=name or "(не указан)", values=values(item))
+    
+    def find_all_duplicates(self):
+        # Отчет обо всех дубликатах базы; строится в фоне по копии данных
+        df = self.df.copy()
+        report_path = Path(self.filename).parent / DUPLICATES_REPORT_NAME
+        
+        def on_done(groups):
+            if groups:
+                messagebox.showwarning("Дубликаты", f"Найдено групп дубликатов: {groups}\nОтчет: {report_path}")
+            else:
+                messagebox.showinfo("Дубликаты", "Дубликатов не найдено.")
+        
+        self.jobs.submit(
+            "Поиск дубликатов",
+            lambda: write_duplicates_report(df, report_path),
+            on_done,
+            lambda e: messagebox.showerror("Ошибка", f"Ошибка при поиске дубликатов: {str(e)}")
+        )
 
 if __name__ == "__main__":
+    # С командой (export, import, stats, compact, duplicates) программа работает без окна
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     root = tk.Tk()
     app = RealEstateApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,3083 @@
+# База объектов недвижимости без окна: схема, хранилища (CSV, журнал, SQLite), импорт,
+# поиск, дубликаты, статистика, архив, ListingStore и командная строка (run_cli).
+# Tk здесь не импортируется: модулем пользуются окно (real_estate_app_11.py), тесты
+# и ночные задачи на машинах без дисплея
+import time
+import os
+import sys
+import io
+import codecs
+import json
+import zlib
+import gzip
+import re
+import hashlib
+import pickle
+import sqlite3
+import threading
+import functools
+import bisect
+from collections import deque
+from pathlib import Path
+from datetime import datetime
+
+# pandas и numpy загружаются не при импорте модуля, а при первом обращении к базе
+# (см. import_data_libraries), чтобы окно программы успевало отрисоваться до их загрузки
+pd = None
+np = None
+
+
+def import_data_libraries():
+    global pd, np
+    if pd is None:
+        import numpy
+        import pandas
+        np = numpy
+        pd = pandas
+
+
+
+# Режим хранения базы:
+#   "csv"     - CSV полностью перезаписывается после каждого изменения (по умолчанию)
+#   "journal" - изменения дописываются в журнал рядом с CSV, CSV после каждой записи
+#               переписывается из CSV и журнала (без снимка базы в окне)
+#   "sqlite"  - база в SQLite (real_estate_database.sqlite3), изменения - одиночные SQL-запросы
+STORAGE_MODE = "csv"
+
+# После скольких записей журнал начинается заново (сжатие; CSV к этому времени уже актуален)
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Одна база на несколько копий программы (например, в общей папке): запись идет
+# под блокировкой файла <база>.lock (ожидание не дольше LOCK_TIMEOUT секунд)
+LOCK_TIMEOUT = 10
+
+class Field:
+    # Поле базы: вид поля в форме и тип столбца в DataFrame.
+    #   widget: "date", "combobox", "entry", "text" (многострочное)
+    #   kind:   "date" - datetime64, "category" - категория из options,
+    #           "int" / "float" - Int64 / Float64 (пустое значение - NA), "text" - строка
+
+    def __init__(self, name, widget="entry", kind="text", options=None):
+        self.name = name
+        self.widget = widget
+        self.kind = kind
+        self.options = options
+
+
+# Порядок типов объектов (в списке формы и при выгрузке)
+OBJECT_ORDER = ["комната", "1-ккв", "2-ккв", "3-ккв", "4-ккв", "дача", "дом", "участок"]
+
+# Схема базы: поля в порядке формы и столбцов CSV.
+# По ней строятся формы добавления и редактирования, типы столбцов при чтении и проверка ввода
+SCHEMA = [
+    Field("Дата занесения в базу", "date", "date"),
+    Field("Объект", "combobox", "category", OBJECT_ORDER),
+    Field("Адрес"),
+    Field("Кадастровый №"),
+    Field("Цена", kind="int"),
+    Field("Площадь", kind="float"),
+    Field("Комнаты"),
+    Field("Жилая", kind="float"),
+    Field("Кухня", kind="float"),
+    Field("Санузел", "combobox", "category", ["раздельный", "совмещенный"]),
+    Field("Этаж/этажность"),
+    Field("Участок"),
+    Field("Дом", "combobox", "category", ["нет", "монолит", "панельный", "кирпичный", "бревно", "каркасный"]),
+    Field("Высота потолков", kind="float"),
+    Field("Год постройки", kind="int"),
+    Field("Сделка", "combobox", "category", ["прямая продажа", "альтернатива"]),
+    Field("Основание владения", "combobox", "category", ["ДКП", "ДДУ", "Наследство", "Дарение", "Приватизация"]),
+    Field("Срок владения"),
+    Field("Количество собственников", kind="int"),
+    Field("Контакт ФИО"),
+    Field("Телефон"),
+    Field("Примечание", "text"),
+]
+FIELDS = {field.name: field for field in SCHEMA}
+
+# Столбцы базы в порядке полей формы
+COLUMNS = [field.name for field in SCHEMA]
+
+# Замеры операций (загрузка, сохранение, таблица, выгрузка, правка): последние
+# PROFILE_BUFFER_SIZE записей в памяти, последняя показывается по F12 в строке состояния.
+# PROFILE_DEBUG (переменная окружения REAL_ESTATE_PROFILE): "log" - писать замеры
+# в real_estate_cache/operations.log, "cprofile" - еще и статистику cProfile в operations.prof
+PROFILE_OPERATIONS = True
+PROFILE_BUFFER_SIZE = 500
+PROFILE_DEBUG = os.environ.get("REAL_ESTATE_PROFILE", "")
+
+# Фотографии объектов: папка на каждый объект (Documents/real_estate_photos/<ID>)
+PHOTOS_DIR_NAME = "real_estate_photos"
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+
+# Версия формата кэша разобранной базы (real_estate_database.csv.<хеш пути>.cache в cache_directory())
+CSV_CACHE_VERSION = 3
+
+# Поля с длинным текстом: в таблице переносятся каждые WRAP_WIDTH символов
+WRAPPED_FIELDS = ["Контакт ФИО", "Телефон", "Примечание", "Адрес", "Кадастровый №"]
+WRAP_WIDTH = 20
+
+# Ленивая загрузка длинных текстов: окно читает базу без столбцов LAZY_TEXT_FIELDS
+# (в таблице они не показываются) и дочитывает их, когда они нужны: при открытии
+# объекта, поиске, выгрузке в Excel, переносе в архив. В кэше базы эти столбцы
+# лежат отдельной частью, которая при запуске не читается.
+# Годятся поля, которые не нужны таблице, дубликатам и статистике
+LAZY_TEXT_LOADING = True
+LAZY_TEXT_FIELDS = ["Примечание"]
+
+# Постоянный идентификатор объекта: хранится в базе первым столбцом
+# и служит идентификатором строки в Treeview
+ID_COLUMN = "ID"
+
+# Поля, по которым работает поиск
+SEARCH_FIELDS = ["Адрес", "Контакт ФИО", "Телефон", "Кадастровый №", "Примечание"]
+
+# Индексы SQLite: имя индекса -> столбец
+SQLITE_INDEXES = {
+    "listings_cadastral": "Кадастровый №",
+    "listings_object": "Объект",
+    "listings_price": "Цена",
+    "listings_date": "Дата занесения в базу",
+}
+
+# Сколько ID передается в одном запросе SQLite "id IN (...)": число параметров
+# запроса ограничено (в старых версиях SQLite - 999)
+SQLITE_IDS_PER_QUERY = 500
+
+
+def to_journal_value(value):
+    # Приводим значение ячейки к строке для записи в журнал
+    if value is None:
+        return ""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%d.%m.%Y') if pd.notna(value) else ""
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def parse_entry_date(value):
+    # Дата занесения хранится в формате DD.MM.YYYY
+    if not value:
+        return pd.NaT
+    return pd.to_datetime(value, format='%d.%m.%Y', errors='coerce')
+
+
+# Число в поле формы или CSV: пробелы между разрядами, запятая вместо точки
+# и единица измерения в конце допускаются ("5 000 000 руб", "45,5 м2", "6 сот")
+NUMBER_TEXT_PATTERN = r"^(-?\d+(?:\.\d+)?)(?:руб\.?|р\.?|₽|м2|м²|кв\.?м\.?|м\.?|сот\.?|соток|г\.?|года?)?$"
+
+
+def blank_values(series):
+    return series.isna() | (series.astype(object).fillna("").astype(str).str.strip() == "")
+
+
+def parse_number_text(series):
+    # Строгий разбор числа: NaN, если значение пустое или не число целиком.
+    # Обычные записи ("45.5", "45,5") разбираются сразу, регулярное выражение -
+    # только для остальных
+    text = series.astype(object).fillna("").astype(str)
+    numbers = pd.to_numeric(text.str.replace(",", ".", regex=False), errors='coerce')
+    rest = numbers.isna() & (text != "")
+    if rest.any():
+        cleaned = text[rest].str.replace(r"\s", "", regex=True).str.replace(",", ".", regex=False).str.lower()
+        numbers[rest] = pd.to_numeric(cleaned.str.extract(NUMBER_TEXT_PATTERN, expand=False), errors='coerce')
+    return numbers
+
+
+def number_text(series):
+    # Числа для CSV и таблицы: целые без ".0", пустые - пустая строка
+    if pd.api.types.is_integer_dtype(series):
+        text = series.astype(str)
+    else:
+        text = series.astype('Float64').astype(str).str.replace(r"\.0$", "", regex=True)
+    return text.where(series.notna(), "")
+
+
+def typed_column(field, series):
+    # Столбец в типе из схемы. Если в числовом поле попались не числа,
+    # столбец остается текстовым, чтобы не потерять данные
+    if field.kind == "date":
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        return pd.to_datetime(series.astype(object), format='%d.%m.%Y', errors='coerce')
+    if field.kind == "category":
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object).where(~blank_values(series), None).astype('category')
+        extra = sorted(set(series.cat.categories) - set(field.options))
+        return series.cat.set_categories(field.options + extra)
+    if field.kind in ("int", "float"):
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            numbers = series.astype('Float64')
+        else:
+            numbers = parse_number_text(series)
+            wrong = numbers.isna() & ~blank_values(series)
+            if wrong.any():
+                print(f"Поле \"{field.name}\": {int(wrong.sum())} значений не числа, столбец оставлен текстовым")
+                return series
+            numbers = numbers.astype('Float64')
+        if field.kind == "int" and (numbers.dropna() % 1 == 0).all():
+            return numbers.astype('Int64')
+        return numbers
+    if pd.api.types.is_numeric_dtype(series):
+        return number_text(series).where(series.notna())
+    return series
+
+
+def apply_schema(df):
+    # Приводим столбцы DataFrame к типам из схемы
+    for field in SCHEMA:
+        if field.name in df.columns:
+            df[field.name] = typed_column(field, df[field.name])
+    return df
+
+
+def column_values(df, name, values):
+    # Новые значения столбца базы в его типе. При необходимости расширяет
+    # категории столбца или переводит числовой столбец в текст (меняет df)
+    field = FIELDS.get(name)
+    column = df[name]
+    if field is None:
+        return values
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        typed = typed_column(field, values)
+        new = [value for value in typed.cat.categories if value not in column.cat.categories]
+        if new:
+            df[name] = column.cat.add_categories(new)
+        return typed.cat.set_categories(df[name].cat.categories)
+    if field.kind in ("int", "float") and pd.api.types.is_numeric_dtype(column):
+        typed = typed_column(field, values)
+        if not pd.api.types.is_numeric_dtype(typed):
+            df[name] = number_text(column).where(column.notna())
+            return typed
+        if typed.dtype != column.dtype:
+            df[name] = column.astype('Float64')
+        return typed.astype(df[name].dtype)
+    if field.kind == "date":
+        return typed_column(field, values)
+    if pd.api.types.is_numeric_dtype(values):
+        return number_text(values)
+    return values
+
+
+def append_rows(df, rows):
+    # Новые строки (DataFrame) в конец базы с приведением к типам ее столбцов
+    rows = rows.reset_index(drop=True)
+    for name in rows.columns:
+        if name in df.columns and name in FIELDS:
+            rows[name] = column_values(df, name, rows[name])
+    return pd.concat([df, rows], ignore_index=True)
+
+
+def set_cells(df, index, row):
+    # Запись значений одной строки с приведением к типам столбцов
+    for name, value in row.items():
+        if name in df.columns and name in FIELDS:
+            value = column_values(df, name, pd.Series([value], dtype=object)).iloc[0]
+        df.at[index, name] = value
+
+
+def ensure_ids(df):
+    # Назначаем ID строкам, у которых его еще нет (база до появления ID)
+    if ID_COLUMN not in df.columns:
+        df.insert(0, ID_COLUMN, pd.NA)
+    ids = pd.to_numeric(df[ID_COLUMN], errors='coerce')
+    missing = ids.isna()
+    if missing.any():
+        start = int(ids.max()) + 1 if missing.sum() < len(ids) else 1
+        ids[missing] = range(start, start + int(missing.sum()))
+    df[ID_COLUMN] = ids.astype('int64')
+    return df
+
+
+def next_row_id(df):
+    return int(df[ID_COLUMN].max()) + 1 if len(df) else 1
+
+
+def row_position(df, row_id):
+    # Номер строки DataFrame с указанным ID
+    positions = (df[ID_COLUMN].to_numpy() == row_id).nonzero()[0]
+    if not len(positions):
+        raise KeyError(f"Объект с ID {row_id} не найден")
+    return int(positions[0])
+
+
+def replay_change(df, record):
+    # Запись журнала поверх базы, в которой она уже может быть учтена или которую
+    # правили вручную: строки сопоставляются по ID - существующая перезаписывается,
+    # отсутствующая добавляется. Повторное применение записи ничего не меняет
+    op = record["op"]
+    if op in ("add", "edit"):
+        rows = pd.DataFrame([{**record["row"], ID_COLUMN: record["id"]}])
+    elif op == "add_batch":
+        rows = pd.DataFrame(record["rows"])
+    else:
+        return apply_change(df, record)
+    if not len(rows):
+        return df
+    rows[ID_COLUMN] = rows[ID_COLUMN].astype('int64')
+    rows = rows.drop_duplicates(ID_COLUMN, keep='last')
+    ids = df[ID_COLUMN].to_numpy()
+    found = pd.Series(ids).isin(rows[ID_COLUMN]).to_numpy()
+    if found.any():
+        present = rows.set_index(ID_COLUMN).loc[ids[found]]
+        for name in present.columns:
+            if name not in df.columns:
+                # Столбца нет в CSV (база из старой версии) - как в set_cells, он появляется
+                df[name] = pd.Series(None, index=df.index, dtype=object)
+            values = column_values(df, name, present[name].reset_index(drop=True))
+            df.loc[df.index[found], name] = values.to_numpy()
+    added = rows[~rows[ID_COLUMN].isin(ids)]
+    return append_rows(df, added) if len(added) else df
+
+
+def apply_change(df, record):
+    # Применяем одну запись журнала к DataFrame
+    op = record["op"]
+    if op == "add":
+        row = dict(record["row"])
+        row[ID_COLUMN] = record["id"]
+        return append_rows(df, pd.DataFrame([row]))
+    if op == "edit":
+        set_cells(df, row_position(df, record["id"]), record["row"])
+        return df
+    if op == "add_batch":
+        # Пакет новых объектов (импорт из файла) - одной операцией
+        return append_rows(df, pd.DataFrame(record["rows"]))
+    if op == "delete":
+        # Одно удаление по маске для всех выбранных объектов
+        return df[~df[ID_COLUMN].isin(record["ids"])].reset_index(drop=True)
+    raise ValueError(f"Неизвестная операция в журнале: {op}")
+
+
+def without_fields(record, fields):
+    # Копия записи об изменении без значений полей fields - для DataFrame,
+    # в котором этих столбцов нет (ленивая загрузка длинных текстов)
+    if not fields or record["op"] not in ("add", "edit", "add_batch"):
+        return record
+    if record["op"] == "add_batch":
+        rows = [{name: value for name, value in row.items() if name not in fields} for row in record["rows"]]
+        return dict(record, rows=rows)
+    return dict(record, row={name: value for name, value in record["row"].items() if name not in fields})
+
+
+def record_ids(record):
+    # ID объектов, которых касается запись об изменении
+    op = record["op"]
+    if op in ("add", "edit"):
+        return {record["id"]}
+    if op == "delete":
+        return set(record["ids"])
+    if op == "add_batch":
+        return {row[ID_COLUMN] for row in record["rows"]}
+    return set()
+
+
+def renumber_record(record, taken, first_free):
+    # Новые ID для объектов из записи "add"/"add_batch", если их ID уже заняты
+    # другой копией программы. Возвращаем запись (копию) и {старый ID: новый}
+    if not taken.intersection(record_ids(record)) or record["op"] not in ("add", "add_batch"):
+        return record, {}
+    if record["op"] == "add":
+        return dict(record, id=first_free), {record["id"]: first_free}
+    renamed = {row[ID_COLUMN]: first_free + i for i, row in enumerate(record["rows"])}
+    rows = [dict(row, **{ID_COLUMN: renamed[row[ID_COLUMN]]}) for row in record["rows"]]
+    return dict(record, rows=rows), renamed
+
+
+def diff_records(old, new):
+    # Записи об изменениях, которые превращают old в new (строки сопоставляются по ID):
+    # одно удаление, правки измененных строк и один пакет новых строк
+    columns = [field for field in COLUMNS if field in old.columns and field in new.columns]
+    old_text = frame_for_csv(old).set_index(ID_COLUMN)[columns].astype(object).fillna("").astype(str)
+    new_text = frame_for_csv(new).set_index(ID_COLUMN)[columns].astype(object).fillna("").astype(str)
+    
+    records = []
+    deleted = old_text.index[~old_text.index.isin(new_text.index)]
+    if len(deleted):
+        records.append({"op": "delete", "ids": [int(row_id) for row_id in deleted]})
+    
+    common = old_text.index[old_text.index.isin(new_text.index)]
+    changed = (old_text.loc[common] != new_text.loc[common]).any(axis=1)
+    for row_id in common[changed.to_numpy()]:
+        records.append({"op": "edit", "id": int(row_id), "row": new_text.loc[row_id].to_dict()})
+    
+    added = new_text[~new_text.index.isin(old_text.index)]
+    if len(added):
+        records.append({"op": "add_batch", "rows": added.reset_index().to_dict('records')})
+    return records
+
+
+def empty_frame():
+    df = apply_schema(pd.DataFrame(columns=COLUMNS))
+    df.insert(0, ID_COLUMN, pd.Series(dtype='int64'))
+    return df
+
+
+def frame_for_csv(df):
+    # Копия DataFrame с датами в виде строк нужного формата и числами без ".0"
+    df_to_save = df.copy()
+    if 'Дата занесения в базу' in df_to_save.columns:
+        df_to_save['Дата занесения в базу'] = pd.to_datetime(
+            df_to_save['Дата занесения в базу'], errors='coerce'
+        ).dt.strftime('%d.%m.%Y')
+    for name in df_to_save.columns:
+        if name in FIELDS and FIELDS[name].kind in ("int", "float") \
+                and pd.api.types.is_numeric_dtype(df_to_save[name]):
+            df_to_save[name] = number_text(df_to_save[name])
+    return df_to_save
+
+
+def csv_bytes(df_to_save):
+    # CSV целиком в памяти - нужно для хеша базы
+    return df_to_save.to_csv(index=False).encode('utf-8')
+
+
+def write_file_atomic(path, data):
+    # Пишем во временный файл и подменяем им основной:
+    # при сбое на диске остается либо старая, либо новая версия целиком
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    PROFILER.add_bytes(len(data))
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def file_stamp(*paths):
+    # Время изменения и размер файлов - дешевая проверка, не менялась ли база
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class FileLock:
+    # Блокировка записи в базу между копиями программы (и между компьютерами,
+    # если база в общей папке): монопольная блокировка lock-файла рядом с базой
+
+    def __init__(self, path, timeout=None):
+        self.path = Path(path)
+        self.timeout = LOCK_TIMEOUT if timeout is None else timeout
+        self.file = None
+
+    def try_lock(self):
+        if os.name == 'nt':
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def __enter__(self):
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.file = open(self.path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self.try_lock()
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.file.close()
+                    self.file = None
+                    raise TimeoutError(f"База занята другой копией программы ({self.path})")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+class RemoteChanges:
+    # Результат записи или проверки базы - изменения, сделанные другими копиями программы:
+    #   records  - записи журнала, которые нужно применить поверх df
+    #   frame    - база целиком (журнал успели сжать или база не в режиме журнала)
+    #   renamed  - {старый ID: новый} для наших новых объектов, чей ID уже занят
+    #   conflict - ID объекта, наша правка которого не записана: его уже изменили
+    #   version  - версия базы после этих изменений (хеш CSV и число записей журнала)
+
+    def __init__(self, records=None, frame=None, renamed=None, conflict=None, version=None):
+        self.records = records or []
+        self.frame = frame
+        self.renamed = renamed or {}
+        self.conflict = conflict
+        self.version = version
+
+
+class ChangeJournal:
+    # Журнал изменений: одна строка на операцию в виде "<crc32> <json>".
+    # Первая строка - заголовок с хешем CSV, к которому относится журнал.
+    # Недописанная (оборванная) строка не проходит проверку crc и отбрасывается.
+
+    def __init__(self, csv_path):
+        self.csv_path = Path(csv_path)
+        self.path = self.csv_path.with_name(self.csv_path.name + ".journal")
+        self.next_path = self.csv_path.with_name(self.csv_path.name + ".journal.next")
+        # Сколько записей журнала уже учтено в CSV (его переписывают после каждой записи)
+        self.written_path = self.csv_path.with_name(self.csv_path.name + ".journal.written")
+        self.lock = threading.Lock()
+        self.base_hash = None
+        self.entries = 0
+        # end - длина прочитанной и записанной нами части файла,
+        # own - номера наших записей (в журнале бывают и записи других копий программы)
+        self.end = 0
+        self.own = set()
+
+    @staticmethod
+    def encode(record):
+        payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+    @staticmethod
+    def decode(line):
+        if not line.endswith(b"\n") or len(line) < 10:
+            return None
+        crc, payload = line[:8], line[9:-1]
+        try:
+            if int(crc, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload.decode('utf-8'))
+        except ValueError:
+            return None
+
+    def read_records(self, path):
+        # Возвращает корректные записи и длину корректной части файла
+        records = []
+        valid_end = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                record = self.decode(line)
+                if record is None:
+                    break
+                records.append(record)
+                valid_end += len(line)
+        return records, valid_end
+
+    def header_hash(self, path):
+        records, _ = self.read_records(path)
+        if records and records[0].get("op") == "base":
+            return records[0].get("hash")
+        return None
+
+    def written(self, base_hash):
+        # Число записей журнала с заголовком base_hash, которые уже есть в CSV
+        try:
+            info = json.loads(self.written_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return 0
+        return int(info.get("entries", 0)) if info.get("base") == base_hash else 0
+
+    def note_written(self, entries):
+        data = json.dumps({"base": self.base_hash, "entries": entries}).encode('utf-8')
+        write_file_atomic(self.written_path, data)
+
+    def start(self, base_hash):
+        # Новый пустой журнал для базы с указанным хешем
+        header = self.encode({"op": "base", "hash": base_hash})
+        write_file_atomic(self.path, header)
+        self.base_hash = base_hash
+        self.entries = 0
+        self.end = len(header)
+        self.own = set()
+
+    def replay(self, df, base_hash, skip=()):
+        # Применяем журнал к прочитанному CSV и восстанавливаем его после сбоя во время сжатия.
+        # skip - столбцы, которых нет в df: их значения из записей пропускаются
+        if self.next_path.exists():
+            if self.header_hash(self.next_path) == base_hash:
+                os.replace(self.next_path, self.path)
+            else:
+                self.next_path.unlink()
+
+        if not self.path.exists():
+            self.start(base_hash)
+            return df
+
+        records, valid_end = self.read_records(self.path)
+        if not records or records[0].get("op") != "base":
+            # Заголовок оборван - корректных записей в журнале нет
+            self.start(base_hash)
+            return df
+
+        # CSV переписывается после каждой записи журнала, поэтому хеш в заголовке не обязан
+        # совпадать с CSV: применяются записи, которых в CSV еще нет (сбой до его записи).
+        # CSV могли и поправить вручную или подменить через общую папку - записи
+        # применяются по ID, правки остальных объектов в CSV остаются
+        for record in records[1 + self.written(records[0].get("hash")):]:
+            df = replay_change(df, without_fields(record, skip))
+
+        # Отрезаем оборванный хвост, чтобы новые записи шли после корректных
+        if valid_end < self.path.stat().st_size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+                os.fsync(f.fileno())
+
+        self.base_hash = records[0].get("hash")
+        self.entries = len(records) - 1
+        self.end = valid_end
+        self.own = set()
+        return df
+
+    def read_new(self):
+        # Записи, которые другие копии программы дописали после нас.
+        # None - журнал начат заново (базу сжала другая копия)
+        try:
+            with open(self.path, 'rb') as f:
+                header = self.decode(f.readline())
+                if header is None or header.get("op") != "base" or header.get("hash") != self.base_hash:
+                    return None
+                f.seek(self.end)
+                records = []
+                for line in f:
+                    record = self.decode(line)
+                    if record is None:
+                        # Строка еще дописывается - дочитаем ее в следующий раз
+                        break
+                    records.append(record)
+                    self.end += len(line)
+        except FileNotFoundError:
+            return None
+        self.entries += len(records)
+        return records
+
+    def records_after(self, seq):
+        # Пары (номер, запись) для записей журнала с номером больше seq
+        records, _ = self.read_records(self.path)
+        return [(number, record) for number, record in enumerate(records[1:], start=1) if number > seq]
+
+    def mark(self):
+        return self.end, self.entries
+
+    def rewind(self, mark):
+        # Откат к состоянию mark: прочитанные записи прочитаются заново
+        self.end, self.entries = mark
+
+    def append(self, record):
+        line = self.encode(record)
+        PROFILER.add_bytes(len(line))
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries += 1
+            self.end += len(line)
+            self.own.add(self.entries)
+
+    def compact(self, df_to_save):
+        # Переписываем CSV из снимка, в котором учтены все записи журнала
+        data = csv_bytes(df_to_save)
+        new_hash = hashlib.sha1(data).hexdigest()
+        tmp_csv = self.csv_path.with_name(self.csv_path.name + ".tmp")
+        PROFILER.add_bytes(len(data))
+        with open(tmp_csv, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.lock:
+            # Сначала готовим журнал для новой базы, затем подменяем CSV и журнал.
+            # Если сбой случится между подменами, replay подхватит .journal.next
+            header = self.encode({"op": "base", "hash": new_hash})
+            write_file_atomic(self.next_path, header)
+            os.replace(tmp_csv, self.csv_path)
+            os.replace(self.next_path, self.path)
+            self.base_hash = new_hash
+            self.entries = 0
+            self.end = len(header)
+            self.own = set()
+        
+        # Кэш разобранной базы для следующего запуска
+        write_csv_cache(self.csv_path, parse_csv_bytes(data), new_hash)
+
+
+def parse_csv_bytes(data):
+    # Типы столбцов задает схема: поля со списком читаются сразу категориями,
+    # остальные - строками, затем даты и числа разбираются в typed_column
+    dtype = {field.name: 'category' if field.kind == "category" else str for field in SCHEMA}
+    df = pd.read_csv(io.BytesIO(data), encoding='utf-8', dtype=dtype)
+    return ensure_ids(apply_schema(df))
+
+
+def cache_directory():
+    # Кэш разобранной базы хранится в профиле пользователя, а не рядом с базой:
+    # база может лежать в общей папке, а кэш читается через pickle, и подложенный
+    # туда файл выполнил бы код на каждом компьютере
+    if os.name == 'nt':
+        return Path.home() / "AppData" / "Local" / "real_estate_cache"
+    return Path.home() / ".cache" / "real_estate_cache"
+
+
+def csv_cache_path(path):
+    # Имя файла базы и хеш полного пути: у баз с одинаковыми именами разные кэши
+    key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    return cache_directory() / f"{Path(path).name}.{key}.cache"
+
+
+def csv_cache_format():
+    # Формат кэша зависит от версии pandas и от того, как хранятся строки:
+    # с установленным pyarrow строковые столбцы читаются из кэша в разы быстрее
+    return {"version": CSV_CACHE_VERSION, "pandas": pd.__version__,
+            "strings": getattr(pd.Series([""]).dtype, "storage", None)}
+
+
+def read_csv_cache(path, stat, skip=()):
+    # Разобранная база из кэша или None, если кэш не подходит к CSV.
+    # Совпали время изменения и размер - кэш берется сразу; иначе сверяется хеш
+    # содержимого (файл могли скопировать или сохранить без изменений).
+    # В файле pickle заголовка, затем части DataFrame (см. write_csv_cache), чтобы
+    # при промахе не читать данные, а части только из столбцов skip пропускать
+    cache_path = csv_cache_path(path)
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get("format") != csv_cache_format() or header.get("size") != stat.st_size:
+                return None
+            same_stat = header.get("mtime_ns") == stat.st_mtime_ns
+            if not same_stat and hashlib.sha1(Path(path).read_bytes()).hexdigest() != header.get("hash"):
+                return None
+            # Нужные части; хотя бы одна читается всегда - в ней есть ID
+            wanted = [any(name not in skip for name in names if name != ID_COLUMN)
+                      for names, size in header["parts"]]
+            wanted[0] = wanted[0] or not any(wanted)
+            parts = []
+            for (names, size), needed in zip(header["parts"], wanted):
+                if same_stat and not needed:
+                    f.seek(size, 1)
+                else:
+                    parts.append((names, f.read(size), needed))
+    except Exception as e:
+        print(f"Кэш базы не прочитан, читаем CSV: {e}")
+        return None
+    
+    if not same_stat:
+        # Содержимое то же - запоминаем новое время изменения
+        store_csv_cache(path, header["hash"], header["columns"], [part[:2] for part in parts])
+    
+    df = None
+    for names, data, needed in parts:
+        if not needed:
+            continue
+        part = pickle.loads(data)
+        if df is None:
+            df = part
+        else:
+            for name in part.columns:
+                if name not in df.columns:
+                    df[name] = part[name]
+    return df[[name for name in header["columns"] if name not in skip]], header["hash"]
+
+
+def write_csv_cache(path, df, base_hash):
+    # Кэш пишется после CSV: в заголовок попадают время изменения и размер нового файла.
+    # Столбцы LAZY_TEXT_FIELDS - отдельной частью (с ID), остальные - основной.
+    # Ошибка записи кэша не мешает работе - в следующий раз база прочитается из CSV
+    try:
+        lazy = [name for name in LAZY_TEXT_FIELDS if name in df.columns]
+        main = [name for name in df.columns if name not in lazy]
+        parts = [(main, pickle.dumps(df[main], protocol=pickle.HIGHEST_PROTOCOL))]
+        if lazy:
+            lazy = [ID_COLUMN] + lazy if ID_COLUMN in df.columns else lazy
+            parts.append((lazy, pickle.dumps(df[lazy], protocol=pickle.HIGHEST_PROTOCOL)))
+        store_csv_cache(path, base_hash, list(df.columns), parts)
+    except Exception as e:
+        print(f"Не удалось записать кэш базы: {e}")
+
+
+def store_csv_cache(path, base_hash, columns, parts):
+    # parts - пары (столбцы части, pickle части)
+    stat = os.stat(path)
+    header = {"format": csv_cache_format(), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+              "hash": base_hash, "columns": columns, "parts": [(names, len(data)) for names, data in parts]}
+    buffer = io.BytesIO()
+    pickle.dump(header, buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    for names, data in parts:
+        buffer.write(data)
+    cache_path = csv_cache_path(path)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    write_file_atomic(cache_path, buffer.getvalue())
+
+
+def write_csv_base(path, data):
+    # Записываем CSV и обновляем кэш тем, что дало бы чтение этого CSV,
+    # чтобы следующий запуск не разбирал файл заново
+    write_file_atomic(path, data)
+    base_hash = hashlib.sha1(data).hexdigest()
+    write_csv_cache(path, parse_csv_bytes(data), base_hash)
+    return base_hash
+
+
+def read_csv_base(path, skip=()):
+    # Читаем CSV базы; возвращаем DataFrame (без столбцов skip) и хеш содержимого файла.
+    # Если CSV не менялся с прошлой записи, DataFrame берется из кэша рядом с ним
+    if not os.path.exists(path):
+        df = empty_frame()
+        return df[[name for name in df.columns if name not in skip]], None
+    
+    cached = read_csv_cache(path, os.stat(path), skip)
+    if cached is not None:
+        return cached
+    
+    data = Path(path).read_bytes()
+    base_hash = hashlib.sha1(data).hexdigest()
+    df = parse_csv_bytes(data)
+    # CSV изменили вручную или кэша еще нет - пересоздаем кэш
+    write_csv_cache(path, df, base_hash)
+    return df[[name for name in df.columns if name not in skip]], base_hash
+
+
+class CsvStorage:
+    # База в CSV, каждое изменение - полная перезапись файла.
+    # snapshot() вызывается в главном потоке, commit(), pull() и save() - в фоновом.
+    # Файл мог переписать другая копия программы: тогда наше изменение
+    # применяется к ее версии базы (при совпадении правок сохраняется последняя)
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        # Хеш и время изменения/размер CSV, каким мы его последний раз читали или писали
+        self.base_hash = None
+        self.base_stamp = None
+        # Столбцы, которые не читаются из базы (ленивая загрузка длинных текстов)
+        self.skip = []
+
+    def stamp(self):
+        return file_stamp(self.path)
+
+    def version(self):
+        return None
+
+    def load(self):
+        with self.file_lock:
+            df, self.base_hash = read_csv_base(self.path, self.skip)
+            self.base_stamp = self.stamp()
+        return df
+
+    def read_fields(self, fields, ids=None):
+        # Столбцы fields (с ID) текущей версии базы, для ids или всех объектов.
+        # Состояние хранилища не меняется
+        with self.file_lock:
+            df, _ = read_csv_base(self.path, [name for name in COLUMNS if name not in fields])
+        return df if ids is None else df[df[ID_COLUMN].isin(ids)]
+
+    def write(self, data):
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.base_hash = write_csv_base(self.path, data)
+        self.base_stamp = self.stamp()
+
+    def read_if_changed(self):
+        # База, если CSV переписала другая копия программы, иначе None
+        if self.stamp() == self.base_stamp:
+            return None
+        df, base_hash = read_csv_base(self.path, self.skip)
+        self.base_stamp = self.stamp()
+        if base_hash == self.base_hash:
+            return None
+        self.base_hash = base_hash
+        return df
+
+    def save(self, df, version=None):
+        # Полная запись базы из df
+        with self.file_lock:
+            self.write(csv_bytes(frame_for_csv(df)))
+
+    def snapshot(self, record, df):
+        # Данные, которые понадобятся commit(): здесь - вся база для перезаписи
+        return frame_for_csv(df)
+
+    def commit(self, record, snapshot, version=None):
+        with self.file_lock:
+            remote = self.read_if_changed()
+            if remote is None:
+                self.write(csv_bytes(snapshot))
+                return RemoteChanges()
+            
+            # CSV переписала другая копия: применяем наше изменение к ее версии базы
+            ids = set(remote[ID_COLUMN].tolist())
+            if record["op"] == "edit" and record["id"] not in ids:
+                return RemoteChanges(frame=remote, conflict=record["id"])
+            record, renamed = renumber_record(record, ids, next_row_id(remote))
+            remote = apply_change(remote, record)
+            self.write(csv_bytes(frame_for_csv(remote)))
+            return RemoteChanges(frame=remote, renamed=renamed)
+
+    def pull(self):
+        # Проверка изменений других копий программы
+        with self.file_lock:
+            return RemoteChanges(frame=self.read_if_changed())
+
+    def close(self, df, version=None):
+        pass
+
+
+class JournalStorage(CsvStorage):
+    # База в CSV, изменения дописываются в журнал, после каждой записи CSV переписывается
+    # из CSV и журнала, а журнал раз в JOURNAL_COMPACT_THRESHOLD записей начинается заново.
+    # Журнал общий для всех копий программы: перед записью дочитываем записи
+    # других копий, правка объекта, который изменили после нашей версии базы, не записывается
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.journal = ChangeJournal(self.path)
+        # Наибольший известный ID - для новых ID при совпадении с чужими
+        self.max_id = 0
+
+    def stamp(self):
+        return file_stamp(self.path, self.journal.path)
+
+    def version(self):
+        return self.journal.base_hash, self.journal.entries
+
+    def read_base(self):
+        # CSV и журнал (вызывается под блокировкой)
+        df, base_hash = read_csv_base(self.path, self.skip)
+        os.makedirs(self.path.parent, exist_ok=True)
+        try:
+            # Досчитываем изменения из журнала поверх базы
+            df = self.journal.replay(df, base_hash, self.skip)
+        except Exception as e:
+            print(f"Ошибка при чтении журнала изменений: {e}")
+        self.max_id = max(self.max_id, next_row_id(df) - 1)
+        return df
+
+    def load(self):
+        with self.file_lock:
+            df = self.read_base()
+        return df
+
+    def read_fields(self, fields, ids=None):
+        # То же с записями журнала; журнал только читается (записи по ID, как в replay)
+        other = [name for name in COLUMNS if name not in fields]
+        with self.file_lock:
+            df, _ = read_csv_base(self.path, other)
+            if self.journal.path.exists():
+                records, _ = self.journal.read_records(self.journal.path)
+                if records and records[0].get("op") == "base":
+                    for record in records[1 + self.journal.written(records[0].get("hash")):]:
+                        df = replay_change(df, without_fields(record, other))
+        return df if ids is None else df[df[ID_COLUMN].isin(ids)]
+
+    def note_ids(self, records):
+        for record in records:
+            if record["op"] in ("add", "add_batch"):
+                self.max_id = max([self.max_id] + [int(row_id) for row_id in record_ids(record)])
+
+    def records_since(self, version):
+        # Записи журнала после версии version: пары (номер, запись)
+        seq = version[1] if version is not None and version[0] == self.journal.base_hash else 0
+        if seq >= self.journal.entries:
+            return []
+        return self.journal.records_after(seq)
+
+    def write_base(self, compact=False):
+        # Переписываем CSV: прочитанный CSV и записи журнала, которых в нем еще нет.
+        # Так файл базы на диске всегда актуален, а снимок базы из окна не нужен.
+        # compact - журнал начинается заново. Вызывается под блокировкой
+        df, _ = read_csv_base(self.path)
+        records, _ = self.journal.read_records(self.journal.path)
+        for record in records[1 + self.journal.written(self.journal.base_hash):]:
+            df = replay_change(df, record)
+        if compact or len(records) > JOURNAL_COMPACT_THRESHOLD:
+            self.journal.compact(frame_for_csv(df))
+        else:
+            write_csv_base(self.path, csv_bytes(frame_for_csv(df)))
+            self.journal.note_written(len(records) - 1)
+
+    def save(self, df, version=None):
+        # Полная запись в режиме журнала - это сжатие журнала в CSV.
+        # Если в журнале есть записи, которых нет в df (других копий программы
+        # или еще не подтвержденные окну), CSV собирается заново из CSV и журнала
+        with self.file_lock:
+            records = self.journal.read_new()
+            if records is None:
+                # Журнал уже сжала другая копия программы - в ее CSV есть и наши записи
+                self.read_base()
+            else:
+                self.note_ids(records)
+                if version is not None and self.records_since(version):
+                    self.write_base(compact=True)
+                else:
+                    self.journal.compact(frame_for_csv(df))
+
+    def snapshot(self, record, df):
+        # CSV переписывается из файлов (write_base) - снимок базы из окна не нужен
+        return None
+
+    def commit(self, record, snapshot, version=None):
+        with self.file_lock:
+            mark = self.journal.mark()
+            try:
+                records = self.journal.read_new()
+                if records is None:
+                    return self.rebase(record)
+                self.note_ids(records)
+                
+                later = self.records_since(version)
+                # Правка объекта, который другая копия изменила или удалила после нашей версии
+                remote_ids = set()
+                for number, other in later:
+                    if number not in self.journal.own:
+                        remote_ids |= record_ids(other)
+                if record["op"] == "edit" and record["id"] in remote_ids:
+                    return RemoteChanges(records, conflict=record["id"], version=self.version())
+                
+                # Новый объект с уже занятым ID (в том числе нашей записью, которую окно еще не видело)
+                taken = set()
+                for number, other in later:
+                    taken |= record_ids(other)
+                record, renamed = renumber_record(record, taken, self.max_id + 1)
+                self.journal.append(record)
+                self.note_ids([record])
+            except Exception:
+                self.journal.rewind(mark)
+                raise
+
+            try:
+                self.write_base()
+            except Exception as e:
+                # Изменение уже в журнале - CSV перепишет следующая запись
+                print(f"CSV базы не переписан: {e}")
+            version = self.version()
+        return RemoteChanges(records, renamed=renamed, version=version)
+
+    def rebase(self, record):
+        # Журнал начат заново другой копией программы (база сжата): перечитываем базу
+        # и дописываем наше изменение уже к ней. Вызывается под блокировкой
+        df = self.read_base()
+        ids = set(df[ID_COLUMN].tolist())
+        if record["op"] == "edit" and record["id"] not in ids:
+            return RemoteChanges(frame=df, conflict=record["id"], version=self.version())
+        record, renamed = renumber_record(record, ids, self.max_id + 1)
+        self.journal.append(record)
+        self.note_ids([record])
+        try:
+            self.write_base()
+        except Exception as e:
+            print(f"CSV базы не переписан: {e}")
+        return RemoteChanges(frame=apply_change(df, record), renamed=renamed, version=self.version())
+
+    def pull(self):
+        # Записи, дописанные другими копиями программы, или вся база, если журнал сжат
+        with self.file_lock:
+            records = self.journal.read_new()
+            if records is None:
+                return RemoteChanges(frame=self.read_base(), version=self.version())
+        self.note_ids(records)
+        return RemoteChanges(records, version=self.version())
+
+    def close(self, df, version=None):
+        # CSV уже актуален - журнал сжимается из файлов, без df
+        with self.file_lock:
+            if self.journal.read_new() is not None and self.journal.entries:
+                self.write_base(compact=True)
+
+
+def to_sqlite_value(field, value):
+    # Дату храним как YYYY-MM-DD, чтобы индекс по ней был упорядочен
+    value = to_journal_value(value)
+    if field == "Дата занесения в базу" and value:
+        date = parse_entry_date(value)
+        return date.strftime('%Y-%m-%d') if pd.notna(date) else None
+    return value if value != "" else None
+
+
+class SqliteStorage:
+    # База в SQLite: та же схема из 22 столбцов, изменения - одиночные SQL-запросы.
+    # ID объекта хранится как первичный ключ id.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = None
+        # PRAGMA data_version меняется, когда базу меняет другое соединение (другая копия программы)
+        self.data_version = None
+        # Столбцы, которые не читаются из базы (ленивая загрузка длинных текстов)
+        self.skip = []
+
+    @staticmethod
+    def quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            # Соединение используется фоновым потоком задач, по одной задаче за раз
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            # NUMERIC для числовых полей: числа хранятся числами, индекс сортирует их как числа
+            columns = ", ".join(
+                f"{self.quote(col)} {'NUMERIC' if FIELDS[col].kind in ('int', 'float') else 'TEXT'}"
+                for col in COLUMNS
+            )
+            with self.conn:
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS listings (id INTEGER PRIMARY KEY, {columns})")
+                for index_name, col in SQLITE_INDEXES.items():
+                    self.conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {index_name} ON listings ({self.quote(col)})"
+                    )
+        return self.conn
+
+    def load(self):
+        conn = self.connect()
+        self.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        return self.read_fields([col for col in COLUMNS if col not in self.skip])
+
+    def read_fields(self, fields, ids=None):
+        # Столбцы fields (с ID) для ids или всех объектов
+        conn = self.connect()
+        names = ", ".join(self.quote(col) for col in fields)
+        query = f"SELECT id AS {self.quote(ID_COLUMN)}, {names} FROM listings"
+        if ids is None:
+            df = pd.read_sql_query(query + " ORDER BY id", conn)
+        else:
+            # Длинный список ID (импорт, архив) - несколькими запросами
+            ids = [int(row_id) for row_id in ids]
+            chunks = [ids[i:i + SQLITE_IDS_PER_QUERY] for i in range(0, len(ids), SQLITE_IDS_PER_QUERY)] or [[]]
+            df = pd.concat([
+                pd.read_sql_query(f"{query} WHERE id IN ({', '.join('?' for _ in chunk)})", conn, params=chunk)
+                for chunk in chunks
+            ], ignore_index=True).sort_values(ID_COLUMN, ignore_index=True)
+        if 'Дата занесения в базу' in df.columns:
+            df['Дата занесения в базу'] = pd.to_datetime(
+                df['Дата занесения в базу'], format='%Y-%m-%d', errors='coerce'
+            )
+        return apply_schema(df)
+
+    def stamp(self):
+        # Изменения других копий программы попадают сначала в -wal файл
+        return file_stamp(self.path, self.path.with_name(self.path.name + "-wal"))
+
+    def version(self):
+        return None
+
+    def pull(self):
+        # Другие копии программы меняли базу - читаем ее целиком
+        conn = self.connect()
+        if conn.execute("PRAGMA data_version").fetchone()[0] == self.data_version:
+            return RemoteChanges()
+        return RemoteChanges(frame=self.load())
+
+    def insert_rows(self, rows, replace=False):
+        # rows - словари значений столбцов вместе с ID; replace - вместо всех строк таблицы.
+        # Удаление и вставка идут одной транзакцией: при ошибке таблица остается прежней
+        conn = self.connect()
+        names = ", ".join(self.quote(col) for col in COLUMNS)
+        marks = ", ".join("?" for _ in COLUMNS)
+        with conn:
+            if replace:
+                conn.execute("DELETE FROM listings")
+            conn.executemany(
+                f"INSERT INTO listings (id, {names}) VALUES (?, {marks})",
+                ([int(row[ID_COLUMN])] + [to_sqlite_value(col, row.get(col)) for col in COLUMNS] for row in rows)
+            )
+
+    def snapshot(self, record, df):
+        # Для SQLite достаточно самой записи об изменении
+        return None
+
+    def commit(self, record, snapshot, version=None):
+        # SQLite сам блокирует запись между соединениями; ID нового объекта
+        # может оказаться занят другой копией программы - тогда берем следующий свободный
+        conn = self.connect()
+        op = record["op"]
+        if op in ("add", "add_batch"):
+            try:
+                self.insert_record(record)
+            except sqlite3.IntegrityError:
+                # Поиск свободного ID и вставка - одна транзакция, иначе между ними
+                # этот ID может занять еще одна копия программы
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    first_free = (conn.execute("SELECT MAX(id) FROM listings").fetchone()[0] or 0) + 1
+                    record, renamed = renumber_record(record, record_ids(record), first_free)
+                    self.insert_record(record)
+                return RemoteChanges(renamed=renamed)
+        elif op == "edit":
+            row = record["row"]
+            assignments = ", ".join(f"{self.quote(col)} = ?" for col in row)
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE listings SET {assignments} WHERE id = ?",
+                    [to_sqlite_value(col, value) for col, value in row.items()] + [record["id"]]
+                )
+            if cursor.rowcount == 0:
+                # Объект удалили в другой копии программы
+                return RemoteChanges(conflict=record["id"])
+        elif op == "delete":
+            with conn:
+                conn.executemany("DELETE FROM listings WHERE id = ?", [(row_id,) for row_id in record["ids"]])
+        else:
+            raise ValueError(f"Неизвестная операция: {op}")
+        return RemoteChanges()
+
+    def insert_record(self, record):
+        if record["op"] == "add":
+            self.insert_rows([dict(record["row"], **{ID_COLUMN: record["id"]})])
+        else:
+            self.insert_rows(record["rows"])
+
+    def save(self, df, version=None):
+        # Полная перезапись таблицы из DataFrame
+        self.insert_rows(frame_for_csv(df).to_dict('records'), replace=True)
+
+    def close(self, df, version=None):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def migrate_csv_to_sqlite(csv_path, db_path):
+    # Однократный перенос базы из CSV (вместе с журналом) в SQLite
+    df = JournalStorage(csv_path).load()
+    storage = SqliteStorage(db_path)
+    storage.save(df)
+    storage.close(df)
+    return len(df)
+
+
+def create_storage(csv_path):
+    csv_path = Path(csv_path)
+    if STORAGE_MODE == "sqlite":
+        db_path = csv_path.with_suffix(".sqlite3")
+        if not db_path.exists() and csv_path.exists():
+            count = migrate_csv_to_sqlite(csv_path, db_path)
+            print(f"База перенесена из {csv_path} в {db_path}: {count} объектов")
+        return SqliteStorage(db_path)
+    if STORAGE_MODE == "csv":
+        return CsvStorage(csv_path)
+    return JournalStorage(csv_path)
+
+
+def lazy_text_fields():
+    # Поля, которые окно читает не при запуске, а когда они понадобятся.
+    # В режиме "csv" каждое изменение переписывает весь файл - тексты нужны сразу
+    if not LAZY_TEXT_LOADING or STORAGE_MODE == "csv":
+        return []
+    return list(LAZY_TEXT_FIELDS)
+
+
+def format_column(series, field, wrap=True):
+    # Столбец DataFrame в строки для показа, без цикла по ячейкам
+    if field == 'Дата занесения в базу':
+        return pd.to_datetime(series, errors='coerce').dt.strftime('%d.%m.%Y').fillna("")
+    if pd.api.types.is_numeric_dtype(series):
+        return number_text(series)
+    
+    text = series.astype(str).where(series.notna(), "")
+    if wrap and field in WRAPPED_FIELDS:
+        # Добавляем переносы каждые WRAP_WIDTH символов
+        text = text.str.replace(f"(?s)(.{{{WRAP_WIDTH}}})(?=.)", "\\1\n", regex=True)
+    return text
+
+
+def format_rows(df, columns, wrap=True):
+    # Строки DataFrame в виде готовых кортежей значений в порядке columns
+    formatted = [
+        format_column(df[field], field, wrap).tolist() if field in df.columns else [""] * len(df)
+        for field in columns
+    ]
+    return list(zip(*formatted))
+
+
+class RowFormatter:
+    # Кэш отформатированных строк; при изменениях пересчитываются только затронутые строки.
+    # ids - ID объектов в том же порядке, что и rows
+
+    def __init__(self, columns, wrap=True):
+        self.columns = list(columns)
+        self.wrap = wrap
+        self.rows = None
+        self.ids = None
+
+    def invalidate(self):
+        self.rows = None
+        self.ids = None
+
+    def get(self, df):
+        if self.rows is None:
+            self.rows = format_rows(df, self.columns, self.wrap)
+            self.ids = df[ID_COLUMN].tolist()
+        return self.rows
+
+    def apply(self, change, df):
+        # Применяем запись об изменении к кэшу
+        if self.rows is None:
+            return
+        op = change["op"]
+        if op == "add":
+            added = df.iloc[len(self.rows):]
+            self.rows.extend(format_rows(added, self.columns, self.wrap))
+            self.ids.extend(added[ID_COLUMN].tolist())
+        elif op == "edit":
+            index = row_position(df, change["id"])
+            self.rows[index] = format_rows(df.iloc[index:index + 1], self.columns, self.wrap)[0]
+        elif op == "delete":
+            deleted = set(change["ids"])
+            kept = [i for i, row_id in enumerate(self.ids) if row_id not in deleted]
+            self.rows = [self.rows[i] for i in kept]
+            self.ids = [self.ids[i] for i in kept]
+        else:
+            self.invalidate()
+
+
+# Столбцы выгрузки в Excel и их заголовки
+EXPORT_COLUMNS = {
+    "Объект": "Объект",
+    "Адрес": "адрес",
+    "Кадастровый №": "кадастровый №",
+    "Цена": "цена",
+    "Площадь": "S",
+    "Комнаты": "комнаты",
+    "Жилая": "жил",
+    "Кухня": "Кух",
+    "Санузел": "с/у",
+    "Этаж/этажность": "этаж",
+    "Участок": "участок",
+    "Дом": "дом",
+    "Год постройки": "год",
+    "Контакт ФИО": "контакт",
+    "Телефон": "телефон",
+    "Примечание": "ВАЖНО!"
+}
+
+def export_frame(df):
+    # Данные для выгрузки: нужные столбцы с заголовками Excel, сортировка по объекту
+    export_df = df[[col for col in EXPORT_COLUMNS if col in df.columns]]
+    if 'Объект' in export_df.columns:
+        order = pd.Series(pd.Categorical(export_df['Объект'], categories=OBJECT_ORDER, ordered=True))
+        export_df = export_df.iloc[order.sort_values(kind='stable').index]
+    return export_df.rename(columns=EXPORT_COLUMNS)
+
+
+def write_excel_export(export_df, excel_filename):
+    # Потоковая запись: каждая строка пишется один раз, в режиме constant_memory
+    # xlsxwriter держит в памяти только текущую строку листа
+    import xlsxwriter
+    
+    # Ширина столбцов под содержимое: по одному столбцу, без копии всей таблицы
+    widths = []
+    for column in export_df.columns:
+        length = format_column(export_df[column], column, wrap=False).str.len().max()
+        widths.append(max(int(length) if pd.notna(length) else 0, len(column)) + 2)
+    
+    workbook = xlsxwriter.Workbook(str(excel_filename), {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('Недвижимость')
+        
+        # Настраиваем форматирование
+        # 1. Устанавливаем альбомную ориентацию
+        worksheet.set_landscape()
+        
+        # 2. Устанавливаем масштаб для размещения на одном листе
+        worksheet.fit_to_pages(1, 1)  # 1 страница в ширину, 1 в высоту
+        
+        # 3. Создаем форматы для ячеек
+        header_format = workbook.add_format({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'top',
+            'align': 'center',
+            'border': 1
+        })
+        
+        cell_format = workbook.add_format({
+            'text_wrap': True,
+            'valign': 'top',
+            'border': 1
+        })
+        
+        # 4. Ширина столбцов задается до записи строк
+        for i, width in enumerate(widths):
+            worksheet.set_column(i, i, width)
+        
+        # 5. Заголовок и данные - по одной записи на строку с общим форматом строки
+        worksheet.write_row(0, 0, list(export_df.columns), header_format)
+        # Пустые значения (NaN, NA) пишем пустыми ячейками, а не ошибками Excel;
+        # проверяются только столбцы, в которых пустые значения есть
+        blank = [i for i, column in enumerate(export_df.columns) if export_df[column].isna().any()]
+        for row_num, row in enumerate(export_df.itertuples(index=False, name=None), start=1):
+            if blank:
+                row = list(row)
+                for i in blank:
+                    if row[i] is pd.NA or row[i] != row[i]:
+                        row[i] = None
+            worksheet.write_row(row_num, 0, row, cell_format)
+    finally:
+        workbook.close()
+    PROFILER.add_bytes(os.path.getsize(excel_filename))
+
+
+# Импорт объектов из файлов партнеров (CSV или XLSX): файл читается частями
+# по IMPORT_CHUNK_ROWS строк, отчет об ошибках пишется рядом с базой
+IMPORT_CHUNK_ROWS = 1000
+IMPORT_REPORT_NAME = "real_estate_import_report.csv"
+
+# Другие названия столбцов во внешних файлах -> поле базы
+# (названия полей и заголовки нашей выгрузки в Excel распознаются и без этого)
+IMPORT_COLUMN_ALIASES = {
+    "дата": "Дата занесения в базу",
+    "дата занесения": "Дата занесения в базу",
+    "тип": "Объект",
+    "тип объекта": "Объект",
+    "кадастровый номер": "Кадастровый №",
+    "стоимость": "Цена",
+    "общая площадь": "Площадь",
+    "жилая площадь": "Жилая",
+    "площадь кухни": "Кухня",
+    "этажность": "Этаж/этажность",
+    "контакт": "Контакт ФИО",
+    "фио": "Контакт ФИО",
+    "собственник": "Контакт ФИО",
+    "тел": "Телефон",
+    "комментарий": "Примечание",
+}
+
+
+def import_header_key(header):
+    return " ".join(str(header).lower().replace("ё", "е").strip(" .:").split())
+
+
+def import_column_map(headers):
+    # Столбцы файла -> поля базы; нераспознанные и повторные столбцы пропускаются
+    known = {import_header_key(field): field for field in COLUMNS}
+    known.update({import_header_key(title): field for field, title in EXPORT_COLUMNS.items()})
+    known.update(IMPORT_COLUMN_ALIASES)
+    
+    mapping = {}
+    skipped = []
+    for header in headers:
+        field = known.get(import_header_key(header))
+        if field is None or field in mapping.values():
+            skipped.append(str(header))
+        else:
+            mapping[header] = field
+    return mapping, skipped
+
+
+def import_cell_text(value):
+    # Значение ячейки Excel/CSV -> текст, как если бы его ввели в форму
+    if value is None:
+        return ""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%d.%m.%Y')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def living_area_column(values):
+    # "12+15,5" -> "27.5": сумма комнат через '+'; "" - если там не числа
+    rooms = values["Комнаты"].str.replace(r"\s", "", regex=True).str.replace(",", ".", regex=False)
+    parts = rooms.str.split("+", expand=True)
+    numbers = parts.apply(pd.to_numeric, errors='coerce')
+    valid = (rooms != "") & (numbers.notna().sum(axis=1) == parts.notna().sum(axis=1))
+    return number_text(numbers.sum(axis=1)).where(valid, "")
+
+
+def price_per_meter_column(values):
+    # Цена за квадратный метр, округленная до рубля; "" - если цены или площади нет
+    price = parse_number_text(values["Цена"])
+    area = parse_number_text(values["Площадь"])
+    per_meter = (price / area.where(area > 0)).round()
+    return number_text(per_meter).str.replace(r"\B(?=(\d{3})+$)", " ", regex=True)
+
+
+def valid_dates(text):
+    return pd.to_datetime(text, format='%d.%m.%Y', errors='coerce').notna()
+
+
+def pattern_check(pattern):
+    # Проверка "значение целиком подходит под регулярное выражение"
+    return lambda text: text.str.fullmatch(pattern).astype(bool)
+
+
+class DerivedRule:
+    # Вычисляемое значение target по полям sources. compute(values) получает
+    # DataFrame текстовых значений полей и возвращает Series текста ("" - не вычисляется).
+    # Поле из SCHEMA в форме заполняется при вводе sources, при импорте - только если пустое;
+    # значение не из SCHEMA показывается в форме как подсказка
+
+    def __init__(self, target, sources, compute):
+        self.target = target
+        self.sources = sources
+        self.compute = compute
+
+
+class FormatRule:
+    # Проверка формата непустого значения поля: valid(text) - маска верных значений
+
+    def __init__(self, field, valid, message):
+        self.field = field
+        self.valid = valid
+        self.message = message
+
+
+PHONE_PATTERN = r"(?:\+7|8)?[\s\-]*\(?\d{3}\)?[\s\-]*\d{3}[\s\-]*\d{2}[\s\-]*\d{2}"
+
+# Правила форм добавления и правки: вычисляемые значения и проверки формата.
+# Те же правила применяются ко всей базе после загрузки (см. check_frame)
+DERIVED_RULES = [
+    DerivedRule("Жилая", ["Комнаты"], living_area_column),
+    DerivedRule("Цена за м²", ["Цена", "Площадь"], price_per_meter_column),
+]
+FORMAT_RULES = [
+    FormatRule("Дата занесения в базу", valid_dates, "не в формате ДД.ММ.ГГГГ"),
+    FormatRule("Телефон", pattern_check(rf"{PHONE_PATTERN}(?:\s*[,;]\s*{PHONE_PATTERN})*"),
+               "не в формате +7 (900) 123-45-67"),
+    FormatRule("Кадастровый №", pattern_check(r"\d{2}:\d{2}:\d{6,7}:\d{1,5}"),
+               "не в формате 50:01:0012345:67"),
+]
+
+
+def check_listings(values):
+    # Проверки формата по DataFrame текстовых значений полей, сразу по всем строкам.
+    # Возвращаем {номер строки: [замечания]} только для строк с замечаниями
+    problems = {}
+    for rule in FORMAT_RULES:
+        if rule.field not in values.columns:
+            continue
+        text = values[rule.field].astype(object).fillna("").astype(str).str.strip()
+        invalid = (text != "") & ~rule.valid(text)
+        for i in invalid.to_numpy().nonzero()[0]:
+            problems.setdefault(int(i), []).append(f"{rule.field}: \"{text.iloc[i]}\" {rule.message}")
+    return problems
+
+
+def check_frame(df):
+    # Проверка уже занесенных объектов: {ID: [замечания]}.
+    # Столбец дат в базе уже разобран (datetime), его проверять не нужно
+    values = pd.DataFrame({
+        rule.field: format_column(df[rule.field], rule.field, wrap=False)
+        for rule in FORMAT_RULES
+        if rule.field in df.columns and not pd.api.types.is_datetime64_any_dtype(df[rule.field])
+    }, index=df.index)
+    ids = df[ID_COLUMN].tolist()
+    return {ids[i]: messages for i, messages in check_listings(values).items()}
+
+
+def normalize_listings(values):
+    # Общие правила для формы и импорта. values - DataFrame текстовых значений полей;
+    # возвращаем строки базы (все столбцы COLUMNS) и список ошибок для каждой строки
+    rows = pd.DataFrame({
+        field: values[field].fillna("").astype(str).str.strip() if field in values.columns else ""
+        for field in COLUMNS
+    }, index=values.index)
+    errors = [[] for _ in range(len(rows))]
+    
+    def report(mask, message):
+        for i in mask.to_numpy().nonzero()[0]:
+            errors[i].append(message(rows.iloc[i]))
+    
+    # Участок указывается в сотках
+    plot = rows["Участок"]
+    rows["Участок"] = plot.where((plot == "") | plot.str.endswith("соток"), plot + " соток")
+    
+    # Пустые вычисляемые поля (жилая площадь - сумма комнат) заполняются по DERIVED_RULES
+    for rule in DERIVED_RULES:
+        if rule.target in rows.columns:
+            rows[rule.target] = rows[rule.target].where(rows[rule.target] != "", rule.compute(rows))
+    
+    # Пустая дата - сегодняшняя, остальные разбираются как DD.MM.YYYY
+    date_text = rows["Дата занесения в базу"].replace("", datetime.now().strftime("%d.%m.%Y"))
+    dates = pd.to_datetime(date_text, format='%d.%m.%Y', errors='coerce')
+    report(dates.isna(), lambda row: f"дата \"{row['Дата занесения в базу']}\" не в формате ДД.ММ.ГГГГ")
+    rows["Дата занесения в базу"] = dates
+    
+    # Поля со списком и числовые поля проверяются по схеме
+    for field in SCHEMA:
+        text = rows[field.name]
+        if field.kind == "category":
+            report((text != "") & ~text.isin(field.options),
+                   lambda row, name=field.name: f"{name}: недопустимое значение \"{row[name]}\"")
+        elif field.kind in ("int", "float"):
+            numbers = parse_number_text(text)
+            report((text != "") & numbers.isna(),
+                   lambda row, name=field.name: f"{name}: \"{row[name]}\" не число")
+            if field.kind == "int":
+                report(numbers.notna() & (numbers % 1 != 0),
+                       lambda row, name=field.name: f"{name}: \"{row[name]}\" не целое число")
+    return rows, errors
+
+
+def detect_csv_format(path):
+    # Кодировка (UTF-8 или Windows-1251) и разделитель по началу файла
+    with open(path, 'rb') as f:
+        sample = f.read(64 * 1024)
+    try:
+        text = codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        text = sample.decode('cp1251', errors='replace')
+        encoding = 'cp1251'
+    first_line = text.lstrip('\ufeff').split('\n', 1)[0]
+    separator = max([';', ',', '\t'], key=first_line.count)
+    return encoding, separator
+
+
+def read_import_chunks(path):
+    # Части файла: (номер первой строки в файле, DataFrame текстовых значений)
+    if Path(path).suffix.lower() == '.xlsx':
+        # Лист читается построчно, целиком в памяти не держится
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+            headers = [import_cell_text(value) for value in next(sheet_rows, ())]
+            chunk = []
+            line = 2
+            for values in sheet_rows:
+                chunk.append([import_cell_text(value) for value in values[:len(headers)]])
+                if len(chunk) == IMPORT_CHUNK_ROWS:
+                    yield line, pd.DataFrame(chunk, columns=headers)
+                    line += len(chunk)
+                    chunk = []
+            if chunk:
+                yield line, pd.DataFrame(chunk, columns=headers)
+        finally:
+            workbook.close()
+        return
+    
+    encoding, separator = detect_csv_format(path)
+    line = 2
+    for chunk in pd.read_csv(path, sep=separator, encoding=encoding, dtype=str,
+                             keep_default_na=False, chunksize=IMPORT_CHUNK_ROWS):
+        yield line, chunk
+        line += len(chunk)
+
+
+def read_import_file(path, report_path):
+    # Разбираем файл целиком; строки с ошибками не импортируются, а попадают в отчет.
+    # Возвращаем (строки для базы, число строк с ошибками, пропущенные столбцы, путь к отчету)
+    if Path(path).suffix.lower() not in ('.csv', '.txt', '.xlsx'):
+        raise ValueError("Поддерживаются файлы CSV и XLSX")
+    
+    parts = []
+    problems = []
+    skipped = []
+    for line, chunk in read_import_chunks(path):
+        if not parts and not problems:
+            mapping, skipped = import_column_map(chunk.columns)
+            if not mapping:
+                raise ValueError("В файле нет ни одного известного столбца базы")
+        values = chunk[list(mapping)].rename(columns=mapping)
+        # Полностью пустые строки пропускаем молча
+        values = values[(values.fillna("").astype(str).apply(lambda col: col.str.strip()) != "").any(axis=1)]
+        rows, errors = normalize_listings(values)
+        ok = [not row_errors for row_errors in errors]
+        for index, row_errors in zip(rows.index, errors):
+            if row_errors:
+                problems.append((line + index - chunk.index[0], "; ".join(row_errors)))
+        parts.append(rows[ok])
+    
+    rows = pd.concat(parts, ignore_index=True) if parts else normalize_listings(pd.DataFrame())[0]
+    
+    report_file = None
+    if problems or skipped:
+        report = pd.DataFrame(problems, columns=["Строка", "Ошибка"])
+        if skipped:
+            report.loc[len(report)] = ["", "Пропущены столбцы: " + ", ".join(skipped)]
+        write_file_atomic(report_path, report.to_csv(index=False).encode('utf-8-sig'))
+        report_file = report_path
+    return rows, len(problems), skipped, report_file
+
+
+# Слово для поиска: буквы и цифры, вместе с разделителями внутри
+# (кадастровый номер 50:12:0000000:123, номер дома 5/1, "д.5")
+SEARCH_TOKEN_RE = re.compile(r"\w+(?:[:/.\-]\w+)*")
+
+# Запрос, похожий на телефон: ищем по одним цифрам
+PHONE_QUERY_RE = re.compile(r"^[\d\s()+\-]+$")
+
+
+def normalize_search_text(text):
+    return text.lower().replace("ё", "е")
+
+
+def search_text_column(df):
+    # Текст полей поиска каждой строки в нижнем регистре (None, если полей поиска нет).
+    # Телефон индексируется одними цифрами: "+7 (916) 123-45-67" -> "79161234567"
+    parts = []
+    for field in SEARCH_FIELDS:
+        if field not in df.columns:
+            continue
+        text = df[field].astype(str).where(df[field].notna(), "")
+        if field == "Телефон":
+            text = text.str.replace(r"\D", "", regex=True)
+        parts.append(text)
+    if not parts:
+        return None
+    combined = parts[0].str.cat(parts[1:], sep=" ")
+    return combined.str.lower().str.replace("ё", "е", regex=False)
+
+
+def search_tokens(df):
+    # Множество слов поиска для каждой строки DataFrame
+    combined = search_text_column(df)
+    if combined is None:
+        return [set() for _ in range(len(df))]
+    return [set(tokens) for tokens in combined.str.findall(SEARCH_TOKEN_RE)]
+
+
+def search_fragments(query):
+    # Фрагменты запроса; запрос из одних цифр и знаков телефона - одни цифры
+    query = normalize_search_text(query.strip())
+    if PHONE_QUERY_RE.match(query) and len(re.sub(r"\D", "", query)) >= 5:
+        return [re.sub(r"\D", "", query)]
+    return SEARCH_TOKEN_RE.findall(query)
+
+
+class SearchIndex:
+    # Инвертированный индекс: слово -> ID объектов.
+    # Подстрока ищется по словарю всех слов, склеенному в одну строку
+    # (str.find работает на C), затем объединяются списки найденных слов.
+    # doc_text - слова каждого объекта через "\n" для проверки кандидатов.
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_text = {}
+        self.vocabulary = None
+
+    def build(self, df):
+        self.postings = {}
+        self.doc_text = {}
+        for row_id, tokens in zip(df[ID_COLUMN].tolist(), search_tokens(df)):
+            self.add_tokens(row_id, tokens)
+        self.vocabulary = None
+
+    def add_tokens(self, row_id, tokens):
+        self.doc_text[row_id] = "\n".join(tokens)
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = {row_id}
+                self.vocabulary = None
+            else:
+                ids.add(row_id)
+
+    def remove(self, row_id):
+        text = self.doc_text.pop(row_id, "")
+        for token in text.split("\n") if text else ():
+            ids = self.postings[token]
+            ids.discard(row_id)
+            if not ids:
+                del self.postings[token]
+                self.vocabulary = None
+
+    def apply(self, change, df):
+        # Обновляем индекс по записи об изменении, не перестраивая его целиком
+        op = change["op"]
+        if op in ("add", "edit"):
+            index = row_position(df, change["id"])
+            self.remove(change["id"])
+            self.add_tokens(change["id"], search_tokens(df.iloc[index:index + 1])[0])
+        elif op == "delete":
+            for row_id in change["ids"]:
+                self.remove(row_id)
+
+    def matching_tokens(self, fragment):
+        # Слова словаря, содержащие fragment
+        if self.vocabulary is None:
+            self.vocabulary = "\n".join(self.postings)
+        vocabulary = self.vocabulary
+        tokens = []
+        position = vocabulary.find(fragment)
+        while position != -1:
+            # Границы слова, в котором нашелся фрагмент
+            start = vocabulary.rfind("\n", 0, position) + 1
+            end = vocabulary.find("\n", position + len(fragment))
+            if end == -1:
+                end = len(vocabulary)
+            tokens.append(vocabulary[start:end])
+            position = vocabulary.find(fragment, end)
+        return tokens
+
+    def search(self, query):
+        # Все слова запроса должны найтись (как подстроки) в одном объекте
+        fragments = search_fragments(query)
+        if not fragments:
+            return set()
+        
+        # Самый длинный фрагмент ищем по словарю - у него меньше всего совпадений.
+        # Очень короткий фрагмент встречается почти везде, его проще проверить перебором
+        fragments = sorted(set(fragments), key=len, reverse=True)
+        first = fragments[0]
+        if len(first) < 3:
+            result = {row_id for row_id, text in self.doc_text.items() if first in text}
+        else:
+            result = set()
+            for token in self.matching_tokens(first):
+                result.update(self.postings[token])
+        
+        # Остальные фрагменты проверяем только у найденных кандидатов
+        for fragment in fragments[1:]:
+            if not result:
+                break
+            doc_text = self.doc_text
+            result = {row_id for row_id in result if fragment in doc_text[row_id]}
+        return result
+
+
+def parse_number(series):
+    # Первое число из текста: "5 000 000 руб" -> 5000000, "45,5" -> 45.5.
+    # Числовые столбцы (см. SCHEMA) берутся как есть
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    text = series.astype(str).str.replace(r"\s", "", regex=True).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text.str.extract(r"(-?\d+(?:\.\d+)?)", expand=False), errors='coerce')
+
+
+def parse_date_days(series):
+    # Дата как число дней от 1970-01-01 (NaN, если даты нет)
+    dates = pd.to_datetime(series, errors='coerce')
+    return (dates - pd.Timestamp(0)).dt.days.astype(float)
+
+
+# Поля фильтра по диапазону и разбор их значений в числа
+RANGE_FIELDS = {
+    "Цена": parse_number,
+    "Площадь": parse_number,
+    "Год постройки": parse_number,
+    "Дата занесения в базу": parse_date_days,
+}
+
+
+class SortedColumnIndex:
+    # Отсортированные значения одного столбца и ID объектов в том же порядке.
+    # Диапазон значений находится двоичным поиском (np.searchsorted).
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.values = np.empty(0)
+        self.ids = np.empty(0, dtype='int64')
+        self.value_of = {}
+
+    def build(self, df, field):
+        values = self.parse(df[field]).to_numpy(dtype=float)
+        ids = df[ID_COLUMN].to_numpy(dtype='int64')
+        known = ~np.isnan(values)
+        values, ids = values[known], ids[known]
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.ids = ids[order]
+        self.value_of = dict(zip(ids.tolist(), values.tolist()))
+
+    def remove(self, row_id):
+        value = self.value_of.pop(row_id, None)
+        if value is None:
+            return
+        start = np.searchsorted(self.values, value, 'left')
+        stop = np.searchsorted(self.values, value, 'right')
+        position = start + int((self.ids[start:stop] == row_id).nonzero()[0][0])
+        self.values = np.delete(self.values, position)
+        self.ids = np.delete(self.ids, position)
+
+    def insert(self, row_id, value):
+        if np.isnan(value):
+            return
+        position = np.searchsorted(self.values, value, 'right')
+        self.values = np.insert(self.values, position, value)
+        self.ids = np.insert(self.ids, position, row_id)
+        self.value_of[row_id] = value
+
+    def range_ids(self, low=None, high=None):
+        # ID объектов со значением в [low, high]
+        start = 0 if low is None else np.searchsorted(self.values, low, 'left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, 'right')
+        return self.ids[start:stop]
+
+
+class RangeFilterIndex:
+    # Отсортированные индексы по цене, площади, году постройки и дате занесения,
+    # плюс списки ID по типу объекта. Результат фильтра - битовая маска по ID.
+
+    def __init__(self):
+        self.columns = {field: SortedColumnIndex(parse) for field, parse in RANGE_FIELDS.items()}
+        self.objects = {}
+        self.object_of = {}
+
+    def build(self, df):
+        for field, index in self.columns.items():
+            index.build(df, field)
+        self.objects = {}
+        self.object_of = {}
+        for row_id, value in zip(df[ID_COLUMN].tolist(), df["Объект"].tolist()):
+            self.add_object(row_id, value)
+
+    def add_object(self, row_id, value):
+        if isinstance(value, str) and value:
+            self.objects.setdefault(value, set()).add(row_id)
+            self.object_of[row_id] = value
+
+    def remove(self, row_id):
+        for index in self.columns.values():
+            index.remove(row_id)
+        value = self.object_of.pop(row_id, None)
+        if value is not None:
+            self.objects[value].discard(row_id)
+
+    def apply(self, change, df):
+        # Обновляем индексы по записи об изменении
+        op = change["op"]
+        if op in ("add", "edit"):
+            row_id = change["id"]
+            self.remove(row_id)
+            index = row_position(df, row_id)
+            row = df.iloc[index:index + 1]
+            for field, column_index in self.columns.items():
+                column_index.insert(row_id, float(column_index.parse(row[field]).iloc[0]))
+            self.add_object(row_id, row["Объект"].iloc[0])
+        elif op == "delete":
+            for row_id in change["ids"]:
+                self.remove(row_id)
+
+    def query(self, ranges, object_type, size):
+        # ranges: поле -> (от, до); size - длина маски (максимальный ID + 1)
+        bitmap = np.ones(size, dtype=bool)
+        for field, (low, high) in ranges.items():
+            matched = np.zeros(size, dtype=bool)
+            matched[self.columns[field].range_ids(low, high)] = True
+            bitmap &= matched
+        if object_type:
+            matched = np.zeros(size, dtype=bool)
+            matched[list(self.objects.get(object_type, ()))] = True
+            bitmap &= matched
+        return bitmap
+
+
+def sort_key(series, field):
+    # Ключ сортировки столбца: числа и даты - числа (пусто - NaN), поля со списком -
+    # номер значения в списке схемы (Объект: комната, 1-ккв ... участок), текст - строка
+    # без учета регистра (пусто - "")
+    kind = FIELDS[field].kind if field in FIELDS else "text"
+    if kind in ("int", "float"):
+        return parse_number(series).to_numpy(dtype=float)
+    if kind == "date":
+        return parse_date_days(series).to_numpy(dtype=float)
+    if kind == "category":
+        # Значения не из списка идут после значений из списка
+        options = FIELDS[field].options
+        codes = pd.Categorical(series.astype(object), categories=options).codes.astype(float)
+        codes[codes < 0] = len(options)
+        codes[series.isna().to_numpy()] = np.nan
+        return codes
+    text = series.astype(str).where(series.notna(), "").str.strip().str.casefold()
+    return text.to_numpy(dtype=object)
+
+
+class SortKeys:
+    # Ключи сортировки по столбцам: считаются при первой сортировке по столбцу
+    # и дальше обновляются по записям об изменениях, как RowFormatter.
+    # Текстовые ключи заменяются номерами в алфавитном словаре столбца (words),
+    # чтобы повторная сортировка шла по числам, а не сравнивала строки.
+    # order() - номера строк DataFrame в порядке сортировки, пустые значения в конце
+
+    def __init__(self):
+        self.keys = {}
+        self.words = {}
+        self.ids = None
+        self.orders = {}
+
+    def invalidate(self):
+        self.keys = {}
+        self.words = {}
+        self.ids = None
+        self.orders = {}
+
+    def key(self, df, field):
+        if self.ids is None:
+            self.ids = df[ID_COLUMN].to_numpy(dtype='int64')
+        if field not in self.keys:
+            keys = sort_key(df[field], field)
+            if keys.dtype == object:
+                self.words[field], codes = np.unique(keys, return_inverse=True)
+                codes = codes.astype(float)
+                codes[keys == ""] = np.nan
+                keys = codes
+            # Своя копия: ключи меняются на месте при правке строк
+            self.keys[field] = np.array(keys, dtype=float)
+        return self.keys[field]
+
+    def new_keys(self, field, series):
+        # Ключи для новых значений; None - в словаре столбца таких строк нет,
+        # ключи столбца надо пересчитать заново
+        keys = sort_key(series, field)
+        if field not in self.words:
+            return keys
+        words = self.words[field]
+        positions = np.searchsorted(words, keys)
+        known = positions < len(words)
+        known[known] = words[positions[known]] == keys[known]
+        if not known.all():
+            return None
+        codes = positions.astype(float)
+        codes[keys == ""] = np.nan
+        return codes
+
+    def order(self, df, field, descending=False):
+        cached = self.orders.get((field, descending))
+        if cached is not None:
+            return cached
+        keys = self.key(df, field)
+        # NaN при сортировке numpy всегда в конце; равные ключи сохраняют порядок базы
+        order = np.argsort(-keys if descending else keys, kind='stable')
+        self.orders[(field, descending)] = order
+        return order
+
+    def apply(self, change, df):
+        # Применяем запись об изменении к ключам; порядок пересчитается при следующем запросе
+        if self.ids is None:
+            return
+        self.orders = {}
+        op = change["op"]
+        if op == "add":
+            added = df.iloc[len(self.ids):]
+            self.ids = np.concatenate([self.ids, added[ID_COLUMN].to_numpy(dtype='int64')])
+            for field in list(self.keys):
+                keys = self.new_keys(field, added[field])
+                if keys is None:
+                    self.drop(field)
+                else:
+                    self.keys[field] = np.concatenate([self.keys[field], keys])
+        elif op == "edit":
+            index = row_position(df, change["id"])
+            for field in list(self.keys):
+                keys = self.new_keys(field, df[field].iloc[index:index + 1])
+                if keys is None:
+                    self.drop(field)
+                else:
+                    self.keys[field][index] = keys[0]
+        elif op == "delete":
+            kept = ~np.isin(self.ids, np.asarray(change["ids"], dtype='int64'))
+            self.ids = self.ids[kept]
+            self.keys = {field: keys[kept] for field, keys in self.keys.items()}
+        else:
+            self.invalidate()
+
+    def drop(self, field):
+        del self.keys[field]
+        self.words.pop(field, None)
+
+
+# Слова, которые не различают адреса: "ул. Ленина, д. 5" и "Ленина 5" - один адрес
+ADDRESS_STOP_WORDS = {
+    "г", "город", "ул", "улица", "пр", "пр-т", "проспект", "пер", "переулок", "б-р", "бульвар",
+    "ш", "шоссе", "наб", "набережная", "пл", "площадь", "д", "дом", "кв", "квартира",
+    "п", "пос", "поселок", "с", "село", "деревня", "снт", "обл", "область", "р-н", "район",
+}
+ADDRESS_TOKEN_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*|\d+")
+PHONE_RE = re.compile(r"\+?\d[\d\s()\-]{4,}\d")
+
+
+def cadastral_keys(value):
+    # Кадастровый номер без пробелов и лишних знаков: "50:12: 0000000:123" -> "50:12:0000000:123"
+    key = re.sub(r"[^\d:]", "", value)
+    return [key] if len(key) - key.count(":") >= 6 else []
+
+
+def address_keys(value):
+    tokens = ADDRESS_TOKEN_RE.findall(normalize_search_text(value))
+    key = " ".join(token for token in tokens if token not in ADDRESS_STOP_WORDS)
+    return [key] if key else []
+
+
+def phone_keys(value):
+    # Каждый номер в поле - отдельный ключ, в виде 7XXXXXXXXXX
+    keys = []
+    for match in PHONE_RE.findall(value):
+        digits = re.sub(r"\D", "", match)
+        if len(digits) == 11 and digits[0] == "8":
+            digits = "7" + digits[1:]
+        elif len(digits) == 10:
+            digits = "7" + digits
+        if digits not in keys:
+            keys.append(digits)
+    return keys
+
+
+# Поля, по которым ищутся дубликаты, и их нормализация
+DUPLICATE_KEYS = {
+    "Кадастровый №": cadastral_keys,
+    "Адрес": address_keys,
+    "Телефон": phone_keys,
+}
+DUPLICATES_REPORT_NAME = "real_estate_duplicates.csv"
+
+
+class DuplicateIndex:
+    # Хеш-индексы по нормализованным кадастровому номеру, адресу и телефону:
+    # ключ -> множество ID. Проверка нового объекта - несколько обращений к словарям.
+
+    def __init__(self):
+        self.postings = {field: {} for field in DUPLICATE_KEYS}
+        self.keys_of = {}
+
+    def build(self, df):
+        # Ключи считаются по столбцам, без промежуточного словаря на каждую строку
+        self.postings = {field: {} for field in DUPLICATE_KEYS}
+        self.keys_of = {row_id: [] for row_id in df[ID_COLUMN].tolist()}
+        for field, make_keys in DUPLICATE_KEYS.items():
+            postings = self.postings[field]
+            for row_id, value in zip(self.keys_of, df[field].tolist()):
+                if isinstance(value, str) and value:
+                    for key in make_keys(value):
+                        postings.setdefault(key, set()).add(row_id)
+                        self.keys_of[row_id].append((field, key))
+
+    @staticmethod
+    def row_keys(values):
+        keys = []
+        for field, make_keys in DUPLICATE_KEYS.items():
+            value = values.get(field)
+            if isinstance(value, str) and value:
+                keys.extend((field, key) for key in make_keys(value))
+        return keys
+
+    def add(self, row_id, values):
+        keys = self.row_keys(values)
+        for field, key in keys:
+            self.postings[field].setdefault(key, set()).add(row_id)
+        self.keys_of[row_id] = keys
+
+    def remove(self, row_id):
+        for field, key in self.keys_of.pop(row_id, ()):
+            ids = self.postings[field][key]
+            ids.discard(row_id)
+            if not ids:
+                del self.postings[field][key]
+
+    def apply(self, change, df):
+        op = change["op"]
+        if op in ("add", "edit"):
+            row_id = change["id"]
+            self.remove(row_id)
+            index = row_position(df, row_id)
+            self.add(row_id, {field: df.at[index, field] for field in DUPLICATE_KEYS})
+        elif op == "delete":
+            for row_id in change["ids"]:
+                self.remove(row_id)
+
+    def find(self, values, exclude_id=None):
+        # Совпадения для значений формы: поле -> ID объектов с тем же ключом
+        matches = {}
+        for field, key in self.row_keys(values):
+            ids = self.postings[field].get(key, set()) - {exclude_id}
+            if ids:
+                matches.setdefault(field, set()).update(ids)
+        return {field: sorted(ids) for field, ids in matches.items()}
+
+    def groups(self):
+        # Группы дубликатов: (поле, ключ, ID) для каждого ключа, встречающегося больше одного раза
+        for field, postings in self.postings.items():
+            for key, ids in postings.items():
+                if len(ids) > 1:
+                    yield field, key, sorted(ids)
+
+
+def write_duplicates_report(df, report_path):
+    # Все дубликаты базы за один проход: строим индекс и выписываем группы.
+    # Возвращаем число групп
+    index = DuplicateIndex()
+    index.build(df)
+    
+    positions = pd.Series(range(len(df)), index=df[ID_COLUMN].to_numpy())
+    report_columns = [ID_COLUMN, "Дата занесения в базу", "Объект", "Адрес", "Кадастровый №", "Контакт ФИО", "Телефон"]
+    parts = []
+    for group_number, (field, key, ids) in enumerate(index.groups(), start=1):
+        part = df.iloc[positions[ids].to_numpy()][report_columns]
+        part.insert(0, "Совпадение", f"{field}: {key}")
+        part.insert(0, "Группа", group_number)
+        parts.append(part)
+    
+    if parts:
+        report = pd.concat(parts, ignore_index=True)
+    else:
+        report = pd.DataFrame(columns=["Группа", "Совпадение"] + report_columns)
+    write_file_atomic(report_path, frame_for_csv(report).to_csv(index=False).encode('utf-8-sig'))
+    return len(parts)
+
+
+# Разрезы сводки по базе (панель "Статистика" и команда stats)
+STATS_GROUPS = ["Объект", "Дом", "Сделка"]
+
+
+def sorted_median(values):
+    # Медиана уже отсортированного списка (None для пустого)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+class PortfolioStats:
+    # Сводка по базе в разрезах STATS_GROUPS: число объектов, медианная цена,
+    # медианная цена за м² и средний возраст объявления. Первый раз считается через groupby,
+    # дальше обновляется по записям об изменениях: у каждой группы отсортированные
+    # списки цен (для медиан) и сумма дат занесения, поэтому правка одной строки
+    # меняет только ее группы
+
+    def __init__(self):
+        self.total = None
+        self.groups = {}
+        self.rows = {}
+
+    @staticmethod
+    def new_group():
+        return {"count": 0, "prices": [], "per_meter": [], "date_sum": 0.0, "dated": 0}
+
+    @staticmethod
+    def row_values(df):
+        # Вклад строк в сводку: ID -> (значения разрезов, цена, цена за м², дата в днях)
+        price = parse_number(df["Цена"])
+        area = parse_number(df["Площадь"])
+        per_meter = price / area.where(area > 0)
+        days = parse_date_days(df["Дата занесения в базу"])
+        keys = zip(*[df[field].astype(object).fillna("").tolist() for field in STATS_GROUPS])
+        return dict(zip(
+            df[ID_COLUMN].tolist(),
+            zip(keys, price.tolist(), per_meter.tolist(), days.tolist())
+        ))
+
+    def build(self, df):
+        values = pd.DataFrame({
+            "price": parse_number(df["Цена"]).to_numpy(),
+            "area": parse_number(df["Площадь"]).to_numpy(),
+            "days": parse_date_days(df["Дата занесения в базу"]).to_numpy(),
+        })
+        values["per_meter"] = values["price"] / values["area"].where(values["area"] > 0)
+        for field in STATS_GROUPS:
+            values[field] = df[field].astype(object).fillna("").to_numpy()
+        
+        def summarize(frame):
+            return {
+                "count": len(frame),
+                "prices": sorted(frame["price"].dropna().tolist()),
+                "per_meter": sorted(frame["per_meter"].dropna().tolist()),
+                "date_sum": float(frame["days"].sum()),
+                "dated": int(frame["days"].notna().sum()),
+            }
+        
+        self.total = summarize(values)
+        self.groups = {
+            field: {key: summarize(frame) for key, frame in values.groupby(field, sort=False)}
+            for field in STATS_GROUPS
+        }
+        self.rows = self.row_values(df)
+
+    def update(self, row, sign):
+        # Добавляем (sign=1) или убираем (sign=-1) вклад строки
+        keys, price, per_meter, days = row
+        groups = [self.total]
+        for field, key in zip(STATS_GROUPS, keys):
+            groups.append(self.groups[field].setdefault(key, self.new_group()))
+        for group in groups:
+            group["count"] += sign
+            for name, value in (("prices", price), ("per_meter", per_meter)):
+                if value != value:
+                    continue
+                if sign > 0:
+                    bisect.insort(group[name], value)
+                else:
+                    del group[name][bisect.bisect_left(group[name], value)]
+            if days == days:
+                group["date_sum"] += sign * days
+                group["dated"] += sign
+        for field, key in zip(STATS_GROUPS, keys):
+            if not self.groups[field][key]["count"]:
+                del self.groups[field][key]
+
+    def apply(self, change, df):
+        # Обновляем сводку по записи об изменении
+        op = change["op"]
+        if op in ("add", "edit"):
+            row_id = change["id"]
+            if row_id in self.rows:
+                self.update(self.rows.pop(row_id), -1)
+            index = row_position(df, row_id)
+            for row_id, row in self.row_values(df.iloc[index:index + 1]).items():
+                self.rows[row_id] = row
+                self.update(row, 1)
+        elif op == "delete":
+            for row_id in change["ids"]:
+                if row_id in self.rows:
+                    self.update(self.rows.pop(row_id), -1)
+        else:
+            self.build(df)
+
+    def summary(self, today=None):
+        # Готовые числа: {"total": {...}, разрез: {значение: {...}}}
+        today_days = (pd.Timestamp(today or datetime.now()).normalize() - pd.Timestamp(0)).days
+        
+        def describe(group):
+            return {
+                "count": group["count"],
+                "median_price": sorted_median(group["prices"]),
+                "median_price_per_m2": sorted_median(group["per_meter"]),
+                "mean_age_days": round(today_days - group["date_sum"] / group["dated"], 1) if group["dated"] else None,
+            }
+        
+        result = {"total": describe(self.total or self.new_group())}
+        for field in STATS_GROUPS:
+            order = {name: i for i, name in enumerate(FIELDS[field].options)}
+            groups = sorted(self.groups.get(field, {}).items(), key=lambda item: (order.get(item[0], len(order)), item[0]))
+            result[field] = {key: describe(group) for key, group in groups}
+        return result
+
+
+class OperationProfiler:
+    # Время основных операций: последние PROFILE_BUFFER_SIZE записей хранятся в памяти.
+    # Запись - время начала, операция, длительность, число строк базы и записанные байты.
+    # При PROFILE_DEBUG = "log" записи дописываются в operations.log,
+    # при "cprofile" - еще и статистика cProfile копится в operations.prof (смотреть через pstats)
+
+    def __init__(self, size=PROFILE_BUFFER_SIZE, debug=PROFILE_DEBUG):
+        self.records = deque(maxlen=size)
+        self.debug = debug
+        self.output_dir = None
+        self.stats = None
+        self.lock = threading.Lock()
+        # cProfile одновременно работает только в одном потоке
+        self.cprofile_lock = threading.Lock()
+        # Счетчик записанных байт и глубина вложенных операций - свои у каждого потока
+        self.local = threading.local()
+
+    def add_bytes(self, count):
+        self.local.written = getattr(self.local, "written", 0) + count
+
+    def call(self, name, func, *args, rows=None, **kwargs):
+        # Выполняем func с замером; rows(result) - сколько строк обработано
+        outer_written = getattr(self.local, "written", 0)
+        depth = getattr(self.local, "depth", 0)
+        self.local.written = 0
+        self.local.depth = depth + 1
+        
+        profile = None
+        if self.debug == "cprofile" and depth == 0 and self.cprofile_lock.acquire(blocking=False):
+            import cProfile
+            profile = cProfile.Profile()
+        
+        result = None
+        start = time.perf_counter()
+        try:
+            if profile is not None:
+                result = profile.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            written = self.local.written
+            self.local.written = outer_written + written
+            self.local.depth = depth
+            if profile is not None:
+                self.cprofile_lock.release()
+            try:
+                row_count = rows(result) if rows is not None else None
+            except Exception:
+                row_count = None
+            self.record(name, seconds, row_count, written, profile)
+
+    def record(self, name, seconds, rows, written, profile=None):
+        record = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "operation": name,
+            "ms": round(seconds * 1000, 1),
+            "rows": rows,
+            "bytes": written,
+        }
+        with self.lock:
+            self.records.append(record)
+            if self.debug and self.output_dir is not None:
+                self.dump(record, profile)
+
+    def dump(self, record, profile):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.output_dir / "operations.log", 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if profile is not None:
+                import pstats
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+                self.stats.dump_stats(str(self.output_dir / "operations.prof"))
+        except OSError as e:
+            print(f"Не удалось записать журнал профилирования: {e}")
+
+    def last(self):
+        with self.lock:
+            return self.records[-1] if self.records else None
+
+
+PROFILER = OperationProfiler()
+
+
+def profiled(name, rows=None):
+    # Декоратор метода окна: замер через PROFILER. rows(self, result) - число строк,
+    # по умолчанию - размер базы после операции. При PROFILE_OPERATIONS = False метод не оборачивается
+    def decorate(method):
+        if not PROFILE_OPERATIONS:
+            return method
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            def count_rows(result):
+                if rows is not None:
+                    return rows(self, result)
+                return len(self.df) if self.df is not None else None
+            return PROFILER.call(name, method, self, *args, rows=count_rows, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Папка базы по умолчанию и имена файлов в ней
+DATABASE_NAME = "real_estate_database.csv"
+EXPORT_NAME = "real_estate_export.xlsx"
+
+
+def documents_directory():
+    return Path.home() / "Documents"
+
+
+# Архив: старые и снятые с продажи объекты лежат не в базе, а в папке real_estate_archive
+# рядом с ней - по файлу CSV, сжатому gzip, на каждый месяц даты занесения.
+# index.json - какой объект в каком файле и наибольший ID в архиве.
+# ARCHIVE_AGE_DAYS - возраст объекта по умолчанию для переноса в архив по дате
+ARCHIVE_DIR_NAME = "real_estate_archive"
+ARCHIVE_AGE_DAYS = 365
+
+
+class ListingArchive:
+    # Архив объектов. Файлы месяцев читаются только при поиске по архиву
+    # или восстановлении объекта и запоминаются до изменения файла;
+    # восстановление читает и переписывает только файл своего месяца
+
+    def __init__(self, base_path):
+        self.dir = Path(base_path).parent / ARCHIVE_DIR_NAME
+        self.index_path = self.dir / "index.json"
+        self.frames = {}
+        self.all_stamp = None
+        self.all_frame = None
+        self.search_text = None
+
+    def lock(self):
+        return FileLock(self.dir / "archive.lock")
+
+    def read_index(self):
+        try:
+            index = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {"max_id": 0, "ids": {}}
+        return index
+
+    def write_index(self, index):
+        write_file_atomic(self.index_path, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+
+    def max_id(self):
+        # Наибольший ID в архиве: новые объекты базы не должны получать ID архивных
+        if not self.index_path.exists():
+            return 0
+        return int(self.read_index()["max_id"])
+
+    def count(self):
+        return len(self.read_index()["ids"])
+
+    def partition_path(self, name):
+        return self.dir / f"{name}.csv.gz"
+
+    def partitions(self):
+        return sorted(path.name[:-len(".csv.gz")] for path in self.dir.glob("*.csv.gz"))
+
+    def read_partition(self, name):
+        path = self.partition_path(name)
+        stamp = file_stamp(path)
+        cached = self.frames.get(name)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        if not path.exists():
+            df = empty_frame()
+        else:
+            df = parse_csv_bytes(gzip.decompress(path.read_bytes()))
+        self.frames[name] = (stamp, df)
+        return df
+
+    def write_partition(self, name, df):
+        path = self.partition_path(name)
+        if len(df):
+            write_file_atomic(path, gzip.compress(csv_bytes(frame_for_csv(df)), compresslevel=6))
+            self.frames[name] = (file_stamp(path), df)
+        else:
+            path.unlink(missing_ok=True)
+            self.frames.pop(name, None)
+
+    @staticmethod
+    def partition_names(df):
+        # Месяц даты занесения: "2023-05"; объекты без даты - "undated"
+        dates = pd.to_datetime(df["Дата занесения в базу"], errors='coerce')
+        return dates.dt.strftime('%Y-%m').fillna("undated")
+
+    def add(self, rows):
+        # Дописываем строки базы в файлы их месяцев (в фоновом потоке)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with self.lock():
+            index = self.read_index()
+            for name, part in rows.groupby(self.partition_names(rows).to_numpy(), sort=False):
+                if self.partition_path(name).exists():
+                    archived = self.read_partition(name)
+                    # Строки, уже попавшие в архив (перенос прервался до удаления из базы), заменяем
+                    archived = archived[~archived[ID_COLUMN].isin(part[ID_COLUMN])]
+                    part = append_rows(archived.reset_index(drop=True), part)
+                self.write_partition(name, part.reset_index(drop=True))
+                for row_id in part[ID_COLUMN].tolist():
+                    index["ids"][str(row_id)] = name
+            if len(rows):
+                index["max_id"] = max(int(index["max_id"]), int(rows[ID_COLUMN].max()))
+            self.write_index(index)
+
+    def load_all(self):
+        # Весь архив одним DataFrame. Файлы склеиваются в один CSV и разбираются
+        # за один раз: разбор по файлам тратил бы время на типы столбцов каждого
+        paths = [self.partition_path(name) for name in self.partitions()]
+        stamp = file_stamp(*paths)
+        if self.all_frame is not None and self.all_stamp == stamp:
+            return self.all_frame
+        chunks = []
+        for path in paths:
+            data = gzip.decompress(path.read_bytes())
+            chunks.append(data if not chunks else data[data.index(b"\n") + 1:])
+        self.all_frame = parse_csv_bytes(b"".join(chunks)) if chunks else empty_frame()
+        self.all_stamp = stamp
+        self.search_text = None
+        return self.all_frame
+
+    def search(self, query):
+        # Объекты архива по запросу (те же правила, что и у поиска по базе);
+        # пустой запрос - весь архив. Поиск по архиву редкий, поэтому вместо индекса -
+        # проход по тексту полей поиска, который готовится один раз после чтения архива
+        df = self.load_all()
+        fragments = search_fragments(query)
+        if not fragments or not len(df):
+            return df
+        if self.search_text is None:
+            self.search_text = search_text_column(df)
+        found = np.ones(len(df), dtype=bool)
+        for fragment in fragments:
+            found &= self.search_text.str.contains(fragment, regex=False).to_numpy(dtype=bool)
+        return df[found]
+
+    def row(self, row_id):
+        # Строка архива (DataFrame из одной строки); читается только файл ее месяца
+        name = self.read_index()["ids"].get(str(int(row_id)))
+        if name is None:
+            raise KeyError(f"объекта с ID {row_id} нет в архиве")
+        df = self.read_partition(name)
+        return df[df[ID_COLUMN] == int(row_id)].reset_index(drop=True)
+
+    def remove(self, row_id):
+        # Убираем восстановленный объект из архива
+        with self.lock():
+            index = self.read_index()
+            name = index["ids"].pop(str(int(row_id)), None)
+            if name is None:
+                return
+            df = self.read_partition(name)
+            self.write_partition(name, df[df[ID_COLUMN] != int(row_id)].reset_index(drop=True))
+            self.write_index(index)
+
+
+class ListingStore:
+    # База объектов без окна: хранилище (STORAGE_MODE), изменения, импорт, выгрузка.
+    # Ей пользуются и RealEstateApp, и командная строка (run_cli); Tk не нужен.
+    # Методы add/edit/delete/add_rows меняют df и возвращают запись об изменении,
+    # которую затем сохраняет commit() (окно вызывает его в фоновом потоке).
+    # Изменения других копий программы с той же базой приходят из commit() и pull()
+    # в виде RemoteChanges и применяются к df методом merge().
+    # lazy_fields - поля, которые load() не читает (см. LAZY_TEXT_FIELDS): их дочитывают
+    # read_fields() в фоне и install_fields() в главном потоке или load_fields() сразу
+
+    def __init__(self, path=None, lazy_fields=()):
+        import_data_libraries()
+        self.path = Path(path) if path is not None else documents_directory() / DATABASE_NAME
+        self.storage = create_storage(self.path)
+        self.archive = ListingArchive(self.path)
+        self.df = None
+        self.next_id = 1
+        # Версия базы, которой соответствует df (для проверки одновременных правок)
+        self.version = None
+        self.lazy_fields = list(lazy_fields)
+        # Значения не загруженных полей из изменений после загрузки: ID -> {поле: значение}.
+        # В df их некуда записать, а в прочитанной базе их может еще не быть
+        self.lazy_values = {}
+
+    @property
+    def missing(self):
+        # Поля из lazy_fields, которых пока нет в df
+        if self.df is None:
+            return []
+        return [field for field in self.lazy_fields if field not in self.df.columns]
+
+    def load(self):
+        self.storage.skip = list(self.lazy_fields)
+        self.lazy_values = {}
+        self.df = self.storage.load()
+        self.version = self.storage.version()
+        # ID для следующего нового объекта (ID архивных объектов не занимаем)
+        self.next_id = max(next_row_id(self.df), self.archive.max_id() + 1)
+        return self.df
+
+    def read_fields(self, ids=None):
+        # Не загруженные поля из хранилища (в фоновом потоке): для ids или для всех объектов.
+        # После полного чтения хранилище читает базу целиком - df вот-вот получит эти столбцы
+        frame = self.storage.read_fields(self.missing, ids)
+        if ids is None:
+            self.storage.skip = []
+        return frame
+
+    def install_fields(self, frame):
+        # Ставим в df прочитанные read_fields() столбцы (строки сопоставляются по ID),
+        # поверх них - значения из изменений после загрузки
+        frame = frame.drop_duplicates(ID_COLUMN).set_index(ID_COLUMN)
+        ids = self.df[ID_COLUMN]
+        for field in self.missing:
+            values = frame[field].reindex(ids.to_numpy()) if field in frame.columns \
+                else pd.Series(None, index=ids.to_numpy(), dtype=object)
+            values.index = self.df.index
+            changed = {row_id: row[field] for row_id, row in self.lazy_values.items() if field in row}
+            if changed:
+                dtype = values.dtype
+                mask = ids.isin(list(changed)).to_numpy()
+                values = values.astype(object)
+                values[mask] = ids[mask].map(changed).to_numpy()
+                values = values.astype(dtype)
+            # Столбец встает на свое место по схеме
+            after = COLUMNS[COLUMNS.index(field) + 1:]
+            position = next((i for i, name in enumerate(self.df.columns) if name in after), len(self.df.columns))
+            self.df.insert(position, field, values)
+        self.lazy_values = {}
+
+    def load_fields(self):
+        # Дочитываем не загруженные поля сразу (командная строка, закрытие окна)
+        if self.missing:
+            self.install_fields(self.read_fields())
+
+    def lazy_row(self, row_id, frame):
+        # Значения не загруженных полей объекта: из frame (read_fields([row_id])) и изменений
+        values = {field: None for field in self.missing}
+        rows = frame[frame[ID_COLUMN] == row_id]
+        for field in values:
+            if len(rows) and field in rows.columns:
+                values[field] = rows[field].iloc[0]
+        values.update({
+            field: value for field, value in self.lazy_values.get(row_id, {}).items() if field in values
+        })
+        return values
+
+    def keep_lazy_values(self, row_id, row):
+        # Значения не загруженных полей строки (dict) откладываем в lazy_values;
+        # возвращаем значения остальных полей - их можно записать в df
+        missing = self.missing
+        lazy = {field: row[field] for field in missing if field in row}
+        if lazy:
+            self.lazy_values.setdefault(int(row_id), {}).update(lazy)
+        return {field: value for field, value in row.items() if field not in missing}
+
+    def without_lazy_fields(self, record):
+        # Запись об изменении для df без не загруженных полей (их значения - в lazy_values)
+        if not self.missing:
+            return record
+        op = record["op"]
+        if op == "delete":
+            for row_id in record["ids"]:
+                self.lazy_values.pop(row_id, None)
+            return record
+        if op == "add_batch":
+            return dict(record, rows=[self.keep_lazy_values(row[ID_COLUMN], row) for row in record["rows"]])
+        if op in ("add", "edit"):
+            return dict(record, row=self.keep_lazy_values(record["id"], record["row"]))
+        return record
+
+    def add(self, row):
+        # row - значения полей после normalize_listings
+        row_id = self.next_id
+        self.next_id += 1
+        added = {ID_COLUMN: row_id, **self.keep_lazy_values(row_id, row)}
+        self.df = append_rows(self.df, pd.DataFrame([added]))
+        return {
+            "op": "add",
+            "id": row_id,
+            "row": {field: to_journal_value(value) for field, value in row.items()}
+        }
+
+    def edit(self, row_id, row):
+        set_cells(self.df, row_position(self.df, row_id), self.keep_lazy_values(row_id, row))
+        return {
+            "op": "edit",
+            "id": int(row_id),
+            "row": {field: to_journal_value(value) for field, value in row.items()}
+        }
+
+    def delete(self, ids):
+        # Одно удаление по маске для всех объектов
+        change = {"op": "delete", "ids": [int(row_id) for row_id in ids]}
+        self.df = apply_change(self.df, self.without_lazy_fields(change))
+        return change
+
+    def add_rows(self, rows):
+        # Пакет строк после normalize_listings (импорт) - одна запись об изменении
+        rows = rows.reset_index(drop=True)
+        rows.insert(0, ID_COLUMN, range(self.next_id, self.next_id + len(rows)))
+        self.next_id += len(rows)
+        change = {
+            "op": "add_batch",
+            "rows": frame_for_csv(rows).fillna("").astype(str).to_dict('records')
+        }
+        for row in change["rows"]:
+            row[ID_COLUMN] = int(row[ID_COLUMN])
+        lazy = [field for field in self.missing if field in rows.columns]
+        if lazy:
+            for row in rows[[ID_COLUMN] + lazy].to_dict('records'):
+                self.keep_lazy_values(row.pop(ID_COLUMN), row)
+            rows = rows.drop(columns=lazy)
+        self.df = append_rows(self.df, rows)
+        return change
+
+    def archive_rows(self, ids):
+        # Копия строк для переноса в архив; сам перенос - archive.add(), затем delete()
+        self.load_fields()
+        return self.df[self.df[ID_COLUMN].isin([int(row_id) for row_id in ids])].copy()
+
+    def stale_ids(self, days=ARCHIVE_AGE_DAYS, today=None):
+        # ID объектов, занесенных больше days дней назад
+        dates = pd.to_datetime(self.df["Дата занесения в базу"], errors='coerce')
+        limit = pd.Timestamp(today or datetime.now()).normalize() - pd.Timedelta(days=days)
+        return self.df.loc[dates < limit, ID_COLUMN].tolist()
+
+    def restore_row(self, row):
+        # Возвращаем строку архива в базу под прежним ID (если его не занял другой объект,
+        # иначе под новым - тогда и папка фотографий переносится под новый ID)
+        row = row.iloc[0].to_dict()
+        row_id = int(row.pop(ID_COLUMN))
+        if (self.df[ID_COLUMN].to_numpy() == row_id).any():
+            move_listing_photos(self.path, row_id, self.next_id)
+            row_id = self.next_id
+        self.next_id = max(self.next_id, row_id + 1)
+        added = {ID_COLUMN: row_id, **self.keep_lazy_values(row_id, row)}
+        self.df = append_rows(self.df, pd.DataFrame([added]))
+        return {
+            "op": "add",
+            "id": row_id,
+            "row": {field: to_journal_value(value) for field, value in row.items()}
+        }
+
+    def move_to_archive(self, ids):
+        # Перенос в архив без окна: сначала запись в архив, потом удаление из базы
+        rows = self.archive_rows(ids)
+        if not len(rows):
+            return 0
+        self.archive.add(rows)
+        change = self.delete(rows[ID_COLUMN].tolist())
+        self.merge(self.commit(change, self.snapshot(change)))
+        return len(rows)
+
+    def restore(self, row_id):
+        # Восстановление одного объекта из архива; возвращаем его ID в базе
+        change = self.restore_row(self.archive.row(row_id))
+        changes = self.commit(change, self.snapshot(change))
+        self.merge(changes)
+        self.archive.remove(row_id)
+        return changes.renamed.get(change["id"], change["id"])
+
+    def snapshot(self, change):
+        # Вызывается сразу после изменения df (в главном потоке окна).
+        # Пока не все столбцы загружены, полного снимка базы нет
+        return self.version, self.storage.snapshot(change, None if self.missing else self.df)
+
+    def commit(self, change, snapshot):
+        # Запись изменения в хранилище; snapshot - результат snapshot(change).
+        # Возвращает RemoteChanges - их нужно передать в merge()
+        version, data = snapshot
+        return self.storage.commit(change, data, version)
+
+    def pull(self):
+        # Изменения других копий программы (вызывается в фоновом потоке)
+        return self.storage.pull()
+
+    def merge(self, changes):
+        # Применяем RemoteChanges к df; возвращаем примененные записи об изменениях
+        if changes.renamed:
+            # Наши новые объекты получили другие ID (первая строка с таким ID - наша),
+            # вместе с ID переносятся и папки их фотографий
+            ids = self.df[ID_COLUMN].to_numpy().copy()
+            for old, new in changes.renamed.items():
+                positions = (ids == old).nonzero()[0]
+                if len(positions):
+                    ids[positions[0]] = new
+                if old in self.lazy_values:
+                    self.lazy_values[new] = self.lazy_values.pop(old)
+                move_listing_photos(self.path, old, new)
+            self.df[ID_COLUMN] = ids
+        records = changes.records if changes.frame is None else diff_records(self.df, changes.frame)
+        # Правку объекта, который мы уже удалили (удаление еще записывается), пропускаем
+        records = [
+            record for record in records
+            if record["op"] != "edit" or (self.df[ID_COLUMN].to_numpy() == record["id"]).any()
+        ]
+        for record in records:
+            self.df = apply_change(self.df, self.without_lazy_fields(record))
+        if changes.version is not None:
+            self.version = changes.version
+        self.next_id = max(self.next_id, next_row_id(self.df))
+        return records
+
+    def save(self, df=None, version=None):
+        # Полная запись базы; в режиме журнала - сжатие журнала в CSV
+        if df is None:
+            self.load_fields()
+            df, version = self.df, self.version
+        self.storage.save(df, version)
+
+    def close(self):
+        self.storage.close(self.df, self.version)
+
+    @profiled("import_listings")
+    def import_file(self, path, report_path=None):
+        # Импорт файла партнера с сохранением в базу.
+        # Возвращаем (импортировано, строк с ошибками, пропущенные столбцы, файл отчета)
+        if report_path is None:
+            report_path = self.path.parent / IMPORT_REPORT_NAME
+        rows, error_count, skipped, report_file = read_import_file(path, report_path)
+        if len(rows):
+            change = self.add_rows(rows)
+            self.merge(self.commit(change, self.snapshot(change)))
+        return len(rows), error_count, skipped, report_file
+
+    @profiled("export_to_excel")
+    def export(self, path=None):
+        path = Path(path) if path is not None else self.path.parent / EXPORT_NAME
+        self.load_fields()
+        write_excel_export(export_frame(self.df), path)
+        return path
+
+    def find_duplicates(self, report_path=None):
+        # Отчет о дубликатах; возвращаем число групп и путь к отчету
+        if report_path is None:
+            report_path = self.path.parent / DUPLICATES_REPORT_NAME
+        return write_duplicates_report(self.df, report_path), Path(report_path)
+
+    def stats(self, today=None):
+        # Сводка по базе: число объектов, даты, медианные цены и возраст объявлений,
+        # то же в разрезах STATS_GROUPS (как на панели "Статистика")
+        portfolio = PortfolioStats()
+        portfolio.build(self.df)
+        summary = portfolio.summary(today)
+        dates = self.df["Дата занесения в базу"]
+        return {
+            "path": str(self.storage_path()),
+            "rows": int(len(self.df)),
+            "first_date": to_journal_value(dates.min()) or None,
+            "last_date": to_journal_value(dates.max()) or None,
+            **{name: value for name, value in summary["total"].items() if name != "count"},
+            "groups": {field: summary[field] for field in STATS_GROUPS},
+        }
+
+    def storage_path(self):
+        return getattr(self.storage, "path", self.path)
+
+
+def price_text(value):
+    return f"{value:,.0f}".replace(",", " ") if value is not None else "-"
+
+
+def age_text(value):
+    return f"{value:.0f} дн." if value is not None else "-"
+
+
+def format_stats(stats):
+    lines = [
+        f"База: {stats['path']}",
+        f"Объектов: {stats['rows']}",
+        f"Даты занесения: {stats['first_date'] or '-'} - {stats['last_date'] or '-'}",
+        f"Медианная цена: {price_text(stats['median_price'])}, за м²: {price_text(stats['median_price_per_m2'])}",
+        f"Средний возраст объявления: {age_text(stats['mean_age_days'])}",
+    ]
+    for field, groups in stats["groups"].items():
+        lines.append(f"{field}:")
+        for name, item in groups.items():
+            lines.append(
+                f"    {name or '(не указан)'}: {item['count']}, медианная цена {price_text(item['median_price'])}, "
+                f"за м² {price_text(item['median_price_per_m2'])}, возраст {age_text(item['mean_age_days'])}"
+            )
+    return "\n".join(lines)
+
+
+def run_cli(argv):
+    # Команды без окна: python real_estate_store.py <команда> [параметры]
+    # (или real_estate_app_11.py с командой - тогда окно не открывается).
+    # Код возврата 0 - успех, 1 - ошибка (или строки импорта, которые не удалось разобрать)
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="База объектов недвижимости без окна. real_estate_app_11.py без команды запускает окно программы."
+    )
+    parser.add_argument("--db", help=f"файл базы (по умолчанию Documents/{DATABASE_NAME})")
+    parser.add_argument("--storage", choices=["journal", "csv", "sqlite"],
+                        help="режим хранения (по умолчанию STORAGE_MODE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = commands.add_parser("export", help="выгрузка базы в Excel")
+    export_parser.add_argument("output", nargs="?", help=f"файл выгрузки (по умолчанию {EXPORT_NAME} рядом с базой)")
+    
+    import_parser = commands.add_parser("import", help="импорт объектов из CSV/XLSX")
+    import_parser.add_argument("file", help="файл партнера")
+    import_parser.add_argument("--report", help=f"отчет об ошибках (по умолчанию {IMPORT_REPORT_NAME} рядом с базой)")
+    
+    stats_parser = commands.add_parser("stats", help="сводка по базе (как панель \"Статистика\")")
+    stats_parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    
+    commands.add_parser("compact", help="сжатие журнала изменений в CSV (перезапись базы)")
+    
+    duplicates_parser = commands.add_parser("duplicates", help="отчет о дубликатах")
+    duplicates_parser.add_argument("--report", help=f"файл отчета (по умолчанию {DUPLICATES_REPORT_NAME} рядом с базой)")
+    
+    archive_parser = commands.add_parser("archive", help="перенос старых объектов в архив")
+    archive_parser.add_argument("--older-than", type=int, default=ARCHIVE_AGE_DAYS,
+                                help=f"возраст объектов в днях (по умолчанию {ARCHIVE_AGE_DAYS})")
+    archive_parser.add_argument("--ids", type=int, nargs="+", help="перенести эти объекты (вместо отбора по возрасту)")
+    
+    restore_parser = commands.add_parser("restore", help="восстановление объекта из архива")
+    restore_parser.add_argument("id", type=int, help="ID объекта")
+    
+    args = parser.parse_args(argv)
+    
+    global STORAGE_MODE
+    if args.storage:
+        STORAGE_MODE = args.storage
+    
+    try:
+        store = ListingStore(args.db)
+        # Замеры команд - как у окна (REAL_ESTATE_PROFILE), в папке кэша рядом с базой
+        PROFILER.output_dir = store.path.parent / "real_estate_cache"
+        PROFILER.call("load_data", store.load, rows=len)
+        try:
+            if args.command == "export":
+                path = store.export(args.output)
+                print(f"Выгружено объектов: {len(store.df)} -> {path}")
+            elif args.command == "import":
+                count, error_count, skipped, report_file = store.import_file(args.file, args.report)
+                print(f"Импортировано объектов: {count}")
+                if error_count:
+                    print(f"Строк с ошибками (не импортированы): {error_count}")
+                if skipped:
+                    print("Пропущены столбцы: " + ", ".join(skipped))
+                if report_file is not None:
+                    print(f"Отчет: {report_file}")
+                if error_count:
+                    return 1
+            elif args.command == "stats":
+                stats = store.stats()
+                print(json.dumps(stats, ensure_ascii=False, indent=2) if args.json else format_stats(stats))
+            elif args.command == "compact":
+                PROFILER.call("save_data", store.save, rows=lambda result: len(store.df))
+                print(f"База переписана: {len(store.df)} объектов")
+            elif args.command == "duplicates":
+                groups, path = store.find_duplicates(args.report)
+                print(f"Найдено групп дубликатов: {groups}\nОтчет: {path}")
+            elif args.command == "archive":
+                ids = args.ids if args.ids else store.stale_ids(args.older_than)
+                count = PROFILER.call("archive_listings", store.move_to_archive, ids)
+                print(f"Перенесено в архив: {count}, в архиве всего: {store.archive.count()}")
+            elif args.command == "restore":
+                row_id = store.restore(args.id)
+                print(f"Объект восстановлен из архива, ID {row_id}")
+        finally:
+            store.close()
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+def listing_photo_dir(base_path, row_id):
+    return Path(base_path).parent / PHOTOS_DIR_NAME / str(int(row_id))
+
+
+def listing_photos(base_path, row_id):
+    # Фотографии объекта в порядке имен файлов
+    try:
+        return sorted(
+            path for path in listing_photo_dir(base_path, row_id).iterdir()
+            if path.suffix.lower() in PHOTO_EXTENSIONS
+        )
+    except OSError:
+        return []
+
+
+def add_listing_photos(base_path, row_id, files):
+    # Копируем фотографии в папку объекта; файлы с одинаковыми именами получают номер
+    import shutil
+    folder = listing_photo_dir(base_path, row_id)
+    folder.mkdir(parents=True, exist_ok=True)
+    added = []
+    for file in files:
+        file = Path(file)
+        target = folder / file.name
+        number = 1
+        while target.exists():
+            target = folder / f"{file.stem}_{number}{file.suffix}"
+            number += 1
+        shutil.copy2(file, target)
+        added.append(target)
+    return added
+
+
+def remove_listing_photos(base_path, row_ids):
+    import shutil
+    for row_id in row_ids:
+        shutil.rmtree(listing_photo_dir(base_path, row_id), ignore_errors=True)
+
+
+def move_listing_photos(base_path, old_id, new_id):
+    # Фотографии объекта, получившего другой ID. Если папка с новым ID уже есть,
+    # фотографии добавляются в нее (с номером при совпадении имен)
+    import shutil
+    source = listing_photo_dir(base_path, old_id)
+    target = listing_photo_dir(base_path, new_id)
+    try:
+        if not source.is_dir():
+            return
+        if not target.exists():
+            os.replace(source, target)
+            return
+        add_listing_photos(base_path, new_id, [path for path in sorted(source.iterdir()) if path.is_file()])
+        shutil.rmtree(source, ignore_errors=True)
+    except OSError as e:
+        print(f"Не удалось перенести фотографии объекта {old_id} в папку {target}: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Модули программы лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import real_estate_store as store_module
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    # Documents и папка кэша - во временной домашней папке
+    home = tmp_path / "home"
+    (home / "Documents").mkdir(parents=True)
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("USERPROFILE", str(home))
+    return home
+
+
+@pytest.fixture
+def base_path(home):
+    return home / "Documents" / store_module.DATABASE_NAME
+
+
+def listing(address, **values):
+    # Строка базы, как ее получает ListingStore.add из формы
+    store_module.import_data_libraries()
+    rows, errors = store_module.normalize_listings(
+        store_module.pd.DataFrame([{"Объект": "дом", "Адрес": address, **values}])
+    )
+    assert errors == [[]]
+    return rows.iloc[0].to_dict()
+
+
+def open_store(path, mode, monkeypatch):
+    monkeypatch.setattr(store_module, "STORAGE_MODE", mode)
+    store = store_module.ListingStore(path)
+    store.load()
+    return store
+
+
+def save(store, change):
+    # Как окно: снимок сразу после изменения, запись, изменения других копий - в df
+    changes = store.commit(change, store.snapshot(change))
+    store.merge(changes)
+    return changes
@@ -0,0 +1,148 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import real_estate_store as store_module
+from conftest import listing, open_store, save
+from real_estate_store import ID_COLUMN, add_listing_photos, listing_photos
+
+MODES = ["csv", "journal", "sqlite"]
+
+
+def addresses(store):
+    return dict(zip(store.df[ID_COLUMN].tolist(), store.df["Адрес"].tolist()))
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_changes_survive_reopen(base_path, mode, monkeypatch):
+    store = open_store(base_path, mode, monkeypatch)
+    for address in ("Ленина 1", "Мира 2", "Садовая 3"):
+        save(store, store.add(listing(address)))
+    save(store, store.edit(2, listing("Мира 20")))
+    save(store, store.delete([1]))
+    store.close()
+
+    store = open_store(base_path, mode, monkeypatch)
+    assert addresses(store) == {2: "Мира 20", 3: "Садовая 3"}
+    assert store.next_id == 4
+    store.close()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_new_listing_with_taken_id_is_renumbered(base_path, mode, monkeypatch):
+    first = open_store(base_path, mode, monkeypatch)
+    second = open_store(base_path, mode, monkeypatch)
+    save(first, first.add(listing("Ленина 1")))
+
+    change = second.add(listing("Мира 2"))
+    changes = save(second, change)
+    assert changes.renamed == {1: 2}
+    assert addresses(second)[2] == "Мира 2"
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_renumbered_listing_keeps_photos(base_path, mode, monkeypatch, tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"jpeg")
+    first = open_store(base_path, mode, monkeypatch)
+    second = open_store(base_path, mode, monkeypatch)
+    save(first, first.add(listing("Ленина 1")))
+
+    change = second.add(listing("Мира 2"))
+    add_listing_photos(base_path, change["id"], [photo])
+    save(second, change)
+    assert listing_photos(base_path, 1) == []
+    assert [path.name for path in listing_photos(base_path, 2)] == ["photo.jpg"]
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_archive_and_restore(base_path, mode, monkeypatch):
+    store = open_store(base_path, mode, monkeypatch)
+    save(store, store.add(listing("Ленина 1", **{"Дата занесения в базу": "01.02.2020"})))
+    save(store, store.add(listing("Мира 2")))
+    assert store.stale_ids(365) == [1]
+    assert store.move_to_archive([1]) == 1
+    assert store.archive.count() == 1
+    assert 1 not in addresses(store)
+
+    assert store.restore(1) == 1
+    assert addresses(store) == {1: "Ленина 1", 2: "Мира 2"}
+    assert store.archive.count() == 0
+    store.close()
+
+
+def test_restore_with_taken_id_moves_photos(base_path, monkeypatch, tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"jpeg")
+    store = open_store(base_path, "csv", monkeypatch)
+    other = open_store(base_path, "csv", monkeypatch)
+    save(store, store.add(listing("Ленина 1")))
+    save(store, store.add(listing("Мира 2")))
+    add_listing_photos(base_path, 2, [photo])
+    store.move_to_archive([2])
+
+    # Другая копия программы не видела объект 2 и отдает его ID новому объекту
+    save(other, other.add(listing("Садовая 3")))
+    assert addresses(other)[2] == "Садовая 3"
+    store.merge(store.pull())
+
+    restored_id = store.restore(2)
+    assert restored_id == 3
+    assert addresses(store) == {1: "Ленина 1", 2: "Садовая 3", 3: "Мира 2"}
+    assert listing_photos(base_path, 2) == []
+    assert [path.name for path in listing_photos(base_path, 3)] == ["photo.jpg"]
+    store.close()
+    other.close()
+
+
+def test_import_file_reports_bad_rows(base_path, monkeypatch, tmp_path):
+    source = tmp_path / "partner.csv"
+    source.write_text(
+        "Объект;Адрес;Цена\nдом;Ленина 1;1000000\nдом;Мира 2;дорого\n", encoding="utf-8"
+    )
+    store = open_store(base_path, "csv", monkeypatch)
+    count, error_count, skipped, report_file = store.import_file(source)
+    assert (count, error_count, skipped) == (1, 1, [])
+    assert report_file is not None and Path(report_file).exists()
+    assert addresses(store) == {1: "Ленина 1"}
+    store.close()
+
+
+def test_duplicates_and_stats(base_path, monkeypatch):
+    store = open_store(base_path, "csv", monkeypatch)
+    save(store, store.add(listing("ул. Ленина, д. 5", Телефон="+7 (911) 000-00-00", Цена="1000000")))
+    save(store, store.add(listing("Ленина 5", Телефон="8 911 000 00 00", Цена="3000000")))
+    save(store, store.add(listing("Мира 1", Цена="2000000")))
+    groups, report = store.find_duplicates()
+    # Одна группа по адресу, одна по телефону
+    assert groups == 2
+    assert report.exists()
+
+    stats = store.stats()
+    assert stats["rows"] == 3
+    assert stats["median_price"] == 2000000
+    store.close()
+
+
+def test_cli_runs_without_tkinter(base_path, monkeypatch):
+    store = open_store(base_path, "csv", monkeypatch)
+    save(store, store.add(listing("Ленина 1")))
+    store.close()
+
+    script = (
+        "import sys, real_estate_store\n"
+        "code = real_estate_store.run_cli(sys.argv[1:])\n"
+        "sys.exit(code or 'tkinter' in sys.modules)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, "--db", str(base_path), "stats", "--json"],
+        cwd=Path(store_module.__file__).parent, capture_output=True, text=True, encoding="utf-8"
+    )
+    assert result.returncode == 0, result.stderr
+    assert '"rows": 1' in result.stdout
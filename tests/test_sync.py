@@ -0,0 +1,102 @@
+import multiprocessing
+
+import pytest
+
+import real_estate_store as store_module
+from conftest import listing, open_store, save
+from real_estate_store import ID_COLUMN
+
+MODES = ["csv", "journal", "sqlite"]
+LISTINGS_PER_WORKER = 20
+TIMEOUT = 60
+
+
+def load_store(path, mode):
+    store_module.STORAGE_MODE = mode
+    store = store_module.ListingStore(path)
+    store.load()
+    return store
+
+
+def add_listings(barrier, results, path, mode, prefix):
+    # Копия программы: добавляет объекты по одному, как кнопка "Добавить"
+    # Возвращаем ID своих объектов, как их видит эта копия (с учетом перенумерации)
+    store = load_store(path, mode)
+    barrier.wait(TIMEOUT)
+    for number in range(LISTINGS_PER_WORKER):
+        save(store, store.add(listing(f"{prefix} {number}")))
+    store.close()
+    own = store.df["Адрес"].str.startswith(prefix)
+    results.put(store.df.loc[own, ID_COLUMN].tolist())
+
+
+def edit_listing(barrier, results, path, address, turn, done):
+    # Копия программы правит объект 1; turn - дождаться правки другой копии.
+    # Окна закрываются (журнал сжимается), когда обе правки записаны
+    store = load_store(path, "journal")
+    barrier.wait(TIMEOUT)
+    if turn is not None:
+        turn.wait(TIMEOUT)
+    changes = save(store, store.edit(1, listing(address)))
+    if done is not None:
+        done.set()
+    barrier.wait(TIMEOUT)
+    store.close()
+    results.put((address, changes.conflict))
+
+
+def run_workers(target, args_list):
+    # Процессы запускаются заново (spawn), как отдельные копии программы
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(len(args_list))
+    results = context.Queue()
+    workers = [
+        context.Process(target=target, args=(barrier, results, *args))
+        for args in args_list
+    ]
+    for worker in workers:
+        worker.start()
+    collected = [results.get(timeout=TIMEOUT) for _ in workers]
+    for worker in workers:
+        worker.join(TIMEOUT)
+        assert worker.exitcode == 0
+    return collected
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_two_copies_add_listings(base_path, mode, monkeypatch):
+    store = open_store(base_path, mode, monkeypatch)
+    save(store, store.add(listing("Ленина 1")))
+    store.close()
+
+    own_ids = run_workers(add_listings, [(base_path, mode, "Мира"), (base_path, mode, "Садовая")])
+
+    store = open_store(base_path, mode, monkeypatch)
+    ids = store.df[ID_COLUMN].tolist()
+    assert len(store.df) == 1 + 2 * LISTINGS_PER_WORKER
+    assert len(set(ids)) == len(ids)
+    assert set(store.df["Адрес"]) == {"Ленина 1"} | {
+        f"{prefix} {number}" for prefix in ("Мира", "Садовая") for number in range(LISTINGS_PER_WORKER)
+    }
+    # Совпавшие ID новых объектов получили следующие свободные, и обе копии это видят
+    assert sorted([1] + own_ids[0] + own_ids[1]) == sorted(ids)
+    store.close()
+
+
+def test_conflicting_edit_is_reported(base_path, monkeypatch):
+    store = open_store(base_path, "journal", monkeypatch)
+    save(store, store.add(listing("Ленина 1")))
+    store.close()
+
+    context = multiprocessing.get_context("spawn")
+    first_done = context.Event()
+    results = dict(run_workers(edit_listing, [
+        (base_path, "Правка первой копии", None, first_done),
+        (base_path, "Правка второй копии", first_done, None),
+    ]))
+    assert results["Правка первой копии"] is None
+    assert results["Правка второй копии"] == 1
+
+    store = open_store(base_path, "journal", monkeypatch)
+    assert store.df["Адрес"].tolist() == ["Правка первой копии"]
+    store.close()